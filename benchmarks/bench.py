@@ -0,0 +1,391 @@
+"""Benchmarks for francis on synthetic accounts
+
+Run with::
+
+    $ python -m benchmarks.bench
+    $ python -m benchmarks.bench --sizes=1000,10000 --output=before.json
+    $ python -m benchmarks.bench --compare=before.json
+
+Each benchmark is timed several times and the best time is reported, which
+is the least noisy number to compare across commits.
+
+"""
+import argparse
+import atexit
+import datetime
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from click.testing import CliRunner
+
+from benchmarks.fixtures import (
+    FakeCompleted,
+    build_api,
+    build_completed,
+    build_state,
+    build_store_api,
+)
+from francis import cmdline, util
+from francis.cache import SyncCache
+from francis.index import IdSuffixIndex
+from francis.query import DueDateIndex
+from francis.search import SearchIndex
+from francis.store import ItemStore
+from francis.util import parse_date, prettytable
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 5
+
+# Number of lookups per run for the lookup benchmarks
+LOOKUPS = 1000
+
+DATE_INPUTS = [
+    'today', 'tomorrow', 'friday', 'july 22', '2016-07-22', '7/22/2016', 'Jul 22 2016',
+]
+
+TASKWARRIOR_INPUTS = ['eom', 'sow', 'eoww', '+3d', 'eom-1w', '22nd', 'easter']
+
+SEARCH_QUERIES = ['valve', 'va', 'b', 'fix bug', 'project 7', 'deploy serv', 'nothing']
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    # Python 2
+    timer = time.time
+
+
+def bench_index_build(api):
+    items = api.items.all()
+    return lambda: IdSuffixIndex(items)
+
+
+def bench_get_by_id_suffix(api):
+    items = api.items.all()
+    step = max(1, len(items) // LOOKUPS)
+    suffixes = [str(item['id'])[-6:] for item in items[::step]][:LOOKUPS]
+    # Build the index outside of the timing
+    cmdline.get_item_index(api)
+
+    def run():
+        for suffix in suffixes:
+            try:
+                cmdline.get_by_id_suffix(api, suffix)
+            except (cmdline.DoesNotExist, cmdline.TooMany):
+                pass
+    return run
+
+
+def bench_get_project_by_name(api):
+    projects = api.projects.all()
+    names = [projects[i % len(projects)]['name'].upper() for i in range(LOOKUPS)]
+    cmdline.get_project_by_name(api, 'inbox')
+
+    def run():
+        for name in names:
+            cmdline.get_project_by_name(api, name)
+    return run
+
+
+def bench_apply_changes(api):
+    items = api.items.all()[:100]
+    changes = ['pri:H', 'proj:Project 7', 'due:tomorrow']
+
+    def run():
+        for item in items:
+            cmdline.apply_changes(api, item, changes)
+        del api.queue[:]
+    return run
+
+
+def bench_prettytable(api):
+    rows = [('id', 'pri', 'content', 'proj', 'due date')]
+    rows.extend(
+        (item['id'], item['priority'], item['content'], item['project_id'], item['date_string'])
+        for item in api.items.all()
+    )
+    return lambda: prettytable(120, rows)
+
+
+def bench_parse_date(api):
+    relative_to = datetime.datetime(2016, 1, 1)
+
+    def run():
+        for i in range(LOOKUPS // len(DATE_INPUTS)):
+            for text in DATE_INPUTS:
+                parse_date(text, relative_to=relative_to)
+    return run
+
+
+def bench_parse_date_cold(api):
+    relative_to = datetime.datetime(2016, 1, 1)
+    texts = DATE_INPUTS + TASKWARRIOR_INPUTS
+
+    def run():
+        # Every pass starts without memoized results
+        util._parse_cache.clear()
+        for text in texts:
+            parse_date(text, relative_to=relative_to)
+    return run
+
+
+def invoke(api, args):
+    """Runs a francis command against api through click's test runner"""
+    def run():
+        old = cmdline.get_config, cmdline.get_api, cmdline.build_api
+        cmdline.get_config = lambda: {'auth_token': 'token'}
+        cmdline.get_api = lambda cfg, ctx, **kwargs: api
+        cmdline.build_api = lambda cfg: api
+        try:
+            result = CliRunner().invoke(cmdline.cli, args, obj={})
+        finally:
+            cmdline.get_config, cmdline.get_api, cmdline.build_api = old
+        if result.exception and not isinstance(result.exception, SystemExit):
+            raise result.exception
+    return run
+
+
+def bench_list_cmd(api):
+    return invoke(api, ['list', 'today', 'overdue'])
+
+
+def to_store_api(api):
+    return build_store_api({
+        'sync_token': api.sync_token,
+        'projects': [proj.data for proj in api.projects.all()],
+        'items': [item.data for item in api.items.all()],
+    })
+
+
+def bench_due_index_build(api):
+    items = api.items.all()
+    return lambda: DueDateIndex(items)
+
+
+def bench_store_build(api):
+    items = [item.data for item in api.items.all()]
+    return lambda: ItemStore(items)
+
+
+def bench_store_find_id_suffix(api):
+    """Looks up 10 suffixes; without an index each one is a pass over the ids"""
+    store = to_store_api(api).item_store
+    suffixes = [str(item_id)[-6:] for item_id in store.ids[::max(1, len(store) // 10)]][:10]
+
+    def run():
+        for suffix in suffixes:
+            store.find_id_suffix(suffix)
+    return run
+
+
+def bench_store_list_cmd(api):
+    return invoke(to_store_api(api), ['list', 'today', 'overdue'])
+
+
+def bench_search_build(api):
+    return lambda: SearchIndex.from_api(api)
+
+
+def bench_search_query(api):
+    """Runs each search query once against a built index"""
+    index = SearchIndex.from_api(api)
+
+    def run():
+        for query in SEARCH_QUERIES:
+            index.search(query, limit=50)
+    return run
+
+
+def bench_search_update(api):
+    """Applies a sync that changed 100 items to an index loaded from disk"""
+    data = json.loads(json.dumps(SearchIndex.from_api(api).to_json()))
+    changed = [
+        dict(item.data, content='renamed ' + item['content']) for item in api.items.all()[:100]
+    ]
+
+    def run():
+        index = SearchIndex.from_json(data, api.state['projects'])
+        index.update(api, changed)
+    return run
+
+
+def save_cache(api):
+    """Writes api to a sync cache in a temp dir and returns the dir"""
+    cache_dir = tempfile.mkdtemp(prefix='francis-bench-')
+    atexit.register(shutil.rmtree, cache_dir, True)
+    SyncCache(cache_dir, 'token').save(api)
+    return cache_dir
+
+
+def bench_cache_load(api):
+    """Loads the sync cache file into a new api like every command does"""
+    cache = SyncCache(save_cache(api), 'token')
+    return lambda: cache.load(cmdline.build_api({'auth_token': 'token'}))
+
+
+def bench_store_cache_load(api):
+    cache = SyncCache(save_cache(api), 'token')
+    cfg = {'auth_token': 'token', 'item_store': 'compact'}
+    return lambda: cache.load(cmdline.build_api(cfg))
+
+
+def bench_offline_list_cmd(api):
+    """Runs list through the real get_api, which reads the sync cache"""
+    cfg = {'auth_token': 'token', 'cache_dir': save_cache(api)}
+
+    def run():
+        old = cmdline.get_config
+        cmdline.get_config = lambda: dict(cfg)
+        try:
+            result = CliRunner().invoke(
+                cmdline.cli, ['--offline', 'list', 'today', 'overdue'], obj={}
+            )
+        finally:
+            cmdline.get_config = old
+        if result.exception and not isinstance(result.exception, SystemExit):
+            raise result.exception
+    return run
+
+
+def bench_timesheet_cmd(api):
+    api.completed.get_all = FakeCompleted(build_completed(len(api.items.all()) // 10)).get_all
+    return invoke(api, ['timesheet'])
+
+
+BENCHMARKS = [
+    ('index_build', bench_index_build),
+    ('get_by_id_suffix', bench_get_by_id_suffix),
+    ('get_project_by_name', bench_get_project_by_name),
+    ('apply_changes', bench_apply_changes),
+    ('prettytable', bench_prettytable),
+    ('parse_date', bench_parse_date),
+    ('parse_date_cold', bench_parse_date_cold),
+    ('list_cmd', bench_list_cmd),
+    ('cache_load', bench_cache_load),
+    ('store_cache_load', bench_store_cache_load),
+    ('offline_list_cmd', bench_offline_list_cmd),
+    ('due_index_build', bench_due_index_build),
+    ('store_build', bench_store_build),
+    ('store_find_id_suffix', bench_store_find_id_suffix),
+    ('store_list_cmd', bench_store_list_cmd),
+    ('timesheet_cmd', bench_timesheet_cmd),
+    ('search_build', bench_search_build),
+    ('search_query', bench_search_query),
+    ('search_update', bench_search_update),
+]
+
+
+def measure(func, repeat):
+    """Returns the best time of repeat runs of func in seconds"""
+    best = None
+    for i in range(repeat):
+        start = timer()
+        func()
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, names=None, log=None):
+    """Runs the benchmarks for each account size
+
+    :arg sizes: list of item counts
+    :arg repeat: number of times to run each benchmark
+    :arg names: (optional) names of benchmarks to run; defaults to all
+    :arg log: (optional) function called with a line of text per result
+
+    :returns: list of dicts with name, size and seconds keys
+
+    """
+    results = []
+    for size in sizes:
+        state = build_state(size)
+        for name, setup in BENCHMARKS:
+            if names and name not in names:
+                continue
+            # Every benchmark gets a fresh api so caches from one don't help
+            # another
+            func = setup(build_api(state))
+            seconds = measure(func, repeat)
+            results.append({'name': name, 'size': size, 'seconds': seconds})
+            if log:
+                log('%-22s %7d  %10.2fms' % (name, size, seconds * 1000))
+    return results
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_results, new_results):
+    """Yields lines comparing two sets of results"""
+    old = dict(((res['name'], res['size']), res['seconds']) for res in old_results)
+    yield '%-22s %7s  %10s  %10s  %7s' % ('name', 'size', 'old', 'new', 'speedup')
+    for res in new_results:
+        key = (res['name'], res['size'])
+        if key not in old:
+            continue
+        yield '%-22s %7d  %8.2fms  %8.2fms  %6.2fx' % (
+            res['name'], res['size'], old[key] * 1000, res['seconds'] * 1000,
+            old[key] / res['seconds'] if res['seconds'] else float('inf'),
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the francis benchmarks.')
+    parser.add_argument(
+        '--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+        help='comma-separated account sizes in items'
+    )
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='runs per benchmark; the best is reported')
+    parser.add_argument('--only', default=None,
+                        help='comma-separated benchmark names to run')
+    parser.add_argument('--output', default=None,
+                        help='file to write the results to as JSON')
+    parser.add_argument('--compare', default=None,
+                        help='results file from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    names = args.only.split(',') if args.only else None
+
+    def log(line):
+        print(line)
+        sys.stdout.flush()
+
+    results = run_benchmarks(sizes, args.repeat, names, log=log)
+
+    if args.output:
+        data = {
+            'revision': get_git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': datetime.datetime.now().isoformat(),
+            'results': results,
+        }
+        with open(args.output, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as fp:
+            old = json.load(fp)
+        print('')
+        print('Compared to %s:' % (old.get('revision') or args.compare))
+        for line in compare(old['results'], results):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,557 @@
+"""Local stand-in for the Todoist sync API
+
+This serves the endpoints francis uses (sync, query and completed/get_all)
+for a synthetic account so commands can be load tested without a network.
+Commits are sync requests with commands, so they go through sync too.
+
+Run it with::
+
+    $ python -m benchmarks.fakeserver --items=10000 --latency=0.05
+
+and point francis at it in ``~/.francisrc``::
+
+    API_ENDPOINT=http://127.0.0.1:8765
+    AUTH_TOKEN=token
+    CACHE_DIR=~/.francis-fake-cache
+
+The account only knows about the fields francis uses. Sync tokens are
+revision numbers, so an incremental sync gets exactly the objects that
+changed since the token was handed out.
+
+"""
+import argparse
+import bisect
+import collections
+import datetime
+import gzip
+import io
+import json
+import random
+import socket
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlparse
+    import socketserver
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs, urlparse
+    import SocketServer as socketserver
+
+from benchmarks.fixtures import (
+    NUM_PROJECTS,
+    build_completed,
+    build_items,
+    build_projects,
+    due_on,
+)
+from francis.query import OVERDUE_QUERIES
+from francis.util import parse_api_datetime, parse_date, utc_to_local
+
+
+DEFAULT_PORT = 8765
+
+# Format francis uses for due_date_utc in item_update commands
+DUE_DATE_UTC_FORMAT = '%Y-%m-%dT%H:%M'
+API_DATE_FORMAT = '%a %d %b %Y %H:%M:%S +0000'
+
+# Responses bigger than this get gzipped if the client asks for it
+GZIP_MIN_SIZE = 1024
+
+# Error codes the real API uses for these
+ERROR_INVALID_COMMAND = {'error_code': 20, 'error': 'Invalid command'}
+ERROR_ITEM_NOT_FOUND = {'error_code': 22, 'error': 'Item not found'}
+
+
+def to_api_due_date(due_date_utc):
+    """Converts a due_date_utc argument into the due_date the API returns"""
+    when = datetime.datetime.strptime(due_date_utc[:16], DUE_DATE_UTC_FORMAT)
+    return when.strftime(API_DATE_FORMAT)
+
+
+def resolve_date_string(date_string, relative_to=None):
+    """Returns the due_date for a date string or None if we can't parse it"""
+    if not date_string:
+        return None
+    try:
+        return due_on(parse_date(date_string, relative_to=relative_to).date())
+    except ValueError:
+        return None
+
+
+def due_day(item):
+    """Returns the local date an item is due or None"""
+    if not item.get('due_date'):
+        return None
+    return utc_to_local(parse_api_datetime(item['due_date'])).date()
+
+
+class Account:
+    """The state of a fake Todoist account
+
+    Every change bumps the revision. The sync token handed out is the
+    revision at the time, and a log of (revision, type, id) lets an
+    incremental sync find what changed without looking at every object.
+
+    All methods are safe to call from several threads.
+
+    """
+    def __init__(self, projects, items, completed=(), token='token'):
+        self.token = token
+        self.lock = threading.Lock()
+        self.rev = 1
+        self.projects = collections.OrderedDict(
+            (proj['id'], dict(proj)) for proj in projects
+        )
+        self.items = collections.OrderedDict((item['id'], dict(item)) for item in items)
+        self.completed = sorted(
+            (dict(event) for event in completed),
+            key=lambda event: event['completed_date']
+        )
+        self.next_id = max([0] + list(self.items) + list(self.projects)) + 1
+        self.log_revs = []
+        self.log = []
+        # Like Todoist, commands are only run once per uuid so retried
+        # requests don't apply them twice
+        self.seen_uuids = {}
+
+    @classmethod
+    def generate(cls, num_items, num_projects=NUM_PROJECTS, num_completed=None,
+                 token='token', seed=0):
+        """Builds an account out of the benchmark fixtures
+
+        :arg num_items: number of items
+        :arg num_projects: number of projects
+        :arg num_completed: (optional) number of completed events this week;
+            defaults to a tenth of the items
+
+        """
+        if num_completed is None:
+            num_completed = num_items // 10
+        return cls(
+            projects=build_projects(num_projects),
+            items=build_items(num_items, num_projects, seed),
+            completed=build_completed(num_completed, num_projects, seed),
+            token=token,
+        )
+
+    def _changed(self, state_name, obj):
+        self.rev += 1
+        if state_name == 'items':
+            obj['seq_no'] = self.rev
+        self.log_revs.append(self.rev)
+        self.log.append((state_name, obj['id']))
+
+    def sync(self, sync_token='*', commands=()):
+        """Runs commands and returns a sync response
+
+        :arg sync_token: "*" for a full sync or a token from an earlier sync
+        :arg commands: list of sync command dicts
+
+        :returns: sync response dict
+
+        """
+        with self.lock:
+            temp_id_mapping = {}
+            sync_status = collections.OrderedDict()
+            for command in commands:
+                uuid = command.get('uuid')
+                if uuid in self.seen_uuids:
+                    sync_status[uuid] = self.seen_uuids[uuid]
+                    continue
+                try:
+                    status = self._run_command(command, temp_id_mapping)
+                except (KeyError, TypeError, ValueError):
+                    status = ERROR_INVALID_COMMAND
+                sync_status[uuid] = status
+                if uuid is not None:
+                    self.seen_uuids[uuid] = status
+
+            try:
+                since = int(sync_token)
+            except (TypeError, ValueError):
+                since = None
+
+            resp = {
+                'sync_token': str(self.rev),
+                'full_sync': since is None,
+                'sync_status': sync_status,
+                'temp_id_mapping': temp_id_mapping,
+            }
+            if since is None:
+                resp['projects'] = [dict(proj) for proj in self.projects.values()]
+                resp['items'] = [
+                    dict(item) for item in self.items.values() if not item.get('is_deleted')
+                ]
+                return resp
+
+            changed = collections.OrderedDict()
+            start = bisect.bisect_right(self.log_revs, since)
+            for state_name, obj_id in self.log[start:]:
+                changed[(state_name, obj_id)] = True
+            states = {'projects': self.projects, 'items': self.items}
+            resp['projects'] = []
+            resp['items'] = []
+            for state_name, obj_id in changed:
+                resp[state_name].append(dict(states[state_name][obj_id]))
+            return resp
+
+    def _resolve_id(self, obj_id, temp_id_mapping):
+        return temp_id_mapping.get(obj_id, obj_id)
+
+    def _set_due(self, item, args):
+        if args.get('due_date_utc'):
+            item['due_date'] = to_api_due_date(args['due_date_utc'])
+            item['date_string'] = args.get('date_string', item.get('date_string'))
+        elif 'date_string' in args:
+            item['date_string'] = args['date_string']
+            item['due_date'] = resolve_date_string(args['date_string'])
+
+    def _run_command(self, command, temp_id_mapping):
+        cmd_type = command['type']
+        args = command.get('args') or {}
+
+        if cmd_type == 'item_add':
+            item = {
+                'id': self.next_id,
+                'content': args['content'],
+                'project_id': self._resolve_id(
+                    args.get('project_id', next(iter(self.projects))), temp_id_mapping
+                ),
+                'priority': args.get('priority', 1),
+                'date_string': None,
+                'due_date': None,
+                'checked': 0,
+                'is_deleted': 0,
+            }
+            self.next_id += 1
+            self._set_due(item, args)
+            self.items[item['id']] = item
+            if command.get('temp_id'):
+                temp_id_mapping[command['temp_id']] = item['id']
+            self._changed('items', item)
+            return 'ok'
+
+        item = self.items.get(self._resolve_id(args.get('id'), temp_id_mapping))
+        if item is None or item.get('is_deleted'):
+            return ERROR_ITEM_NOT_FOUND
+
+        if cmd_type == 'item_update':
+            for key in ('content', 'priority'):
+                if key in args:
+                    item[key] = args[key]
+            self._set_due(item, args)
+        elif cmd_type == 'item_move':
+            item['project_id'] = self._resolve_id(args['project_id'], temp_id_mapping)
+        elif cmd_type in ('item_complete', 'item_close'):
+            item['checked'] = 1
+            self.completed.append({
+                'task_id': item['id'],
+                'content': item['content'],
+                'project_id': item['project_id'],
+                'completed_date': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            })
+        elif cmd_type == 'item_uncomplete':
+            item['checked'] = 0
+        elif cmd_type == 'item_delete':
+            item['is_deleted'] = 1
+        else:
+            return ERROR_INVALID_COMMAND
+
+        self._changed('items', item)
+        return 'ok'
+
+    def query(self, queries):
+        """Evaluates date and overdue queries like the query endpoint
+
+        Queries that aren't dates come back as empty date sections.
+
+        :returns: list of dicts with ``type``, ``query`` and ``data`` keys
+
+        """
+        with self.lock:
+            items = [
+                item for item in self.items.values()
+                if not item.get('checked') and not item.get('is_deleted')
+            ]
+        today = datetime.date.today()
+
+        results = []
+        for query in queries:
+            if query.lower().strip() in OVERDUE_QUERIES:
+                query_type = 'overdue'
+                matches = lambda day: day < today
+            else:
+                query_type = 'date'
+                try:
+                    wanted = parse_date(query).date()
+                except ValueError:
+                    wanted = None
+                matches = lambda day: day == wanted
+            results.append({
+                'type': query_type,
+                'query': query,
+                'data': [
+                    dict(item) for item in items
+                    if due_day(item) is not None and matches(due_day(item))
+                ],
+            })
+        return results
+
+    def get_completed(self, limit=30, offset=0, since=None, until=None):
+        """Returns a page of completed events like completed/get_all"""
+        with self.lock:
+            events = [
+                dict(event) for event in self.completed
+                if (since or '') <= event['completed_date'][:16] <= (until or '9999')
+            ]
+        return {'items': events[offset:offset + limit], 'projects': {}}
+
+
+class RateLimiter:
+    """Allows limit requests in any period seconds"""
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.lock = threading.Lock()
+        self.times = collections.deque()
+
+    def check(self, now=None):
+        """Records a request
+
+        :returns: None if the request is allowed or the number of seconds
+            until it would be
+
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            while self.times and self.times[0] <= now - self.period:
+                self.times.popleft()
+            if len(self.times) >= self.limit:
+                return self.times[0] + self.period - now
+            self.times.append(now)
+            return None
+
+
+class FakeTodoistHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count('connections')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.handle_call(url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        self.handle_call(url.path, parse_qs(body))
+
+    def handle_call(self, path, params):
+        server = self.server
+        params = dict((key, values[-1]) for key, values in params.items())
+        # Calls look like /sync/v8/<call> for whichever API version
+        parts = path.strip('/').split('/', 2)
+        call = parts[2] if len(parts) == 3 and parts[0] == 'sync' else None
+        server.count('requests')
+        server.count(call)
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + server.random_jitter())
+
+        if server.should_fail():
+            server.count('failed')
+            return self.send_json(503, {'error': 'Service unavailable', 'http_code': 503})
+
+        retry_after = server.rate_limiter.check() if server.rate_limiter else None
+        if retry_after is not None:
+            server.count('throttled')
+            return self.send_json(
+                429,
+                {'error': 'Too many requests', 'error_code': 35, 'http_code': 429,
+                 'error_extra': {'retry_after': int(retry_after) + 1}},
+                headers={'Retry-After': str(int(retry_after) + 1)}
+            )
+
+        account = server.account
+        if params.get('token') != account.token:
+            return self.send_json(
+                403, {'error': 'Invalid token', 'error_code': 401, 'http_code': 403}
+            )
+
+        try:
+            if call == 'sync':
+                data = account.sync(
+                    params.get('sync_token', '*'), json.loads(params.get('commands') or '[]')
+                )
+            elif call == 'query':
+                data = account.query(json.loads(params['queries']))
+            elif call == 'completed/get_all':
+                data = account.get_completed(
+                    limit=int(params.get('limit', 30)),
+                    offset=int(params.get('offset', 0)),
+                    since=params.get('since'),
+                    until=params.get('until'),
+                )
+            else:
+                return self.send_json(404, {'error': 'Not found', 'http_code': 404})
+        except (KeyError, ValueError) as exc:
+            return self.send_json(
+                400, {'error': 'Bad request: %s' % exc, 'http_code': 400}
+            )
+        self.send_json(200, data)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        accept = self.headers.get('Accept-Encoding') or ''
+        if len(body) >= GZIP_MIN_SIZE and 'gzip' in accept:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+                fp.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class FakeTodoistServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server for an Account
+
+    :arg account: the Account to serve
+    :arg address: (host, port) to listen on; port 0 picks a free port
+    :arg latency: seconds to wait before answering each request
+    :arg jitter: up to this many more seconds are added at random
+    :arg rate_limit: (optional) number of requests allowed per rate_period;
+        requests over that get a 429
+    :arg rate_period: seconds the rate limit is counted over
+    :arg error_rate: fraction of requests that get a 503
+    :arg seed: seed for the jitter and errors so runs are reproducible
+
+    Set ``fail_next`` to answer that many of the next requests with a 503.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, account, address=('127.0.0.1', 0), latency=0.0, jitter=0.0,
+                 rate_limit=None, rate_period=60.0, error_rate=0.0, seed=0,
+                 verbose=False):
+        HTTPServer.__init__(self, address, FakeTodoistHandler)
+        self.account = account
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limiter = RateLimiter(rate_limit, rate_period) if rate_limit else None
+        self.error_rate = error_rate
+        self.fail_next = 0
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        """The api_endpoint to give TodoistAPI"""
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def random_jitter(self):
+        with self.stats_lock:
+            return self.random.uniform(0, self.jitter)
+
+    def should_fail(self):
+        with self.stats_lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return bool(self.error_rate) and self.random.random() < self.error_rate
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name or 'unknown'] += 1
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before we answer; that's expected
+        if isinstance(sys.exc_info()[1], socket.error) and not self.verbose:
+            return
+        HTTPServer.handle_error(self, request, client_address)
+
+    def start(self):
+        """Serves requests in a background thread
+
+        :returns: the server
+
+        """
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops the background thread and closes the socket"""
+        if self.thread is not None:
+            self.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs a fake Todoist API server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--token', default='token', help='auth token to accept')
+    parser.add_argument('--items', type=int, default=1000, help='number of items')
+    parser.add_argument('--projects', type=int, default=NUM_PROJECTS,
+                        help='number of projects')
+    parser.add_argument('--completed', type=int, default=None,
+                        help='number of completed items this week')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='up to this many more seconds are added at random')
+    parser.add_argument('--rate-limit', type=int, default=None,
+                        help='requests allowed per --rate-period')
+    parser.add_argument('--rate-period', type=float, default=60.0,
+                        help='seconds the rate limit is counted over')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests that get a 503')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    account = Account.generate(
+        args.items, args.projects, args.completed, token=args.token
+    )
+    server = FakeTodoistServer(
+        account, (args.host, args.port), latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, rate_period=args.rate_period,
+        error_rate=args.error_rate, verbose=args.verbose,
+    )
+    print('Serving %d items on %s' % (len(account.items), server.endpoint))
+    print('Set API_ENDPOINT=%s in ~/.francisrc to use it.' % server.endpoint)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
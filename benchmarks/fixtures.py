@@ -0,0 +1,127 @@
+"""Synthetic sync states for benchmarks
+
+Everything is generated from a seeded random number generator so runs on
+different commits see the same data.
+
+"""
+import datetime
+import random
+
+from francis.util import local_to_utc
+
+
+NUM_PROJECTS = 300
+
+WORDS = (
+    'tweak befunge valve file timesheet review patch write docs fix bug call '
+    'mom buy milk water plants update deps triage issues plan sprint release '
+    'deploy server renew passport book flights clean desk answer email'
+).split()
+
+DATE_STRINGS = ['today', 'tomorrow', 'every day', 'ev monday', 'Jul 22', 'friday']
+
+
+def due_on(day):
+    # All-day tasks are due at 23:59:59 local time
+    when = datetime.datetime.combine(day, datetime.time(23, 59, 59))
+    return local_to_utc(when).strftime('%a %d %b %Y %H:%M:%S +0000')
+
+
+def build_projects(num_projects=NUM_PROJECTS):
+    projects = [{'id': 1, 'name': 'Inbox', 'inbox_project': True}]
+    for i in range(2, num_projects + 1):
+        projects.append({'id': i, 'name': 'Project %d' % i})
+    return projects
+
+
+def build_items(num_items, num_projects=NUM_PROJECTS, seed=0):
+    """Returns item dicts due within a month either side of today"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    items = []
+    for i in range(num_items):
+        day = today + datetime.timedelta(days=rng.randint(-30, 30))
+        items.append({
+            'id': 100000000 + i * 7919,
+            'content': ' '.join(rng.choice(WORDS) for j in range(rng.randint(2, 8))),
+            'project_id': rng.randint(1, num_projects),
+            'priority': rng.choice([1, 1, 1, 4]),
+            'due_date': due_on(day) if rng.random() < 0.9 else None,
+            'date_string': rng.choice(DATE_STRINGS),
+            'seq_no': rng.randint(1, 1000),
+            'checked': 1 if rng.random() < 0.05 else 0,
+        })
+    return items
+
+
+def build_state(num_items, num_projects=NUM_PROJECTS, seed=0):
+    """Returns a sync state suitable for ``TodoistAPI._update_state``"""
+    return {
+        'sync_token': 'bench',
+        'projects': build_projects(num_projects),
+        'items': build_items(num_items, num_projects, seed),
+    }
+
+
+def build_completed(num_events, num_projects=NUM_PROJECTS, seed=0):
+    """Returns completed/get_all items spread over this week
+
+    Weeks start on Sunday like they do in the timesheet.
+
+    """
+    rng = random.Random(seed)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    week_start = today - datetime.timedelta(days=today.isoweekday() % 7)
+    events = []
+    for i in range(num_events):
+        when = week_start + datetime.timedelta(minutes=rng.randint(0, 7 * 24 * 60 - 2))
+        events.append({
+            'task_id': 200000000 + i,
+            'content': ' '.join(rng.choice(WORDS) for j in range(rng.randint(2, 8))),
+            'project_id': rng.randint(1, num_projects),
+            'completed_date': local_to_utc(when).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+    return events
+
+
+def build_api(state):
+    """Returns a TodoistAPI loaded with state the way the sync cache does"""
+    import todoist.api
+    from francis.cache import load_state
+
+    api = todoist.api.TodoistAPI('token', cache=None)
+    load_state(api, copy_state(state))
+    api.sync_token = state['sync_token']
+    return api
+
+
+def copy_state(state):
+    """Returns a copy of state whose objects can be handed to an api"""
+    return {
+        'projects': [dict(data) for data in state['projects']],
+        'items': [dict(data) for data in state['items']],
+    }
+
+
+def build_store_api(state):
+    """Returns a StoreAPI loaded with state the way the sync cache does"""
+    from francis.cache import load_state
+    from francis.storeapi import StoreAPI
+
+    api = StoreAPI('token', cache=None)
+    load_state(api, copy_state(state))
+    api.sync_token = state['sync_token']
+    return api
+
+
+class FakeCompleted:
+    """Serves completed/get_all pages out of a list of events"""
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda event: event['completed_date'])
+
+    def get_all(self, limit, offset=0, since=None, until=None):
+        events = [
+            event for event in self.events
+            if (since or '') <= event['completed_date'][:16] <= (until or '9999')
+        ]
+        return {'items': events[offset:offset + limit], 'projects': {}}
@@ -0,0 +1,200 @@
+"""Load tests francis commands against the fake Todoist server
+
+Run with::
+
+    $ python -m benchmarks.loadtest
+    $ python -m benchmarks.loadtest --items=10000 --latency=0.05 --runs=50
+    $ python -m benchmarks.loadtest --cold --only=today,timesheet
+
+Every command runs the way it does from the shell, including syncing with
+the server and reading and writing the sync cache. With ``--cold`` every
+run does a full sync; otherwise runs after the first sync incrementally.
+
+"""
+import argparse
+import json
+import math
+import shutil
+import sys
+import tempfile
+import time
+
+from click.testing import CliRunner
+
+from benchmarks.fakeserver import Account, FakeTodoistServer
+from francis import cmdline
+
+
+DEFAULT_RUNS = 20
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    # Python 2
+    timer = time.time
+
+
+def get_commands(account):
+    """Returns (name, args) for the commands to load test
+
+    The write commands pick items from the account so they have something
+    to act on.
+
+    """
+    item_ids = [str(item_id) for item_id in list(account.items)[:20]]
+    return [
+        ('today', ['today']),
+        ('overdue', ['overdue']),
+        ('list', ['list', 'today', 'tomorrow', 'overdue']),
+        ('agenda', ['agenda', '--days=7']),
+        ('timesheet', ['timesheet']),
+        ('show', ['show', ','.join(item_ids[:5])]),
+        ('add', ['add', 'proj:Project 2', 'pri:H', 'load test task']),
+        ('modify', ['modify', item_ids[-1], 'pri:H']),
+    ]
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of values"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, int(math.ceil(percent / 100.0 * len(values))))
+    return values[rank - 1]
+
+
+def summarize(name, times, requests):
+    total = sum(times)
+    return {
+        'name': name,
+        'runs': len(times),
+        'throughput': len(times) / total if total else float('inf'),
+        'p50': percentile(times, 50),
+        'p90': percentile(times, 90),
+        'p99': percentile(times, 99),
+        'max': max(times),
+        'requests': requests,
+    }
+
+
+def run_load(server, runs=DEFAULT_RUNS, cold=False, names=None, log=None):
+    """Runs each command runs times against a running FakeTodoistServer
+
+    :arg server: a started FakeTodoistServer
+    :arg runs: number of times to run each command
+    :arg cold: whether every run does a full sync
+    :arg names: (optional) names of commands to run; defaults to all
+    :arg log: (optional) function called with a line of text per command
+
+    :returns: list of dicts with name, runs, throughput, p50, p90, p99, max
+        and requests keys; times are in seconds
+
+    """
+    cache_dir = tempfile.mkdtemp(prefix='francis-load-')
+    cfg = {
+        'auth_token': server.account.token,
+        'api_endpoint': server.endpoint,
+        'cache_dir': cache_dir,
+    }
+    args_prefix = ['--full-sync'] if cold else []
+    old_get_config = cmdline.get_config
+    cmdline.get_config = lambda: dict(cfg)
+    try:
+        results = []
+        for name, args in get_commands(server.account):
+            if names and name not in names:
+                continue
+            # Prime the cache so warm runs measure incremental syncs
+            if not cold:
+                invoke(args)
+            requests_before = server.stats['requests']
+            times = []
+            for i in range(runs):
+                start = timer()
+                invoke(args_prefix + args)
+                times.append(timer() - start)
+            requests = server.stats['requests'] - requests_before
+            result = summarize(name, times, requests)
+            results.append(result)
+            if log:
+                log(format_result(result))
+        return results
+    finally:
+        cmdline.get_config = old_get_config
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def invoke(args):
+    result = CliRunner().invoke(cmdline.cli, args, obj={})
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    if result.exit_code != 0:
+        raise RuntimeError('francis %s failed: %s' % (' '.join(args), result.output))
+    return result
+
+
+HEADER = '%-10s %5s  %8s  %9s  %9s  %9s  %9s  %8s' % (
+    'command', 'runs', 'runs/s', 'p50', 'p90', 'p99', 'max', 'requests'
+)
+
+
+def format_result(result):
+    return '%-10s %5d  %8.1f  %7.1fms  %7.1fms  %7.1fms  %7.1fms  %8d' % (
+        result['name'], result['runs'], result['throughput'],
+        result['p50'] * 1000, result['p90'] * 1000, result['p99'] * 1000,
+        result['max'] * 1000, result['requests'],
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load tests francis commands against a fake Todoist server.'
+    )
+    parser.add_argument('--items', type=int, default=1000, help='number of items')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+                        help='runs per command')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the server waits before each response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='up to this many more seconds are added at random')
+    parser.add_argument('--rate-limit', type=int, default=None,
+                        help='requests the server allows per --rate-period')
+    parser.add_argument('--rate-period', type=float, default=60.0,
+                        help='seconds the rate limit is counted over')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests the server answers with a 503')
+    parser.add_argument('--cold', action='store_true',
+                        help='do a full sync on every run')
+    parser.add_argument('--only', default=None,
+                        help='comma-separated command names to run')
+    parser.add_argument('--output', default=None,
+                        help='file to write the results to as JSON')
+    args = parser.parse_args(argv)
+
+    account = Account.generate(args.items)
+    server = FakeTodoistServer(
+        account, latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, rate_period=args.rate_period,
+        error_rate=args.error_rate,
+    ).start()
+
+    def log(line):
+        print(line)
+        sys.stdout.flush()
+
+    log(HEADER)
+    try:
+        results = run_load(
+            server, args.runs, cold=args.cold,
+            names=args.only.split(',') if args.only else None, log=log,
+        )
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'items': args.items, 'results': results}, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import time
+
+# When francis started importing; --profile counts import time from here.
+IMPORT_START = time.time()
 
 __author__ = 'Will Kahn-Greene'
 __email__ = 'willkg@bluesock.org'
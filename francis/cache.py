@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import time
+
+from francis.store import get_item_store
+
+
+# Bump this when the on-disk format changes so old caches get thrown away
+# rather than misread.
+CACHE_VERSION = 1
+
+# By default, a cache older than a week gets a full resync.
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+
+# State lists that hold model objects and the todoist.models class of each,
+# as in TodoistAPI._update_state
+MODEL_STATES = {
+    'collaborators': 'Collaborator',
+    'collaborator_states': 'CollaboratorState',
+    'filters': 'Filter',
+    'items': 'Item',
+    'labels': 'Label',
+    'live_notifications': 'LiveNotification',
+    'notes': 'Note',
+    'project_notes': 'ProjectNote',
+    'projects': 'Project',
+    'reminders': 'Reminder',
+    'sections': 'Section',
+}
+
+
+class CacheError(Exception):
+    pass
+
+
+def load_state(api, state):
+    """Puts a cached state into an api with empty state
+
+    ``_update_state`` looks up every incoming object in the state to see if
+    it's an update, which is quadratic and takes minutes for 100k items.
+    Nothing in a cached state is an update, so this builds the model objects
+    directly and only hands ``_update_state`` the rest.
+
+    Items go through ``_update_state`` if the api keeps them in an
+    ItemStore; it fills the store without looking anything up.
+
+    """
+    from todoist import models
+
+    rest = {}
+    for key, value in state.items():
+        model_name = MODEL_STATES.get(key)
+        if model_name is None or (key == 'items' and get_item_store(api) is not None):
+            rest[key] = value
+            continue
+        model = getattr(models, model_name)
+        api.state[key] = [model(data, api) for data in value if not data.get('is_deleted')]
+    api._update_state(rest)
+
+
+def get_cache_dir(cfg):
+    """Returns the cache directory from the config or the default one"""
+    if cfg.get('cache_dir'):
+        return os.path.expanduser(cfg['cache_dir'])
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'francis')
+
+
+def get_max_age(cfg):
+    """Returns the maximum cache age in seconds from the config"""
+    try:
+        return int(cfg.get('cache_max_age', DEFAULT_MAX_AGE))
+    except ValueError:
+        return DEFAULT_MAX_AGE
+
+
+def get_max_staleness(cfg):
+    """Returns how old cached data can be and still be used for reads
+
+    This is in seconds. 0 means reads always sync unless ``--offline`` is
+    passed.
+
+    """
+    try:
+        return int(cfg.get('max_staleness', 0))
+    except ValueError:
+        return 0
+
+
+def cache_key(auth_token):
+    """Returns a filename-safe key for an account that doesn't leak the token"""
+    return hashlib.sha1(auth_token.encode('utf-8')).hexdigest()[:16]
+
+
+class SyncCache:
+    """Persists synced Todoist state and sync token on disk
+
+    The first sync with an empty cache downloads the entire account. After
+    that, we load the state and sync token from the cache so the sync only
+    pulls the delta since the last sync.
+
+    The cache is keyed by a hash of the auth token, so multiple accounts don't
+    stomp on each other and the token doesn't end up in a filename.
+
+    """
+    def __init__(self, cache_dir, auth_token, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        # Set to the time of the sync the cache came from when it's loaded
+        self.synced_at = None
+        self.path = os.path.join(cache_dir, 'sync-%s.json' % cache_key(auth_token))
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(get_cache_dir(cfg), cfg['auth_token'], get_max_age(cfg))
+
+    def read(self, check_age=True):
+        """Reads and validates the cache file
+
+        :arg check_age: whether to reject a cache older than max_age
+
+        :returns: the cache contents as a dict
+
+        :raises CacheError: if the cache is missing, corrupt, from a different
+            version or too old
+
+        """
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except (IOError, OSError):
+            raise CacheError('cache is missing')
+        except ValueError:
+            raise CacheError('cache is corrupt')
+
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            raise CacheError('cache version mismatch')
+
+        if not all(key in data for key in ('synced_at', 'sync_token', 'state')):
+            raise CacheError('cache is corrupt')
+
+        try:
+            synced_at = float(data['synced_at'])
+        except (TypeError, ValueError):
+            raise CacheError('cache is corrupt')
+
+        if check_age and self.max_age and time.time() - synced_at > self.max_age:
+            raise CacheError('cache is too old')
+
+        return data
+
+    def load(self, api, check_age=True):
+        """Primes the api with the cached state and sync token
+
+        :arg api: a TodoistAPI instance with empty state
+        :arg check_age: whether to reject a cache older than max_age
+
+        :returns: True if the cache was loaded, False if the api needs a full
+            sync
+
+        """
+        try:
+            data = self.read(check_age=check_age)
+        except CacheError:
+            return False
+
+        load_state(api, data['state'])
+        api.sync_token = data['sync_token']
+        self.synced_at = float(data['synced_at'])
+        return True
+
+    def age(self):
+        """Returns seconds since the loaded cache was synced"""
+        return time.time() - self.synced_at
+
+    def save(self, api):
+        """Writes the api state and sync token to the cache
+
+        The file is written to a temp file first and then moved into place so
+        an interrupted write never leaves a half-written cache behind.
+
+        """
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+
+        state = api.state
+        store = get_item_store(api)
+        if store is not None:
+            # Stored items get turned back into dicts as they're written
+            state = dict(state, items=state['items'] + store.stored_items())
+
+        data = {
+            'version': CACHE_VERSION,
+            'synced_at': time.time(),
+            'sync_token': api.sync_token,
+            'state': state,
+        }
+
+        tmp_path = self.path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp, default=_state_default)
+        os.rename(tmp_path, self.path)
+
+    def clear(self):
+        """Removes the cache file"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _state_default(obj):
+    # Model objects in the state are wrappers around a dict
+    return obj.data
@@ -0,0 +1,102 @@
+import functools
+
+from francis import timing
+
+
+# Todoist caps completed/get_all pages at 200 items.
+COMPLETED_PAGE_SIZE = 200
+
+# Most requests francis has in flight at once for one account
+MAX_CONCURRENCY = 4
+
+DEFAULT_API_ENDPOINT = 'https://api.todoist.com'
+
+
+def get_api_endpoint(cfg):
+    """Returns the Todoist API endpoint from the config
+
+    This is only worth changing to point francis at a stand-in server like
+    the one in ``benchmarks/fakeserver.py``.
+
+    """
+    return (cfg.get('api_endpoint') or DEFAULT_API_ENDPOINT).rstrip('/')
+
+
+def _call(func):
+    return func()
+
+
+def run_concurrently(funcs, max_workers=MAX_CONCURRENCY):
+    """Calls functions at the same time and returns what they return
+
+    requests and todoist-python block, so the functions run on a pool of
+    threads. They can share the pooled session from ``francis.session``.
+
+    :arg funcs: list of functions that take no arguments
+    :arg max_workers: most functions to run at once
+
+    :returns: list of the return values in the same order as funcs
+
+    :raises: the exception if any of the functions raised one
+
+    """
+    funcs = list(funcs)
+    if len(funcs) <= 1 or max_workers <= 1:
+        return [func() for func in funcs]
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(max_workers, len(funcs)))
+    try:
+        return pool.map(_call, funcs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def iter_completed(api, since, until, page_size=COMPLETED_PAGE_SIZE,
+                   max_concurrency=MAX_CONCURRENCY):
+    """Yields every completed item between since and until
+
+    completed/get_all returns at most page_size items per request, so this
+    keeps asking for more pages until it gets a short one. Most ranges fit
+    in one page, so that's all that's asked for at first. After that, the
+    pages are fetched at the same time in batches as big as the number of
+    full pages so far, up to max_concurrency. That way a long history goes
+    quickly and a short one costs at most one extra request per batch.
+
+    :arg api: a TodoistAPI
+    :arg since: naive UTC datetime for the start of the range or None for
+        the beginning of time
+    :arg until: naive UTC datetime for the end of the range or None for now
+    :arg page_size: items to ask for per request
+    :arg max_concurrency: most pages to fetch at once
+
+    """
+    kwargs = {}
+    if since is not None:
+        kwargs['since'] = since.strftime('%Y-%m-%dT%H:%M')
+    if until is not None:
+        kwargs['until'] = until.strftime('%Y-%m-%dT%H:%M')
+
+    def get_page(offset):
+        with timing.phase('completed'):
+            resp = api.completed.get_all(limit=page_size, offset=offset, **kwargs)
+        return resp.get('items', [])
+
+    num_pages = 0
+    while True:
+        batch_size = max(1, min(num_pages, max_concurrency))
+        pages = run_concurrently(
+            [
+                functools.partial(get_page, (num_pages + i) * page_size)
+                for i in range(batch_size)
+            ],
+            max_concurrency
+        )
+        for items in pages:
+            for item in items:
+                yield item
+
+            if len(items) < page_size:
+                return
+        num_pages += batch_size
@@ -1,33 +1,90 @@
 import datetime
 import functools
+import os
 import sys
+import time
 import traceback
 
 import click
-import pendulum
-import todoist
 
-from francis import __version__
+from francis import IMPORT_START, __version__, timing
+from francis.cache import (
+    SyncCache,
+    get_cache_dir,
+    get_max_staleness,
+)
+from francis.client import (
+    get_api_endpoint,
+    iter_completed,
+    run_concurrently,
+)
+from francis.daemon import (
+    DEFAULT_REFRESH,
+    DaemonError,
+    run_daemon,
+    run_via_daemon,
+)
+from francis.export import (
+    WRITERS as EXPORT_WRITERS,
+    iter_completed_records,
+    iter_item_records,
+)
+from francis.importer import (
+    guess_format,
+    iter_records,
+    record_to_task,
+)
+from francis.index import (
+    ContentIndex,
+    DoesNotExist,
+    TooMany,
+    get_item_index,
+    get_project_index,
+    sync as sync_api,
+)
+from francis.journal import (
+    Journal,
+    undo_action,
+)
+from francis.output import echo, get_output, get_terminal_width, write_lines
+from francis.store import get_item_data, get_item_store, use_item_store
+from francis.query import (
+    get_due_index,
+    is_recurring,
+    run_query,
+)
+from francis.search import (
+    DEFAULT_LIMIT,
+    SearchCache,
+    get_search_index,
+)
+from francis.writequeue import (
+    MAX_BATCH_SIZE,
+    WriteQueue,
+    flush as flush_queue,
+)
 from francis.util import (
     ConfigFileMissingError,
+    format_age,
     get_config,
+    get_profile,
+    get_profiles,
+    iter_table_lines,
+    local_to_utc,
+    parse_api_datetime,
     parse_date,
-    prettytable,
+    today,
+    utc_to_local,
 )
 
 
+# When the imports above finished; see --profile
+IMPORTS_DONE = time.time()
+
 USAGE = '%prog [options] [command] [command-options]'
 VERSION = 'francis ' + __version__
 
 
-class DoesNotExist(Exception):
-    pass
-
-
-class TooMany(Exception):
-    pass
-
-
 class Action:
     """Captures an action applied to a specific item
 
@@ -43,51 +100,361 @@ class Action:
         self.old_value = old_value
         self.new_value = new_value
 
+    def to_dict(self):
+        return {
+            'item_id': self.item_id,
+            'item_seq_no': self.item_seq_no,
+            'field': self.field,
+            'old_value': self.old_value,
+            'new_value': self.new_value,
+        }
+
+
+# Commands that work with --all-profiles; today, tomorrow and overdue run
+# list
+ALL_PROFILES_COMMANDS = ('list', 'thisweek', 'agenda', 'timesheet')
+
 
 def add_config(fun):
+    """Passes the config for the profile the command should use
+
+    With ``--all-profiles``, this passes the whole config so the command can
+    get the settings for every profile.
+
+    """
     @functools.wraps(fun)
     def _add_config(*args, **kwargs):
+        ctx = click.get_current_context()
         try:
-            cfg = get_config()
+            with timing.phase('config'):
+                cfg = get_config()
         except ConfigFileMissingError:
-            click.echo('Config file is missing. Add a ~/.francisrc file with '
-                       'your auth token in it.')
-            click.echo('')
-            click.echo('===')
-            click.echo('AUTH_TOKEN=<token>')
-            click.echo('===')
-            click.echo('')
+            echo('Config file is missing. Add a ~/.francisrc file with '
+                 'your auth token in it.')
+            echo('')
+            echo('===')
+            echo('AUTH_TOKEN=<token>')
+            echo('===')
+            echo('')
             raise click.Abort()
 
+        if ctx.obj.get('all_profiles'):
+            if ctx.info_name not in ALL_PROFILES_COMMANDS:
+                echo('ERROR: --all-profiles only works with list, today, tomorrow, '
+                     'overdue, thisweek, agenda and timesheet.')
+                raise click.Abort()
+        else:
+            try:
+                cfg = get_profile(cfg, ctx.obj.get('profile_name'))
+            except ValueError as exc:
+                echo('ERROR: %s' % exc)
+                raise click.Abort()
+
         return fun(cfg, *args, **kwargs)
     return _add_config
 
 
+def in_context(ctx, func):
+    """Wraps func so it runs with ctx as the current click context
+
+    click keeps the current context per thread. Without this, ``echo`` in a
+    pool thread can't find the command's output and writes to stdout, which
+    in the daemon isn't the client's.
+
+    """
+    def _in_context(*args, **kwargs):
+        with ctx.scope(cleanup=False):
+            return func(*args, **kwargs)
+    return _in_context
+
+
+def map_profiles(cfg, ctx, func):
+    """Runs func with the settings for each profile the command is for
+
+    That's just the one profile unless the user passed ``--all-profiles``.
+    Then func runs for every profile at the same time on a pool of threads,
+    so syncing all the accounts takes about as long as the slowest one.
+    Each profile gets its own context so one profile working from the cache
+    doesn't make the others look like they are.
+
+    :arg cfg: the config from ``add_config``
+    :arg ctx: the click context
+    :arg func: function that takes a profile's settings and context
+
+    :returns: list of (profile name, result, from cache); the name is None
+        unless ``--all-profiles`` was passed
+
+    """
+    if not ctx.obj.get('all_profiles'):
+        result = func(cfg, ctx)
+        return [(None, result, bool(ctx.obj.get('from_cache')))]
+
+    profiles = get_profiles(cfg)
+    if not profiles:
+        echo('ERROR: There are no profiles with an AUTH_TOKEN in ~/.francisrc.')
+        raise click.Abort()
+
+    contexts = [
+        click.Context(ctx.command, parent=ctx, info_name=ctx.info_name, obj=dict(ctx.obj))
+        for name in profiles
+    ]
+    results = run_concurrently(
+        [
+            in_context(profile_ctx, functools.partial(func, settings, profile_ctx))
+            for settings, profile_ctx in zip(profiles.values(), contexts)
+        ],
+        max_workers=len(profiles)
+    )
+    return [
+        (name, result, bool(profile_ctx.obj.get('from_cache')))
+        for name, result, profile_ctx in zip(profiles, results, contexts)
+    ]
+
+
+def build_api(cfg):
+    """Returns a TodoistAPI with no state that uses the shared session"""
+    # todoist pulls in requests and friends, so we only import it when we
+    # need to talk to the server.
+    with timing.phase('imports'):
+        import todoist.api
+        from francis.session import get_session
+        if use_item_store(cfg):
+            from francis.storeapi import StoreAPI as api_class
+        else:
+            api_class = todoist.api.TodoistAPI
+
+    api = api_class(
+        cfg['auth_token'], api_endpoint=get_api_endpoint(cfg), session=get_session(cfg),
+        cache=None
+    )
+    timing.watch_session(api.session)
+    return api
+
+
+def get_api(cfg, ctx, read_only=False, needs_network=False, before_sync=None, err=False):
+    """Builds a TodoistAPI and syncs it using the on-disk sync cache
+
+    If there's a usable cache, the sync only pulls the changes since the last
+    sync. If the cache is missing, corrupt or old or the user passed
+    ``--full-sync``, this does a full sync. Anything in the write queue gets
+    sent right after the sync.
+
+    With ``--offline``, commands work from the cached state without syncing.
+    Commands that only read also use the cached state if it's newer than
+    ``max_staleness``. If the sync fails, commands fall back to the cached
+    state; changes from commands that write go in the write queue (see
+    ``commit``).
+
+    :arg cfg: the config
+    :arg ctx: the click context
+    :arg read_only: whether the command only reads data
+    :arg needs_network: whether the command has to talk to Todoist after
+        syncing, so it can't work from the cache
+    :arg before_sync: (optional) function that's called with the api loaded
+        from the cache before it does an incremental sync; if it returns
+        True, the api syncs even if the cached state is new enough for a
+        command that only reads
+    :arg err: whether to write messages to stderr to keep them out of the
+        command's output
+
+    """
+    # requests is slow to import, so we only import it when we need to talk
+    # to the server.
+    with timing.phase('imports'):
+        import requests
+
+    api = ctx.obj.get('daemon_api')
+    if api is not None:
+        timing.watch_session(api.session)
+        # We're running in the daemon which keeps the api synced in the
+        # background. Commands that write sync first so they act on the
+        # latest items.
+        if not read_only:
+            try:
+                with timing.phase('sync'):
+                    sync_api(api)
+            except requests.exceptions.RequestException:
+                if needs_network:
+                    raise
+                echo('Couldn\'t reach Todoist.', err=err)
+                ctx.obj['from_cache'] = True
+                return api
+            flush_write_queue(cfg, api, err=err)
+            with timing.phase('cache'):
+                SyncCache.from_config(cfg).save(api)
+        return api
+
+    offline = ctx.obj.get('offline')
+    if offline and needs_network:
+        echo('ERROR: This command needs to talk to Todoist and can\'t '
+             'run with --offline.', err=err)
+        raise click.Abort()
+
+    api = build_api(cfg)
+    cache = SyncCache.from_config(cfg)
+
+    with timing.phase('cache'):
+        loaded = not ctx.obj.get('full_sync') and cache.load(api, check_age=False)
+    if loaded:
+        age = cache.age()
+        cached_token = api.sync_token
+        must_sync = not offline and before_sync is not None and before_sync(api)
+        if offline or (read_only and not must_sync and age <= get_max_staleness(cfg)):
+            use_cache(ctx, age, err=err)
+            return api
+
+    if offline:
+        echo('ERROR: There\'s no cached data to use offline. Run a '
+             'command online first.', err=err)
+        raise click.Abort()
+
+    if loaded and cache.max_age and cache.age() > cache.max_age:
+        # The cache is too old to trust for an incremental sync
+        api.reset_state()
+        loaded = False
+
+    try:
+        with timing.phase('sync'):
+            sync_api(api)
+    except requests.exceptions.RequestException:
+        if not loaded or needs_network:
+            raise
+        echo('Couldn\'t reach Todoist.', err=err)
+        # before_sync may have pointed the sync at an older token
+        api.sync_token = cached_token
+        use_cache(ctx, cache.age(), err=err)
+        return api
+
+    flush_write_queue(cfg, api, err=err)
+    with timing.phase('cache'):
+        cache.save(api)
+    return api
+
+
+def use_cache(ctx, age, err=False):
+    """Notes that the command is working from cached data"""
+    echo(click.style('[Offline: data synced %s ago]' % format_age(age), fg='yellow'), err=err)
+    echo('', err=err)
+    ctx.obj['from_cache'] = True
+
+
+def get_write_queue(cfg):
+    return WriteQueue(get_cache_dir(cfg), cfg['auth_token'])
+
+
+def flush_write_queue(cfg, api, err=False):
+    """Sends anything in the write queue to Todoist
+
+    :arg cfg: the config
+    :arg api: a synced TodoistAPI
+    :arg err: whether to write messages to stderr
+
+    """
+    import requests
+
+    write_queue = get_write_queue(cfg)
+    if not write_queue.read():
+        return
+
+    try:
+        with timing.phase('flush'):
+            sent, conflicts, errors = flush_queue(api, write_queue)
+    except requests.exceptions.RequestException:
+        echo('Couldn\'t send queued changes. They\'re still queued.', err=err)
+        return
+
+    if sent:
+        echo('Sent %d queued change(s) to Todoist.' % len(sent), err=err)
+    for entry, item_ids in conflicts:
+        echo('Skipped a queued change to #%s because it changed in Todoist '
+             'after the change was queued.' % ', #'.join(str(item_id) for item_id in item_ids),
+             err=err)
+    for uuid, error in errors:
+        echo('ERROR: Todoist rejected a queued change: %s' % (error,), err=err)
+
+
+def commit(cfg, ctx, api, history=()):
+    """Commits the api's pending commands or queues them for later
+
+    Once the commands are sent, the Actions go in the journal so they can be
+    undone. If we're working from cached data or can't reach Todoist, the
+    commands and the Actions that go with them are added to the write queue
+    instead. They get sent by "francis flush" or the next command that syncs.
+
+    :arg cfg: the config
+    :arg ctx: the click context
+    :arg api: the TodoistAPI with pending commands
+    :arg history: list of Actions the commands apply
+
+    :returns: True if the commands were sent, False if they were queued
+
+    """
+    import requests
+
+    if not api.queue:
+        return True
+
+    if not ctx.obj.get('from_cache'):
+        try:
+            with timing.phase('commit'):
+                api.commit()
+        except requests.exceptions.RequestException:
+            echo('Couldn\'t reach Todoist.')
+        else:
+            if history:
+                record_history(cfg, ctx, api, history)
+            return True
+
+    get_write_queue(cfg).append(api.queue, history)
+    del api.queue[:]
+    echo('Changes queued. Run "francis flush" to send them.')
+    return False
+
+
+def get_journal(cfg):
+    return Journal(get_cache_dir(cfg), cfg['auth_token'])
+
+
+def record_history(cfg, ctx, api, history):
+    """Adds committed Actions to the journal
+
+    Along with each Action we keep the item's seq_no after the commit. Undo
+    only reverses an Action if the item still has that seq_no.
+
+    """
+    actions = []
+    for action in history:
+        action_dict = action.to_dict()
+        item = api.items.get_by_id(action.item_id, only_local=True)
+        action_dict['seq_no_after'] = item.data.get('seq_no') if item is not None else None
+        actions.append(action_dict)
+    get_journal(cfg).append(ctx.info_name, actions)
+
+
 def display_priority(pri):
     if pri == 4:
         return 'H'
     return ''
 
 
-def display_project(proj):
-    if not proj or proj.data.get('inbox_project'):
-        return ''
-
-    return proj['name']
+def display_project_id(api, project_id):
+    return get_project_index(api).display_name(project_id)
 
 
 def get_project_by_name(api, name):
-    try:
-        return [p for p in api.projects.all() if p['name'].lower() == name.lower()][0]
-    except IndexError:
-        raise DoesNotExist
+    return get_project_index(api).get_by_name(name)
 
 
+# Format for the due_date_utc argument to item updates
+DUE_DATE_UTC_FORMAT = '%Y-%m-%dT%H:%M'
+
 PRIORITIES = {
     'h': 4,
     'l': 1,
 }
 DEFAULT_PRIORITY = 1
+# Todoist's own priorities, which francis exports have
+TODOIST_PRIORITIES = ('1', '2', '3', '4')
 
 
 def get_val(keyval):
@@ -110,9 +477,9 @@ def apply_changes(api, item, changes):
             try:
                 proj = get_project_by_name(api, new_val)
                 history.append(Action(item, 'project', item['project_id'], new_val))
-                item.move(proj['id'])
+                item.move(project_id=proj['id'])
             except DoesNotExist:
-                click.echo('ERROR: Project "%s" does not exist' % new_val)
+                echo('ERROR: Project "%s" does not exist' % new_val)
 
         elif change.startswith('due'):
             new_val = get_val(change)
@@ -120,9 +487,10 @@ def apply_changes(api, item, changes):
                 # FIXME: Seems like we can send date strings:
                 # https://support.todoist.com/hc/en-us/articles/205325931-Dates-and-Times
                 # item.update(date_string=parse_date(new_val))
+                history.append(Action(item, 'due', item.data.get('date_string'), new_val))
                 item.update(date_string=new_val)
             except ValueError:
-                click.echo('ERROR: "%s" is not a valid date' % new_val)
+                echo('ERROR: "%s" is not a valid date' % new_val)
 
         elif change.startswith('done'):
             new_val = get_val(change)
@@ -133,35 +501,236 @@ def apply_changes(api, item, changes):
                 history.append(Action(item, 'completed', '1', '0'))
                 item.uncomplete()
             else:
-                click.echo('ERROR: "%s" not a valid done value' % new_val)
+                echo('ERROR: "%s" not a valid done value' % new_val)
 
         else:
-            click.echo('ERROR: unknown change type')
+            echo('ERROR: unknown change type')
 
     return history
 
 
+def move_due_date(item, days):
+    """Moves an item's due date by days and keeps its date string
+
+    Setting the date string on a recurring item would make it a one-off, so
+    this changes the due date directly.
+
+    :returns: the Action applied
+
+    """
+    old_due = parse_api_datetime(item['due_date'])
+    new_due = old_due + datetime.timedelta(days=days)
+    action = Action(
+        item, 'due_date',
+        old_due.strftime(DUE_DATE_UTC_FORMAT), new_due.strftime(DUE_DATE_UTC_FORMAT)
+    )
+    item.update(due_date_utc=action.new_value, date_string=item['date_string'])
+    return action
+
+
 def get_by_id_suffix(api, obj_id_suffix):
-    # Based on GetByIdMixin.get_by_id
-    objs = [
-        obj for obj in api.items.state[api.items.state_name]
-        if str(obj['id']).endswith(obj_id_suffix) or obj.temp_id.endswith(obj_id_suffix)
-    ]
-    if not objs:
-        raise DoesNotExist
-    if len(objs) == 1:
-        return objs[0]
-    raise TooMany
+    result = get_by_id_suffixes(api, [obj_id_suffix])[0][1]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def get_by_id_suffixes(api, obj_id_suffixes):
+    """Looks up a batch of id suffixes
+
+    With an item store, the items in the store are searched too and a
+    match is taken out of the store.
+
+    :returns: list of (suffix, result) tuples where result is the item or a
+        DoesNotExist or TooMany instance
+
+    """
+    results = get_item_index(api).get_many(obj_id_suffixes)
+    store = get_item_store(api)
+    if store is not None:
+        results = [
+            find_stored_suffix(api, store, suffix, result)
+            for suffix, result in zip(obj_id_suffixes, results)
+        ]
+    return list(zip(obj_id_suffixes, results))
+
+
+def find_stored_suffix(api, store, suffix, result):
+    """Combines an id suffix lookup in the api's state with one in its store
+
+    :arg result: the item or the exception from looking in the state
+
+    """
+    if isinstance(result, TooMany):
+        return result
+
+    positions = store.find_id_suffix(suffix)
+    if not positions:
+        return result
+    if len(positions) > 1 or not isinstance(result, DoesNotExist):
+        return TooMany()
+    return api.items.get_by_id(store.ids[positions[0]], only_local=True)
+
+
+def get_day_queries(start, days):
+    """Returns one date query per day starting with start
+
+    Days in a later year than start have the year in them, since "jan 1" on
+    its own means January 1st of this year.
+
+    """
+    queries = ['today', 'tomorrow']
+    for i in range(2, days):
+        day = start + datetime.timedelta(days=i)
+        query = '%s %d' % (day.strftime('%b').lower(), day.day)
+        if day.year != start.year:
+            query = '%s %d' % (query, day.year)
+        queries.append(query)
+    return queries[:days]
+
+
+def with_profile(profile, row):
+    """Adds the profile column to a row if there is one"""
+    if profile is None:
+        return row
+    return (profile,) + tuple(row)
+
+
+def iter_section_lines(section, tasks):
+    """Yields the lines for one section of a query response
+
+    :arg section: the section dict from the query response
+    :arg tasks: list of (profile name, api, task dict) for the section; the
+        profile column is only shown for tasks with a profile name
+
+    """
+    yield '[%s]' % ('Over due' if section['type'] == 'overdue' else section['query'])
+    yield ''
+
+    if not tasks:
+        return
+
+    tasks = sorted(
+        tasks,
+        key=lambda entry: (entry[2]['due_date'], entry[2].get('date_string'))
+    )
+    for line in iter_task_lines(tasks):
+        yield line
+
+
+def iter_task_lines(tasks):
+    """Yields the lines of a table of tasks in the order they're in
+
+    :arg tasks: non-empty list of (profile name, api, task dict); the profile
+        column is only shown for tasks with a profile name
+
+    """
+    def rows():
+        header = ('id', 'pri', 'content', 'proj', 'due date')
+        yield with_profile('profile' if tasks[0][0] is not None else None, header)
+        for profile, api, task in tasks:
+            yield with_profile(profile, (
+                task['id'],
+                display_priority(task['priority']),
+                task['content'],
+                display_project_id(api, task['project_id']),
+                task['date_string'],
+            ))
+
+    for i, line in enumerate(iter_table_lines(get_terminal_width(), rows())):
+        if i >= 2 and i % 2 == 0:
+            line = click.style(line, fg='cyan', dim=True)
+        yield line
+
+
+def show_queries(ctx, apis, queries, spacer=False):
+    """Evaluates date queries and renders each section
+
+    Queries we understand are evaluated against the synced items without
+    another round trip. Anything else gets sent to the server unless we're
+    working from the cache.
+
+    With more than one account, each section has the items from all of
+    them.
+
+    :arg ctx: the click context
+    :arg apis: list of (profile name, synced TodoistAPI, from cache) from
+        ``map_profiles``
+    :arg queries: list of query strings
+    :arg spacer: whether to print a blank line after each section
+
+    """
+    responses = []
+    for profile, api, from_cache in apis:
+        try:
+            with timing.phase('query'):
+                resp = run_query(api, queries)
+        except ValueError as exc:
+            if from_cache:
+                echo('ERROR: %s' % exc)
+                raise click.Abort()
+            with timing.phase('query'):
+                resp = api.query(list(queries))
+        responses.append((profile, api, resp))
+
+    def lines():
+        for i, section in enumerate(responses[0][2]):
+            tasks = [
+                (profile, api, task)
+                for profile, api, resp in responses
+                for task in resp[i]['data']
+            ]
+            for line in iter_section_lines(section, tasks):
+                yield line
+            if spacer:
+                yield ''
+
+    write_lines(lines(), pager=ctx.obj.get('pager'))
+
+
+def start_profiling(ctx, destination):
+    """Times the command and reports it when the command is done
+
+    :arg ctx: the click context for the cli group
+    :arg destination: where to report; see ``timing.report``
+
+    """
+    profiler = timing.start()
+    if 'daemon_api' not in ctx.obj:
+        # In the daemon, everything was imported long ago
+        profiler.add('imports', IMPORTS_DONE - IMPORT_START)
+
+    def finish():
+        timing.report(timing.stop(), destination, stream=get_output())
+    ctx.call_on_close(finish)
 
 
 def click_run():
     sys.excepthook = exception_handler
+
+    # If there's a daemon running, it does the work with its warm state
+    exit_code = run_via_daemon(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     cli(obj={})
 
 
 @click.group(invoke_without_command=True)
+@click.option('--full-sync', is_flag=True, default=False,
+              help='Ignore the sync cache and download everything.')
+@click.option('--offline', is_flag=True, default=False,
+              help='Show data from the sync cache without talking to Todoist.')
+@click.option('--pager', is_flag=True, default=False,
+              help='Show long listings in your pager.')
+@click.option('--profile', is_flag=True, default=False,
+              help='Print how long each part of the command took to stderr.')
+@click.option('--use-profile', default=None, metavar='NAME',
+              help='Use the account and settings in the [NAME] section of ~/.francisrc.')
+@click.option('--all-profiles', is_flag=True, default=False,
+              help='Show items from every account in ~/.francisrc together.')
 @click.pass_context
-def cli(ctx):
+def cli(ctx, full_sync, offline, pager, profile, use_profile, all_profiles):
     """Todoist cli for Will's devious purposes.
 
     This cli is intended to promote MAXIMUM EFFORT!
@@ -169,22 +738,120 @@ def cli(ctx):
     Note: If invoked without a COMMAND, this does "francis list today".
 
     """
+    ctx.ensure_object(dict)
+    ctx.obj['full_sync'] = full_sync
+    ctx.obj['offline'] = offline
+    ctx.obj['pager'] = pager
+    ctx.obj['profile_name'] = use_profile
+    ctx.obj['all_profiles'] = all_profiles
+    if use_profile and all_profiles:
+        echo('ERROR: Use either --use-profile or --all-profiles.')
+        raise click.Abort()
+
+    # The daemon passes along the client's setting
+    if 'trace' in ctx.obj:
+        trace = ctx.obj['trace']
+    else:
+        trace = os.environ.get('FRANCIS_TRACE')
+    destination = timing.parse_trace_setting(trace)
+    if profile and destination is None:
+        destination = 'text'
+    if destination:
+        start_profiling(ctx, destination)
     if ctx.invoked_subcommand is None:
         ctx.invoke(list_cmd)
 
 
 @cli.command(name='undo')
+@click.argument('count', default=1, type=click.IntRange(1, None))
+@click.pass_context
+@add_config
+def undo_cmd(cfg, ctx, count):
+    """Undoes the last COUNT commands that changed items
+
+    Items that changed since the command are left alone.
+
+    """
+    journal = get_journal(cfg)
+    entries = journal.last(count)
+    if not entries:
+        echo('Nothing to undo.')
+        return
+
+    api = get_api(cfg, ctx)
+
+    # The seq_no we expect each item to have as we walk back through the
+    # entries. Once we've undone an entry's changes to an item, the next
+    # entry back should see the item as it was before that entry.
+    expected_seq_no = {}
+    skipped = set()
+    for entry in entries:
+        actions_by_item = {}
+        for action in entry['actions']:
+            actions_by_item.setdefault(action['item_id'], []).append(action)
+
+        for item_id, actions in actions_by_item.items():
+            item = api.items.get_by_id(item_id, only_local=True)
+            seq_no = expected_seq_no.get(item_id, item.data.get('seq_no') if item else None)
+            if (item is None or item_id in skipped or
+                    actions[0].get('seq_no_after') not in (None, seq_no)):
+                # Older entries can't be undone either
+                skipped.add(item_id)
+                echo('Skipped #%s because it changed after "%s".' % (
+                    item_id, entry['command']))
+                continue
+
+            for action in reversed(actions):
+                if undo_action(item, action):
+                    echo('Undid %s of #%s: %s.' % (
+                        action['field'], item_id, item['content']))
+            expected_seq_no[item_id] = actions[0].get('item_seq_no')
+
+    commit(cfg, ctx, api)
+    journal.pop(len(entries))
+    echo('Done!')
+
+
+@cli.command(name='flush')
 @click.pass_context
 @add_config
-def undo_cmd(cfg, ctx):
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+def flush_cmd(cfg, ctx):
+    """Sends changes queued while offline to Todoist"""
+    if ctx.obj.get('offline'):
+        echo('ERROR: Can\'t flush with --offline.')
+        raise click.Abort()
+
+    if not get_write_queue(cfg).read():
+        echo('Nothing to flush.')
+        return
+
+    # get_api flushes the write queue after it syncs
+    get_api(cfg, ctx, needs_network=True)
+    echo('Done!')
+
 
-    # FIXME: Get history, pop top item off, undo it
-    # undo_item =
-    # click.echo('undo item ...')
-    api.commit()
-    click.echo('Done!')
+@cli.command(name='daemon')
+@click.option('--refresh', default=DEFAULT_REFRESH, type=click.IntRange(0, None),
+              help='Seconds between background syncs; 0 turns them off.')
+@click.pass_context
+@add_config
+def daemon_cmd(cfg, ctx, refresh):
+    """Keeps your data synced in the background so commands are fast
+
+    While this is running, other francis commands hand their work to it over
+    a Unix socket instead of syncing themselves. Stop it with Ctrl-C.
+
+    """
+    if ctx.obj.get('offline'):
+        echo('ERROR: Can\'t run the daemon with --offline.')
+        raise click.Abort()
+
+    api = get_api(cfg, ctx)
+    try:
+        run_daemon(cfg, api, refresh)
+    except DaemonError as exc:
+        echo('ERROR: %s' % exc)
+        raise click.Abort()
 
 
 @cli.command(name='show')
@@ -193,21 +860,19 @@ def undo_cmd(cfg, ctx):
 @add_config
 def show_cmd(cfg, ctx, ids):
     """Shows one or more items"""
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+    api = get_api(cfg, ctx, read_only=True)
 
-    for item_id in ids.split(','):
-        try:
-            item = get_by_id_suffix(api, item_id)
-            click.echo('id:       %s' % item['id'])
-            click.echo('priority: %s' % display_priority(item['priority']))
-            click.echo('content:  %s' % item['content'])
-            click.echo('project:  %s' % display_project(api.projects.get_by_id(item['project_id'])))
-            click.echo('due:      %s' % item['date_string'])
-        except DoesNotExist:
-            click.echo('"%s" does not exist.' % item_id)
-        except TooMany:
-            click.echo('"%s" matches multiple items.' % item_id)
+    for item_id, item in get_by_id_suffixes(api, ids.split(',')):
+        if isinstance(item, DoesNotExist):
+            echo('"%s" does not exist.' % item_id)
+        elif isinstance(item, TooMany):
+            echo('"%s" matches multiple items.' % item_id)
+        else:
+            echo('id:       %s' % item['id'])
+            echo('priority: %s' % display_priority(item['priority']))
+            echo('content:  %s' % item['content'])
+            echo('project:  %s' % display_project_id(api, item['project_id']))
+            echo('due:      %s' % item['date_string'])
 
 
 @cli.command(name='deferall')
@@ -220,57 +885,79 @@ def deferall_cmd(cfg, ctx):
     EVERYTHING DUE TODAY. Don't use it if you're squeamish!
 
     """
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
-
-    # Note: This will only change things with a date string equal to today
-    # formatted as "MMM DD". It won't cover recurring tasks or other things.
-    today = datetime.date.today().strftime('%b %d')
+    api = get_api(cfg, ctx)
 
     history = []
-    for item in api.items.state[api.items.state_name]:
-        if item['date_string'] == today:
+    for item in get_due_index(api).get(datetime.date.today()):
+        if is_recurring(item):
+            history.append(move_due_date(item, days=1))
+        else:
             history.extend(apply_changes(api, item, ['due:tomorrow']))
 
-    api.commit()
-    click.echo('Done!')
+    commit(cfg, ctx, api, history)
+    echo('Done!')
 
 
-def _add(api, mods):
+def get_add_kwargs(api, project=None, priority=None, due=None):
+    """Works out the items.add arguments for a new task
+
+    :arg api: a synced TodoistAPI
+    :arg project: (optional) project name; defaults to the Inbox
+    :arg priority: (optional) priority like "H" or "L" or a Todoist priority
+        from "1" to "4"
+    :arg due: (optional) Todoist date string; defaults to today
+
+    :returns: dict of keyword arguments for ``api.items.add``
+
+    :raises ValueError: if the project or priority doesn't exist
+
+    """
     kwargs = {
-        'date_string': 'today'
+        'date_string': due or 'today',
     }
-    project_id = get_project_by_name(api, 'Inbox')
+
+    if priority in TODOIST_PRIORITIES:
+        kwargs['priority'] = int(priority)
+    elif priority:
+        try:
+            kwargs['priority'] = PRIORITIES[priority.lower()[0]]
+        except KeyError:
+            raise ValueError('pri "%s" does not exist. Try H or L.' % priority)
+
+    try:
+        kwargs['project_id'] = get_project_by_name(api, project or 'Inbox')['id']
+    except DoesNotExist:
+        raise ValueError('"%s" is not a project.' % project)
+
+    return kwargs
+
+
+def _add(api, mods):
+    fields = {}
     text = []
 
     for item in mods:
         if item.startswith('pri') and ':' in item:
-            val = get_val(item)
-            try:
-                kwargs['priority'] = PRIORITIES[val.lower()[0]]
-            except KeyError:
-                click.echo('ERROR: pri "%s" does not exist. Try H or L.' % val)
-                raise click.Abort()
-
+            fields['priority'] = get_val(item)
         elif item.startswith('proj') and ':' in item:
-            val = get_val(item)
-            try:
-                project_id = get_project_by_name(api, val)['id']
-            except DoesNotExist:
-                click.echo('ERROR: "%s" is not a project.' % val)
-                raise click.Abort()
+            fields['project'] = get_val(item)
         elif item.startswith('due') and ':' in item:
-            val = get_val(item)
-            kwargs['date_string'] = val
+            fields['due'] = get_val(item)
         else:
             text.append(item)
 
+    try:
+        kwargs = get_add_kwargs(api, **fields)
+    except ValueError as exc:
+        echo('ERROR: %s' % exc)
+        raise click.Abort()
+
     if not text:
-        click.echo('ERROR: No task summary text.')
+        echo('ERROR: No task summary text.')
         raise click.Abort()
 
     text = ' '.join(text)
-    return api.items.add(text, project_id, **kwargs)
+    return api.items.add(text, **kwargs)
 
 
 @cli.command(name='add')
@@ -288,14 +975,13 @@ def add_cmd(cfg, ctx, mods):
     * francis add "gotta make $$$!"
 
     """
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+    api = get_api(cfg, ctx)
 
     item = _add(api, mods)
 
-    api.commit()
-    click.echo('Task created #%s: %s.' % (item['id'], item['content']))
-    click.echo('Done!')
+    commit(cfg, ctx, api)
+    echo('Task created #%s: %s.' % (item['id'], item['content']))
+    echo('Done!')
 
 
 @cli.command(name='log')
@@ -304,20 +990,144 @@ def add_cmd(cfg, ctx, mods):
 @add_config
 def log_cmd(cfg, ctx, mods):
     """Adds a task and marks it complete in one step"""
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+    api = get_api(cfg, ctx)
 
     item = _add(api, mods)
 
-    api.commit()
+    # Commit the add first so the item has a real id. If we're working from
+    # the cache, the add and the complete get queued together.
+    if not ctx.obj.get('from_cache'):
+        commit(cfg, ctx, api)
 
     history = []
     history.extend(apply_changes(api, item, ['done:1']))
 
-    api.commit()
+    commit(cfg, ctx, api, history)
+
+    echo('Task logged #%s: %s.' % (item['id'], item['content']))
+    echo('Done!')
+
+
+@cli.command(name='import')
+@click.argument('infile', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv']), default=None,
+              help='File format; guessed from the filename if not given.')
+@click.option('--batch-size', default=MAX_BATCH_SIZE,
+              type=click.IntRange(1, MAX_BATCH_SIZE),
+              help='Number of tasks to send to Todoist at a time.')
+@click.pass_context
+@add_config
+def import_cmd(cfg, ctx, infile, fmt, batch_size):
+    """Adds tasks from a file
+
+    INFILE can be a taskwarrior export ("task export"), a JSONL file or a CSV
+    file with a header row. Use "-" for stdin. Records can have content (or
+    description), project, priority and due fields. Files from "francis
+    export" work too.
+
+    Tasks that already exist in the same project are skipped, as are
+    completed and deleted tasks.
+
+    Examples:
+
+    \b
+    * task export | francis import -
+    * francis import tasks.csv
+
+    """
+    api = get_api(cfg, ctx)
+
+    existing = ContentIndex(api.items.all())
+    records = iter_records(infile, fmt or guess_format(infile.name))
+
+    added = 0
+    duplicates = 0
+    failed = 0
+    pending = 0
+    try:
+        for num, record in enumerate(records, 1):
+            try:
+                task = record_to_task(record)
+                if task is None:
+                    continue
+                content = task.pop('content')
+                kwargs = get_add_kwargs(api, **task)
+            except ValueError as exc:
+                echo('ERROR: Record %d: %s' % (num, exc))
+                failed += 1
+                continue
+
+            if existing.contains(content, kwargs['project_id']):
+                duplicates += 1
+                continue
+            existing.add(content, kwargs['project_id'])
+
+            api.items.add(content, **kwargs)
+            pending += 1
+            if pending >= batch_size:
+                commit(cfg, ctx, api)
+                added += pending
+                pending = 0
+
+    except ValueError as exc:
+        # The file is broken from here on, but what we've read is fine
+        echo('ERROR: %s' % exc)
+        failed += 1
+
+    commit(cfg, ctx, api)
+    added += pending
+
+    echo('Imported %d task(s). Skipped %d duplicate(s).' % (added, duplicates))
+    if failed:
+        echo('%d record(s) could not be imported.' % failed)
+    echo('Done!')
+
+
+@cli.command(name='export')
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_WRITERS)), default='jsonl',
+              help='Output format.')
+@click.option('--output', '-o', 'outfile', type=click.File('w'), default='-',
+              help='File to write to; defaults to stdout.')
+@click.option('--completed/--no-completed', default=True,
+              help='Whether to include completed history.')
+@click.option('--since', default=None,
+              help='Only include history completed on or after this date.')
+@click.pass_context
+@add_config
+def export_cmd(cfg, ctx, fmt, outfile, completed, since):
+    """Exports active items and completed history
+
+    Records are written as they're fetched, so exporting years of history
+    doesn't need much memory.
+
+    Examples:
+
+    \b
+    * francis export > todoist.jsonl
+    * francis export --format=csv -o todoist.csv --since=2016-01-01
+
+    """
+    if since is not None:
+        try:
+            since = local_to_utc(parse_date(since))
+        except ValueError:
+            echo('ERROR: "%s" is not a valid date' % since, err=True)
+            raise click.Abort()
+
+    # Anything get_api has to say goes to stderr so it doesn't end up in the
+    # export.
+    api = get_api(cfg, ctx, read_only=not completed, needs_network=completed, err=True)
 
-    click.echo('Task logged #%s: %s.' % (item['id'], item['content']))
-    click.echo('Done!')
+    def records():
+        for record in iter_item_records(api):
+            yield record
+        if completed:
+            events = iter_completed(api, since, None)
+            for record in iter_completed_records(api, events):
+                yield record
+
+    count = EXPORT_WRITERS[fmt](records(), outfile)
+    echo('Exported %d record(s).' % count, err=True)
 
 
 @cli.command(name='modify')
@@ -327,25 +1137,21 @@ def log_cmd(cfg, ctx, mods):
 @add_config
 def modify_cmd(cfg, ctx, ids, changes):
     """Modify one or more items"""
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+    api = get_api(cfg, ctx)
 
     history = []
 
-    for item_id in ids.split(','):
-        try:
-            item = get_by_id_suffix(api, item_id)
+    for item_id, item in get_by_id_suffixes(api, ids.split(',')):
+        if isinstance(item, DoesNotExist):
+            echo('Task "%s" does not exist.' % item_id)
+        elif isinstance(item, TooMany):
+            echo('"%s" matches multiple items.' % item_id)
+        else:
             history.extend(apply_changes(api, item, changes))
-            click.echo('Applied changes to #%s: %s.' % (item['id'], item['content']))
-        except DoesNotExist:
-            click.echo('Task "%s" does not exist.' % item_id)
-        except TooMany:
-            click.echo('"%s" matches multiple items.' % item_id)
-
-    # FIXME: Update history.
+            echo('Applied changes to #%s: %s.' % (item['id'], item['content']))
 
-    api.commit()
-    click.echo('Done!')
+    commit(cfg, ctx, api, history)
+    echo('Done!')
 
 
 @cli.command(name='done')
@@ -354,20 +1160,21 @@ def modify_cmd(cfg, ctx, ids, changes):
 @add_config
 def done_cmd(cfg, ctx, ids):
     """Mark one or more items as done"""
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+    api = get_api(cfg, ctx)
 
     history = []
 
-    for item_id in ids.split(','):
-        item = get_by_id_suffix(api, item_id)
-        history.extend(apply_changes(api, item, ['done:1']))
-        click.echo('Marked as done #%s: %s.' % (item['id'], item['content']))
-
-    # FIXME: Update history.
+    for item_id, item in get_by_id_suffixes(api, ids.split(',')):
+        if isinstance(item, DoesNotExist):
+            echo('Task "%s" does not exist.' % item_id)
+        elif isinstance(item, TooMany):
+            echo('"%s" matches multiple items.' % item_id)
+        else:
+            history.extend(apply_changes(api, item, ['done:1']))
+            echo('Marked as done #%s: %s.' % (item['id'], item['content']))
 
-    api.commit()
-    click.echo('Done!')
+    commit(cfg, ctx, api, history)
+    echo('Done!')
 
 
 @cli.command(name='today')
@@ -388,7 +1195,8 @@ def tomorrow_cmd(ctx):
 
 @cli.command(name='thisweek')
 @click.pass_context
-def thisweek_cmd(ctx):
+@add_config
+def thisweek_cmd(cfg, ctx):
     """Shows this week"""
     MON, TUE, WED, THU, FRI, SAT, SUN = range(7)
     LOOKUP = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
@@ -400,9 +1208,27 @@ def thisweek_cmd(ctx):
             # days.append('+%s day' % (i - today))
             days.append(LOOKUP[i])
 
-    for day in days:
-        ctx.invoke(list_cmd, query=[day])
-        click.echo('')
+    apis = map_profiles(cfg, ctx, lambda cfg, ctx: get_api(cfg, ctx, read_only=True))
+    show_queries(ctx, apis, days, spacer=True)
+
+
+@cli.command(name='agenda')
+@click.option('--days', default=7, type=click.IntRange(1, 366),
+              help='Number of days to show including today.')
+@click.pass_context
+@add_config
+def agenda_cmd(cfg, ctx, days):
+    """Shows the next DAYS days
+
+    Examples:
+
+    \b
+    * francis agenda
+    * francis agenda --days=3
+
+    """
+    apis = map_profiles(cfg, ctx, lambda cfg, ctx: get_api(cfg, ctx, read_only=True))
+    show_queries(ctx, apis, get_day_queries(datetime.date.today(), days), spacer=True)
 
 
 @cli.command(name='timesheet')
@@ -410,45 +1236,62 @@ def thisweek_cmd(ctx):
 @add_config
 def timesheet_cmd(cfg, ctx):
     """Shows timesheet for the week"""
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
-
-    marker = pendulum.today()
-    while marker.day_of_week != 0:
-        marker = marker.add(days=-1)
-
-    click.echo('Timesheet week of %s' % marker.strftime('%c'))
-    click.echo('')
-
-    for i in range(7):
-        begin_time = marker.start_of('day').in_timezone('UTC')
-        end_time = marker.end_of('day').in_timezone('UTC')
-
-        activity = api.completed.get_all(
-            since=begin_time.strftime('%Y-%m-%dT%H:%M'),
-            until=end_time.strftime('%Y-%m-%dT%H:%M'),
-            limit=50
-        )
-
-        click.echo('[%s: %s]' % (marker.strftime('%A (%Y-%m-%d)'), len(activity['items'])))
-        click.echo('')
-        table = [
-            ('id', 'content', 'proj')
-        ]
-        for event in activity['items']:
-            table.append(
-                (
+    # Weeks start on Sunday
+    week_start = today()
+    week_start = week_start - datetime.timedelta(days=week_start.isoweekday() % 7)
+    week_end = week_start + datetime.timedelta(days=6, hours=23, minutes=59)
+
+    def fetch(cfg, ctx):
+        if ctx.obj.get('offline'):
+            # This tells the user the timesheet needs the network
+            get_api(cfg, ctx, needs_network=True)
+
+        # The completed items don't depend on the sync, so they're fetched
+        # with their own api at the same time
+        completed_api = build_api(cfg)
+        return run_concurrently([
+            in_context(ctx, lambda: get_api(cfg, ctx, needs_network=True)),
+            lambda: list(iter_completed(
+                completed_api, local_to_utc(week_start), local_to_utc(week_end)
+            )),
+        ])
+
+    # Fetch the whole week in one go and then bucket items by local day
+    days = [[] for i in range(7)]
+    for profile, (api, completed), from_cache in map_profiles(cfg, ctx, fetch):
+        for event in completed:
+            completed_date = utc_to_local(parse_api_datetime(event['completed_date']))
+            day = (completed_date.date() - week_start.date()).days
+            if 0 <= day < 7:
+                days[day].append((profile, api, event))
+
+    def lines():
+        yield 'Timesheet week of %s' % week_start.strftime('%c')
+        yield ''
+
+        width = get_terminal_width() - 2
+        for i, events in enumerate(days):
+            marker = week_start + datetime.timedelta(days=i)
+            yield '[%s: %s]' % (marker.strftime('%A (%Y-%m-%d)'), len(events))
+            yield ''
+
+            header = with_profile(
+                'profile' if ctx.obj.get('all_profiles') else None, ('id', 'content', 'proj')
+            )
+            rows = [header]
+            rows.extend(
+                with_profile(profile, (
                     event['task_id'],
                     event['content'],
-                    display_project(api.projects.get_by_id(event['project_id'])),
-                )
+                    display_project_id(api, event['project_id']),
+                ))
+                for profile, api, event in events
             )
+            for line in iter_table_lines(width, rows):
+                yield '  ' + line
+            yield ''
 
-        table = prettytable(click.get_terminal_size()[0] - 2, table)
-        for row in table.splitlines():
-            click.echo('  ' + row)
-        click.echo('')
-        marker = marker.add(days=1)
+    write_lines(lines(), pager=ctx.obj.get('pager'))
 
 
 @cli.command(name='overdue')
@@ -474,69 +1317,75 @@ def list_cmd(cfg, ctx, query):
     * francis list tomorrow
     * francis list friday
     * francis list "july 22"
+    * francis list eom +3d
     * francis list "over due"
 
     """
-    api = todoist.api.TodoistAPI(cfg['auth_token'])
-    api.sync()
+    apis = map_profiles(cfg, ctx, lambda cfg, ctx: get_api(cfg, ctx, read_only=True))
 
     if not query:
         query = ['today']
 
-    resp = api.query(query)
-    for item in resp:
-        if item['type'] == 'overdue':
-            item['query'] = 'Over due'
+    show_queries(ctx, apis, query)
 
-        click.echo('[%s]' % item['query'])
-        click.echo('')
 
-        if not item['data']:
-            continue
+@cli.command(name='search')
+@click.argument('terms', nargs=-1, required=True)
+@click.option('--limit', default=DEFAULT_LIMIT, type=click.IntRange(1, None),
+              help='Most items to show.')
+@click.pass_context
+@add_config
+def search_cmd(cfg, ctx, terms, limit):
+    """Find active items by the words in their content or project name
 
-        table = [
-            ('id', 'pri', 'content', 'proj', 'due date')
-        ]
-        data = sorted(
-            item['data'],
-            key=lambda item: (item['due_date'], item.get('date_string'))
-        )
-
-        for task in data:
-            table.append(
-                (
-                    task['id'],
-                    display_priority(task['priority']),
-                    task['content'],
-                    display_project(api.projects.get_by_id(task['project_id'])),
-                    task['date_string'],
-                )
-            )
+    Every term has to match a word in the item's content or its project's
+    name or the start of one. The best matches come first.
 
-        table = prettytable(click.get_terminal_size()[0], table)
-        for i, line in enumerate(table.splitlines()):
-            if i < 2:
-                click.echo(line)
-            elif i % 2 == 0:
-                click.secho(line, fg='cyan', dim=True)
-            else:
-                click.echo(line)
+    Examples:
+
+    \b
+    * francis search dentist
+    * francis search proj work
+    * francis search invoi acme
+
+    """
+    search_cache = SearchCache.from_config(cfg)
+    api = get_api(cfg, ctx, read_only=True, before_sync=search_cache.before_sync)
+
+    with timing.phase('index'):
+        index = get_search_index(api, search_cache)
+    with timing.phase('query'):
+        item_ids = index.search(' '.join(terms), limit=limit)
+        found = get_item_data(api, item_ids)
+
+    if index.dirty and 'daemon_api' not in ctx.obj:
+        # The daemon's state is newer than the sync cache, so it keeps its
+        # index to itself
+        with timing.phase('cache'):
+            search_cache.save(index, api.sync_token)
+
+    tasks = [(None, api, found[item_id]) for item_id in item_ids if item_id in found]
+    if not tasks:
+        echo('No items match.')
+        return
+
+    write_lines(iter_task_lines(tasks), pager=ctx.obj.get('pager'))
 
 
 def exception_handler(exc_type, exc_value, exc_tb):
-    click.echo('Oh no! Francis has thrown an error while trying to do stuff.')
-    click.echo('Please write up a bug report with the specifics so that ')
-    click.echo('we can fix it.')
-    click.echo('')
-    click.echo('https://github.com/willkg/francis/issues')
-    click.echo('')
-    click.echo('Here is some information you can copy and paste into the ')
-    click.echo('bug report:')
-    click.echo('')
-    click.echo('---')
-    click.echo('Francis: %s' % repr(__version__))
-    click.echo('Python: %s' % repr(sys.version))
-    click.echo('Command line: %s' % sys.argv)
-    click.echo(
+    echo('Oh no! Francis has thrown an error while trying to do stuff.')
+    echo('Please write up a bug report with the specifics so that ')
+    echo('we can fix it.')
+    echo('')
+    echo('https://github.com/willkg/francis/issues')
+    echo('')
+    echo('Here is some information you can copy and paste into the ')
+    echo('bug report:')
+    echo('')
+    echo('---')
+    echo('Francis: %s' % repr(__version__))
+    echo('Python: %s' % repr(sys.version))
+    echo('Command line: %s' % sys.argv)
+    echo(
         ''.join(traceback.format_exception(exc_type, exc_value, exc_tb)))
-    click.echo('---')
+    echo('---')
@@ -0,0 +1,350 @@
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    # Python 2
+    import SocketServer as socketserver
+
+from francis.cache import (
+    SyncCache,
+    cache_key,
+    get_cache_dir,
+)
+from francis.index import clear_cached_indexes, sync
+from francis.output import get_terminal_width
+from francis.util import (
+    ConfigFileMissingError,
+    get_config,
+    get_profile,
+)
+
+
+# Seconds between background syncs
+DEFAULT_REFRESH = 60
+
+# Seconds the client waits for the daemon before giving up on it
+CONNECT_TIMEOUT = 1.0
+COMMAND_TIMEOUT = 300.0
+
+# Commands and options that mean the command has to run in this process: the
+# daemon itself, things that are about the local cache, the pager which
+# needs our terminal, help and commands that read our files.
+LOCAL_ONLY_COMMANDS = set(['daemon', 'import', 'export'])
+LOCAL_ONLY_OPTIONS = set(['--offline', '--full-sync', '--pager', '--all-profiles', '--help'])
+
+# Options of the francis group that take a value
+VALUE_OPTIONS = set(['--use-profile'])
+
+
+class DaemonError(Exception):
+    pass
+
+
+def get_socket_path(cfg):
+    """Returns the path for the daemon's Unix socket"""
+    if cfg.get('daemon_socket'):
+        return os.path.expanduser(cfg['daemon_socket'])
+    return os.path.join(get_cache_dir(cfg), 'daemon-%s.sock' % cache_key(cfg['auth_token']))
+
+
+def get_profile_arg(argv):
+    """Returns the --use-profile value in the arguments or None"""
+    for i, arg in enumerate(argv):
+        if arg == '--use-profile' and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith('--use-profile='):
+            return arg.split('=', 1)[1]
+    return None
+
+
+def runs_locally(argv):
+    """Returns whether the command line has to run in this process
+
+    Only the options before the command, the command name and options after
+    it count, so "francis add export taxes" can still go to the daemon.
+
+    """
+    args = iter(argv)
+    for arg in args:
+        if arg in LOCAL_ONLY_OPTIONS:
+            return True
+        if arg in VALUE_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            if arg in LOCAL_ONLY_COMMANDS:
+                return True
+            break
+
+    # Help for the command; click shows it for --help anywhere before "--"
+    for arg in args:
+        if arg == '--':
+            break
+        if arg == '--help':
+            return True
+    return False
+
+
+def _read_message(fp):
+    line = fp.readline()
+    if not line:
+        raise DaemonError('connection closed')
+    return json.loads(line.decode('utf-8'))
+
+
+def _write_message(fp, message):
+    fp.write((json.dumps(message) + '\n').encode('utf-8'))
+    fp.flush()
+
+
+def send_command(path, argv, color=False, width=None, trace=None):
+    """Runs a francis command in the daemon
+
+    :arg path: path to the daemon's socket
+    :arg argv: command line arguments without the program name
+    :arg color: whether the output should include colors
+    :arg width: (optional) width of the terminal to lay tables out for
+    :arg trace: (optional) the ``FRANCIS_TRACE`` setting for the command
+
+    :returns: (output, exit_code)
+
+    :raises socket.error: if we can't connect to the daemon; nothing has run
+        yet, so it's safe to run the command locally instead
+    :raises DaemonError: if something went wrong after the daemon got the
+        command; it may have run, so it's not safe to run it again
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+
+        sock.settimeout(COMMAND_TIMEOUT)
+        fp = sock.makefile('rwb')
+        try:
+            _write_message(fp, {
+                'argv': list(argv), 'color': color, 'width': width, 'trace': trace,
+            })
+            resp = _read_message(fp)
+        except (socket.error, ValueError) as exc:
+            raise DaemonError(str(exc))
+        finally:
+            fp.close()
+    finally:
+        sock.close()
+
+    return resp['output'], resp['exit_code']
+
+
+def run_via_daemon(argv):
+    """Runs the command in the daemon if there's one running
+
+    :arg argv: command line arguments without the program name
+
+    :returns: the exit code or None if the command should run locally
+
+    """
+    if runs_locally(argv):
+        return None
+
+    # Each profile's daemon has its own socket
+    try:
+        cfg = get_profile(get_config(), get_profile_arg(argv))
+    except (ConfigFileMissingError, ValueError):
+        return None
+    if 'auth_token' not in cfg:
+        return None
+
+    path = get_socket_path(cfg)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        output, exit_code = send_command(
+            path, argv, color=sys.stdout.isatty(), width=get_terminal_width(),
+            trace=os.environ.get('FRANCIS_TRACE'),
+        )
+    except socket.error:
+        # The daemon isn't running; the socket file is left over
+        return None
+    except DaemonError as exc:
+        sys.stderr.write('francis daemon failed: %s\n' % exc)
+        return 1
+
+    sys.stdout.write(output)
+    sys.stdout.flush()
+    return exit_code
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = _read_message(self.rfile)
+        except (DaemonError, ValueError):
+            return
+
+        output, exit_code = self.server.run_command(
+            request.get('argv', []), bool(request.get('color')),
+            width=request.get('width'), trace=request.get('trace'),
+        )
+        _write_message(self.wfile, {'output': output, 'exit_code': exit_code})
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """Keeps a synced TodoistAPI in memory and runs commands against it
+
+    Requests are handled one at a time. Commands run with the warm api in
+    ``ctx.obj['daemon_api']`` and their output is captured and sent back to
+    the client. A background thread syncs the api every ``refresh`` seconds
+    so reads don't have to.
+
+    """
+    def __init__(self, path, api, cache=None, refresh=DEFAULT_REFRESH):
+        self.path = path
+        self.api = api
+        self.cache = cache
+        self.refresh = refresh
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
+
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                # Left over from a daemon that didn't clean up
+                os.remove(path)
+            else:
+                raise DaemonError('a daemon is already listening on %s' % path)
+            finally:
+                probe.close()
+
+        # The socket is private from the moment it's bound; anyone who can
+        # connect to it can change the account
+        old_umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, DaemonRequestHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(path, 0o600)
+
+    def run_command(self, argv, color, width=None, trace=None):
+        """Runs a command against the api and returns what it wrote
+
+        The command writes to a buffer passed in ``ctx.obj['output']``
+        rather than stdout, so nothing else in the process ends up in it.
+        If the command fails, whatever it did to the api is thrown away (see
+        ``reset``).
+
+        :arg argv: command line arguments without the program name
+        :arg color: whether the output should include colors
+        :arg width: (optional) width of the client's terminal
+        :arg trace: (optional) the client's ``FRANCIS_TRACE`` setting
+
+        :returns: (output, exit_code)
+
+        """
+        # Imported here because francis.cmdline imports this module
+        import click
+        from francis.cmdline import cli
+
+        output = io.StringIO()
+        obj = {
+            'daemon_api': self.api,
+            'output': output,
+            'terminal_width': width,
+            'trace': trace,
+        }
+        with self.lock:
+            exit_code = 0
+            try:
+                cli.main(
+                    args=list(argv),
+                    prog_name='francis',
+                    obj=obj,
+                    standalone_mode=False,
+                    color=color,
+                )
+            except click.exceptions.Exit as exc:
+                exit_code = exc.exit_code
+            except click.exceptions.Abort:
+                exit_code = 1
+            except click.ClickException as exc:
+                exc.show(file=output)
+                exit_code = exc.exit_code
+            except Exception:
+                traceback.print_exc(file=output)
+                exit_code = 1
+
+            if exit_code:
+                self.reset()
+
+        return output.getvalue(), exit_code
+
+    def reset(self):
+        """Throws away changes a failed command left in the api
+
+        The command may have changed items or left commands in the queue
+        that the next command would commit. The api goes back to the state
+        in the sync cache and syncs from there.
+
+        """
+        del self.api.queue[:]
+        clear_cached_indexes(self.api)
+        self.api.reset_state()
+        if self.cache is not None:
+            self.cache.load(self.api)
+        try:
+            sync(self.api)
+        except Exception:
+            # The background sync tries again later
+            traceback.print_exc()
+
+    def refresh_forever(self):
+        while not self.stopping.wait(self.refresh):
+            try:
+                with self.lock:
+                    sync(self.api)
+                    if self.cache is not None:
+                        self.cache.save(self.api)
+            except Exception:
+                traceback.print_exc()
+
+    def run(self):
+        """Serves requests until interrupted"""
+        if self.refresh:
+            thread = threading.Thread(target=self.refresh_forever)
+            thread.daemon = True
+            thread.start()
+
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopping.set()
+        self.server_close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def run_daemon(cfg, api, refresh=DEFAULT_REFRESH):
+    """Runs the daemon for the account in cfg until interrupted"""
+    path = get_socket_path(cfg)
+    daemon = Daemon(path, api, SyncCache.from_config(cfg), refresh)
+    sys.stdout.write('francis daemon listening on %s (started %s)\n' % (
+        path, time.strftime('%Y-%m-%d %H:%M:%S')))
+    sys.stdout.flush()
+    daemon.run()
@@ -0,0 +1,113 @@
+import csv
+import json
+
+from francis.index import get_project_index
+from francis.store import iter_item_data
+from francis.util import parse_api_datetime
+
+
+# Columns for CSV exports; JSONL records have the same keys
+EXPORT_FIELDS = [
+    'type',
+    'id',
+    'content',
+    'project',
+    'priority',
+    'due_date',
+    'date_string',
+    'completed_date',
+]
+
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def to_iso(text):
+    """Converts a Todoist timestamp to ISO 8601 UTC
+
+    Anything we can't parse is passed along as is.
+
+    """
+    if not text:
+        return None
+    try:
+        return parse_api_datetime(text).strftime(ISO_FORMAT)
+    except ValueError:
+        return text
+
+
+def _project_name(index, project_id):
+    proj = index.get_by_id(project_id)
+    return proj['name'] if proj is not None else None
+
+
+def iter_item_records(api):
+    """Yields an export record for every active item"""
+    index = get_project_index(api)
+    for data in iter_item_data(api):
+        if data.get('checked') or data.get('is_deleted'):
+            continue
+        yield {
+            'type': 'item',
+            'id': data['id'],
+            'content': data['content'],
+            'project': _project_name(index, data.get('project_id')),
+            'priority': data.get('priority'),
+            'due_date': to_iso(data.get('due_date')),
+            'date_string': data.get('date_string'),
+            'completed_date': None,
+        }
+
+
+def iter_completed_records(api, events):
+    """Yields an export record for every completed item event
+
+    :arg api: a TodoistAPI for looking up project names
+    :arg events: iterable of items from completed/get_all
+
+    """
+    index = get_project_index(api)
+    for event in events:
+        yield {
+            'type': 'completed',
+            'id': event['task_id'],
+            'content': event['content'],
+            'project': _project_name(index, event.get('project_id')),
+            'priority': None,
+            'due_date': None,
+            'date_string': None,
+            'completed_date': to_iso(event.get('completed_date')),
+        }
+
+
+def write_jsonl(records, fp):
+    """Writes records to fp one JSON object per line
+
+    :returns: number of records written
+
+    """
+    count = 0
+    for record in records:
+        fp.write(json.dumps(record, sort_keys=True) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(records, fp):
+    """Writes records to fp as CSV with a header row
+
+    :returns: number of records written
+
+    """
+    writer = csv.DictWriter(fp, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+WRITERS = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+}
@@ -0,0 +1,163 @@
+import csv
+import datetime
+import json
+
+from francis.util import utc_to_local
+
+
+# Number of characters to read at a time when streaming JSON
+READ_SIZE = 64 * 1024
+
+# Taskwarrior's export date format, which is always UTC
+TASKWARRIOR_DATE_FORMAT = '%Y%m%dT%H%M%SZ'
+
+# Taskwarrior statuses for tasks that don't need importing
+SKIP_STATUSES = ('completed', 'deleted')
+
+# francis export record types that don't need importing
+SKIP_TYPES = ('completed',)
+
+
+def guess_format(filename):
+    """Guesses the import format from the filename"""
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'json'
+
+
+def iter_json_records(fp, read_size=READ_SIZE):
+    """Yields JSON objects from fp without reading it all in first
+
+    This handles both a JSON array of objects (what ``task export`` produces)
+    and one object per line (JSONL and older taskwarrior exports).
+
+    :raises ValueError: if the file has something other than JSON objects in
+        it
+
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    while True:
+        # Skip whitespace and the array punctuation between objects
+        while pos < len(buf) and buf[pos] in ' \t\r\n[],':
+            pos += 1
+
+        if pos == len(buf) or buf[pos] == '{':
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # We probably only have part of the object, so get some more
+                if eof:
+                    if pos == len(buf):
+                        return
+                    raise ValueError('invalid JSON near "%s"' % buf[pos:pos + 40])
+                chunk = fp.read(read_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+        else:
+            raise ValueError('expected an object near "%s"' % buf[pos:pos + 40])
+
+        pos = end
+        yield record
+
+
+def iter_csv_records(fp):
+    """Yields a dict for each row in a CSV file with a header row
+
+    Column names are lowercased.
+
+    """
+    reader = csv.reader(fp)
+    try:
+        header = [name.strip().lower() for name in next(reader)]
+    except StopIteration:
+        return
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        yield dict(zip(header, row))
+
+
+def iter_records(fp, fmt):
+    """Yields the records in fp
+
+    :arg fp: file-like object opened in text mode
+    :arg fmt: "json" or "csv"
+
+    """
+    if fmt == 'csv':
+        return iter_csv_records(fp)
+    return iter_json_records(fp)
+
+
+def convert_due(due):
+    """Converts a taskwarrior due date to a date Todoist understands
+
+    Anything that isn't a taskwarrior date is passed along as is, so records
+    can use Todoist date strings like "every monday".
+
+    """
+    try:
+        when = datetime.datetime.strptime(due, TASKWARRIOR_DATE_FORMAT)
+    except ValueError:
+        return due
+    return utc_to_local(when).strftime('%Y-%m-%d')
+
+
+def get_text(record, *names):
+    """Returns the first of the named fields that's set as stripped text
+
+    JSON records can have numbers where CSV records have text, like the
+    priorities in a francis export.
+
+    """
+    for name in names:
+        value = record.get(name)
+        if value is not None and value != '':
+            return ('%s' % value).strip()
+    return ''
+
+
+def record_to_task(record):
+    """Pulls the francis fields out of an import record
+
+    Records can use taskwarrior field names (description, project, priority,
+    due, status) or francis ones (content, project, priority, due). Records
+    from "francis export" work too: they have the due date in date_string
+    and a Todoist priority from 1 to 4.
+
+    :returns: dict with content, project, priority and due keys or None if
+        the record is for a task that's done or deleted
+
+    :raises ValueError: if the record has no content
+
+    """
+    if get_text(record, 'status').lower() in SKIP_STATUSES:
+        return None
+    if get_text(record, 'type').lower() in SKIP_TYPES:
+        return None
+
+    content = get_text(record, 'content', 'description')
+    if not content:
+        raise ValueError('no content')
+
+    priority = get_text(record, 'priority') or None
+    if priority and priority.upper() == 'M':
+        # Taskwarrior's medium priority doesn't map to a francis one
+        priority = None
+
+    due = get_text(record, 'due', 'date_string') or None
+    if due:
+        due = convert_due(due)
+
+    return {
+        'content': content,
+        'project': get_text(record, 'project') or None,
+        'priority': priority,
+        'due': due,
+    }
@@ -0,0 +1,255 @@
+import bisect
+import hashlib
+import weakref
+
+
+class DoesNotExist(Exception):
+    pass
+
+
+class TooMany(Exception):
+    pass
+
+
+class IdSuffixIndex:
+    """Answers "which object has an id ending in this suffix?" quickly
+
+    Ids (and temp ids for objects that haven't been committed yet) are
+    reversed and kept in a sorted list. An id suffix is then a prefix of the
+    reversed id, so all the matches for a suffix sit next to each other and we
+    can find them with a binary search rather than looking at every object.
+
+    """
+    def __init__(self, objs):
+        self.objs = list(objs)
+        keys = []
+        for i, obj in enumerate(self.objs):
+            keys.append((str(obj['id'])[::-1], i))
+            if obj.temp_id:
+                keys.append((obj.temp_id[::-1], i))
+        keys.sort()
+        self.keys = [key for key, i in keys]
+        self.positions = [i for key, i in keys]
+
+    def get(self, suffix):
+        """Returns the one object whose id ends with suffix
+
+        :raises DoesNotExist: if no object matches
+        :raises TooMany: if more than one object matches
+
+        """
+        rev = suffix[::-1]
+        start = bisect.bisect_left(self.keys, rev)
+
+        found = None
+        for i in range(start, len(self.keys)):
+            if not self.keys[i].startswith(rev):
+                break
+            pos = self.positions[i]
+            if found is None:
+                found = pos
+            elif pos != found:
+                # An object can match on both its id and its temp id, so we
+                # only bail once we've seen two different objects.
+                raise TooMany
+
+        if found is None:
+            raise DoesNotExist
+        return self.objs[found]
+
+    def get_many(self, suffixes):
+        """Looks up a batch of suffixes
+
+        :returns: list with one entry per suffix in the same order; each entry
+            is either the matching object or a DoesNotExist or TooMany
+            instance
+
+        """
+        results = []
+        for suffix in suffixes:
+            try:
+                results.append(self.get(suffix))
+            except (DoesNotExist, TooMany) as exc:
+                results.append(exc)
+        return results
+
+
+def fold_case(text):
+    """Returns a case-folded version of text for case-insensitive matching"""
+    try:
+        return text.casefold()
+    except AttributeError:
+        # Python 2 strings don't have casefold
+        return text.lower()
+
+
+class ProjectIndex:
+    """Maps project names and ids to projects
+
+    Names are case-folded. If several projects share a name, the first one
+    wins just like it did when we searched the list.
+
+    """
+    def __init__(self, projects):
+        self.by_name = {}
+        self.by_id = {}
+        self.display_names = {}
+
+        for proj in projects:
+            self.by_name.setdefault(fold_case(proj['name']), proj)
+
+            if proj.data.get('inbox_project'):
+                display_name = ''
+            else:
+                display_name = proj['name']
+
+            for key in (proj['id'], proj.temp_id):
+                if key:
+                    self.by_id.setdefault(key, proj)
+                    self.display_names.setdefault(key, display_name)
+
+    def get_by_name(self, name):
+        """Returns the project with the given name ignoring case
+
+        :raises DoesNotExist: if there's no such project
+
+        """
+        try:
+            return self.by_name[fold_case(name)]
+        except KeyError:
+            raise DoesNotExist
+
+    def get_by_id(self, project_id):
+        """Returns the project with the given id or None"""
+        return self.by_id.get(project_id)
+
+    def display_name(self, project_id):
+        """Returns the name to show for a project id
+
+        The Inbox and unknown projects display as an empty string.
+
+        """
+        return self.display_names.get(project_id, '')
+
+
+def content_key(content, project_id):
+    """Returns the dedupe key for a task's content in a project
+
+    Case and runs of whitespace don't count, so "Buy  milk" and "buy milk" in
+    the same project are the same task.
+
+    """
+    text = u'%s\0%s' % (project_id, ' '.join(fold_case(content).split()))
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+class ContentIndex:
+    """Set of content keys for spotting tasks that already exist
+
+    Only the sha1 of each task's content is kept, so it stays small even for
+    big accounts.
+
+    """
+    def __init__(self, items=()):
+        self.keys = set()
+        for item in items:
+            if not item.data.get('is_deleted'):
+                self.add(item['content'], item['project_id'])
+
+    def add(self, content, project_id):
+        self.keys.add(content_key(content, project_id))
+
+    def contains(self, content, project_id):
+        return content_key(content, project_id) in self.keys
+
+
+# Indexes are built once per sync and thrown away when the api syncs again,
+# unless they know how to apply the sync's changes (see sync).
+_indexes = weakref.WeakKeyDictionary()
+
+
+def _index_key(api, manager):
+    return (api.sync_token, len(manager.state[manager.state_name]))
+
+
+def get_cached_index(api, manager, index_class, build=None):
+    """Returns the index_class index of the manager's objects
+
+    The index is cached for the api and rebuilt if the api has synced or
+    gained objects since it was built.
+
+    :arg api: the TodoistAPI
+    :arg manager: the api's manager for the objects
+    :arg index_class: the class of the index
+    :arg build: (optional) function that returns a new index; defaults to
+        passing the manager's objects to index_class
+
+    """
+    key = _index_key(api, manager)
+    api_indexes = _indexes.setdefault(api, {})
+    cached = api_indexes.get((manager.state_name, index_class))
+    if cached is None or cached[0] != key:
+        if build is None:
+            index = index_class(manager.state[manager.state_name])
+        else:
+            index = build()
+        cached = (key, index)
+        api_indexes[(manager.state_name, index_class)] = cached
+    return cached[1]
+
+
+def clear_cached_indexes(api):
+    """Throws away the api's cached indexes"""
+    _indexes.pop(api, None)
+
+
+def sync(api):
+    """Syncs the api and brings its cached indexes up to date
+
+    Indexes with an ``update(api, changed)`` method that were current before
+    the sync are given the objects the sync changed rather than being
+    rebuilt from scratch. The rest get rebuilt the next time they're used.
+
+    :arg api: the TodoistAPI to sync
+
+    :returns: the sync response
+
+    """
+    api_indexes = _indexes.get(api, {})
+    current = set(
+        cache_key for cache_key, (key, index) in api_indexes.items()
+        if key == _index_key(api, getattr(api, cache_key[0]))
+    )
+
+    resp = api.sync()
+
+    for cache_key, (key, index) in list(api_indexes.items()):
+        state_name = cache_key[0]
+        if (cache_key not in current or resp.get('full_sync') or
+                not hasattr(index, 'update')):
+            del api_indexes[cache_key]
+            continue
+
+        index.update(api, resp.get(state_name) or [])
+        api_indexes[cache_key] = (_index_key(api, getattr(api, state_name)), index)
+    return resp
+
+
+def get_item_index(api):
+    """Returns the IdSuffixIndex for the api's items
+
+    The index is cached for the api and rebuilt if the api has synced or
+    gained items since it was built.
+
+    """
+    return get_cached_index(api, api.items, IdSuffixIndex)
+
+
+def get_project_index(api):
+    """Returns the ProjectIndex for the api's projects
+
+    The index is cached for the api and rebuilt if the api has synced or
+    gained projects since it was built.
+
+    """
+    return get_cached_index(api, api.projects, ProjectIndex)
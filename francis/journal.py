@@ -0,0 +1,140 @@
+import json
+import os
+import time
+
+from francis.cache import cache_key
+
+
+# Each index record is the journal offset of an entry as 16 hex digits and a
+# newline, so the index for the Nth entry from the end is at -N * INDEX_SIZE.
+INDEX_SIZE = 17
+
+
+class Journal:
+    """Stack of the changes francis commands made, for undo
+
+    Entries are appended to a JSON lines file. A second file holds the byte
+    offset of every entry in fixed-size records, so the last N entries can
+    be found without reading the whole journal. Undo pops entries off the end
+    by truncating both files.
+
+    """
+    def __init__(self, cache_dir, auth_token):
+        self.cache_dir = cache_dir
+        key = cache_key(auth_token)
+        self.path = os.path.join(cache_dir, 'journal-%s.jsonl' % key)
+        self.index_path = os.path.join(cache_dir, 'journal-%s.idx' % key)
+
+    def append(self, command, actions):
+        """Adds an entry for a command to the journal
+
+        :arg command: name of the command that made the changes
+        :arg actions: list of action dicts (see ``Action.to_dict``)
+
+        """
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+
+        entry = {
+            'at': time.time(),
+            'command': command,
+            'actions': list(actions),
+        }
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            offset = os.lseek(fd, 0, os.SEEK_END)
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, ('%016x\n' % offset).encode('ascii'))
+        finally:
+            os.close(fd)
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.index_path) // INDEX_SIZE
+        except OSError:
+            return 0
+
+    def last(self, count=1):
+        """Returns the last count entries, newest first
+
+        :returns: list of entry dicts
+
+        """
+        count = min(count, len(self))
+        if count <= 0:
+            return []
+
+        with open(self.index_path, 'rb') as fp:
+            fp.seek((len(self) - count) * INDEX_SIZE)
+            offsets = [int(fp.read(INDEX_SIZE), 16) for i in range(count)]
+
+        entries = []
+        with open(self.path, 'rb') as fp:
+            for offset in reversed(offsets):
+                fp.seek(offset)
+                entries.append(json.loads(fp.readline().decode('utf-8')))
+        return entries
+
+    def pop(self, count=1):
+        """Removes the last count entries"""
+        length = len(self)
+        count = min(count, length)
+        if count <= 0:
+            return
+
+        remaining = length - count
+        if remaining == 0:
+            self.clear()
+            return
+
+        with open(self.index_path, 'rb') as fp:
+            fp.seek(remaining * INDEX_SIZE)
+            offset = int(fp.read(INDEX_SIZE), 16)
+
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(offset)
+        with open(self.index_path, 'r+b') as fp:
+            fp.truncate(remaining * INDEX_SIZE)
+
+    def clear(self):
+        """Removes everything from the journal"""
+        for path in (self.path, self.index_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def undo_action(item, action):
+    """Queues the command that reverses an action on an item
+
+    :returns: True if the action was reversed, False if we don't know how
+
+    """
+    field = action['field']
+    if field == 'priority':
+        item.update(priority=action['old_value'])
+    elif field == 'project':
+        item.move(project_id=action['old_value'])
+    elif field == 'due':
+        item.update(date_string=action['old_value'])
+    elif field == 'due_date':
+        item.update(due_date_utc=action['old_value'], date_string=item['date_string'])
+    elif field == 'completed':
+        if action['old_value'] == '1':
+            item.complete()
+        else:
+            item.uncomplete()
+    else:
+        return False
+    return True
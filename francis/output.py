@@ -0,0 +1,88 @@
+import shutil
+
+import click
+
+from francis import timing
+
+
+# Number of lines to collect before writing them out in one go
+CHUNK_SIZE = 200
+
+
+def _get_obj():
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or not isinstance(ctx.obj, dict):
+        return {}
+    return ctx.obj
+
+
+def get_output():
+    """Returns the stream the current command writes to or None for stdout
+
+    The daemon runs commands for clients and sets ``ctx.obj['output']`` to
+    the buffer that gets sent back to the client.
+
+    """
+    return _get_obj().get('output')
+
+
+def echo(message=None, err=False, **kwargs):
+    """click.echo that writes to the command's output (see get_output)
+
+    With an output stream, messages for stderr go to it too.
+
+    """
+    output = get_output()
+    if output is not None:
+        kwargs['file'] = output
+    elif err:
+        kwargs['err'] = True
+    click.echo(message, **kwargs)
+
+
+def get_terminal_width():
+    """Returns the width of the terminal the output is going to
+
+    For commands the daemon runs, that's the client's terminal, which is in
+    ``ctx.obj['terminal_width']``.
+
+    """
+    width = _get_obj().get('terminal_width')
+    if width:
+        return width
+    try:
+        return shutil.get_terminal_size()[0]
+    except AttributeError:
+        # Python 2 doesn't have shutil.get_terminal_size
+        return click.get_terminal_size()[0]
+
+
+def write_lines(lines, pager=False, chunk_size=CHUNK_SIZE):
+    """Writes lines to stdout as they're produced
+
+    Lines are collected and written in chunks so a long listing is a handful
+    of writes rather than one per line. The first line gets written right
+    away so there's something to look at while the rest is rendered.
+
+    :arg lines: iterable of lines without trailing newlines; they can include
+        click styles which get stripped if stdout isn't a terminal
+    :arg pager: whether to send the output through the user's pager
+    :arg chunk_size: number of lines per write
+
+    """
+    with timing.phase('render'):
+        if pager:
+            click.echo_via_pager(line + '\n' for line in lines)
+            return
+
+        chunk = []
+        first = True
+        for line in lines:
+            chunk.append(line)
+            if first or len(chunk) >= chunk_size:
+                echo('\n'.join(chunk))
+                chunk = []
+                first = False
+
+        if chunk:
+            echo('\n'.join(chunk))
@@ -0,0 +1,211 @@
+import bisect
+
+from francis.index import get_cached_index
+from francis.store import get_item_store
+from francis.util import (
+    parse_api_datetime,
+    parse_query_date,
+    today,
+    utc_to_local,
+)
+
+
+OVERDUE_QUERIES = ('overdue', 'over due', 'od')
+
+# Date strings that start with these are recurring
+RECURRING_PREFIXES = ('every', 'ev ', 'after', 'daily', 'weekly', 'monthly', 'yearly')
+
+
+def get_due_date(item):
+    """Returns the local date an item is due or None if it has no due date"""
+    return get_data_due_date(item.data)
+
+
+def get_data_due_date(data):
+    """Returns the local date an item dict is due or None"""
+    due_date = data.get('due_date')
+    if not due_date:
+        return None
+
+    try:
+        return utc_to_local(parse_api_datetime(due_date)).date()
+    except ValueError:
+        return None
+
+
+def is_active(item):
+    """Returns whether the item is neither completed nor deleted"""
+    return not item.data.get('checked') and not item.data.get('is_deleted')
+
+
+def is_recurring(item):
+    """Returns whether the item's due date repeats"""
+    date_string = (item.data.get('date_string') or '').lower()
+    return date_string.startswith(RECURRING_PREFIXES)
+
+
+class DueDateIndex:
+    """Active items bucketed by the local date they're due
+
+    Items without a due date aren't in the index. After a sync, only the
+    items that changed get moved between buckets.
+
+    """
+    def __init__(self, items):
+        self.buckets = {}
+        self.dates = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if not is_active(item):
+            return
+        due_date = get_due_date(item)
+        if due_date is None:
+            return
+        self.buckets.setdefault(due_date, {})[item['id']] = item
+        self.dates[item['id']] = due_date
+
+    def remove(self, item_id):
+        due_date = self.dates.pop(item_id, None)
+        if due_date is not None:
+            bucket = self.buckets[due_date]
+            del bucket[item_id]
+            if not bucket:
+                del self.buckets[due_date]
+
+    def update(self, api, changed):
+        """Moves items that changed in a sync to the right bucket
+
+        :arg api: the synced TodoistAPI
+        :arg changed: item dicts from the sync response
+
+        """
+        for data in changed:
+            self.remove(data['id'])
+            item = api.items.get_by_id(data['id'], only_local=True)
+            if item is not None:
+                self.add(item)
+
+    def get(self, day):
+        """Returns the items due on day"""
+        return list(self.buckets.get(day, {}).values())
+
+    def before(self, day):
+        """Returns the items due before day, earliest first"""
+        items = []
+        for due_date in sorted(self.buckets):
+            if due_date >= day:
+                break
+            items.extend(self.buckets[due_date].values())
+        return items
+
+    def get_data(self, day):
+        """Returns the dicts of the items due on day"""
+        return [item.data for item in self.get(day)]
+
+    def before_data(self, day):
+        """Returns the dicts of the items due before day, earliest first"""
+        return [item.data for item in self.before(day)]
+
+
+class StoreDueDateIndex:
+    """DueDateIndex for an api that keeps its items in an ItemStore
+
+    The store filters its date column itself. ``get`` and ``before`` turn
+    the matching stored items into model objects so they can be changed;
+    ``get_data`` and ``before_data`` leave them in the store.
+
+    """
+    def __init__(self, api, store):
+        self.api = api
+        self.store = store
+        # Only the items that have been taken out of the store
+        self.local = DueDateIndex(api.items.state[api.items.state_name])
+
+    def _materialize(self, positions):
+        item_ids = [self.store.ids[pos] for pos in positions]
+        return [self.api.items.get_by_id(item_id, only_local=True) for item_id in item_ids]
+
+    def _merge_before(self, day, stored, local):
+        # The store's items come sorted by its due date column, so the few
+        # local items get slotted in rather than sorting everything again
+        positions = self.store.due_before(day)
+        keys = [self.store.due[pos] for pos in positions]
+        merged = stored(positions)
+        for item in self.local.before(day):
+            key = get_due_date(item).toordinal()
+            i = bisect.bisect_right(keys, key)
+            keys.insert(i, key)
+            merged.insert(i, local(item))
+        return merged
+
+    def get(self, day):
+        return self.local.get(day) + self._materialize(self.store.due_on(day))
+
+    def before(self, day):
+        return self._merge_before(day, self._materialize, lambda item: item)
+
+    def get_data(self, day):
+        return self.local.get_data(day) + [
+            self.store.get_data(pos) for pos in self.store.due_on(day)
+        ]
+
+    def before_data(self, day):
+        return self._merge_before(
+            day,
+            lambda positions: [self.store.get_data(pos) for pos in positions],
+            lambda item: item.data,
+        )
+
+
+def get_due_index(api):
+    """Returns the DueDateIndex for the api's items"""
+    store = get_item_store(api)
+    if store is not None:
+        return StoreDueDateIndex(api, store)
+    return get_cached_index(api, api.items, DueDateIndex)
+
+
+def run_query(api, queries, relative_to=None):
+    """Evaluates date queries against the due date index
+
+    This returns the same shape as ``api.query`` so the results can be
+    rendered the same way.
+
+    :arg api: a TodoistAPI with synced state
+    :arg queries: list of query strings
+    :arg relative_to: (optional) the datetime to evaluate relative dates
+        against; defaults to today
+
+    :returns: list of dicts with ``type``, ``query`` and ``data`` keys
+
+    :raises ValueError: if a query isn't one we can evaluate (see
+        ``parse_query_date``)
+
+    """
+    if relative_to is None:
+        relative_to = today()
+    today_date = relative_to.date()
+
+    # Figure out what each query means before looking at any items
+    matchers = []
+    for query in queries:
+        if query.lower().strip() in OVERDUE_QUERIES:
+            matchers.append(('overdue', None))
+        else:
+            matchers.append(('date', parse_query_date(query, relative_to=relative_to)))
+
+    index = get_due_index(api)
+    results = []
+    for query, (query_type, day) in zip(queries, matchers):
+        if query_type == 'overdue':
+            data = index.before_data(today_date)
+        else:
+            data = index.get_data(day)
+        results.append({
+            'type': query_type,
+            'query': query,
+            'data': data,
+        })
+    return results
@@ -0,0 +1,458 @@
+"""Full-text search over item content and project names
+
+A SearchIndex maps every word in the content of the active items to the ids
+of the items that have it. The words are also kept in a sorted list, so all
+the words that start with a prefix sit next to each other and a binary
+search finds them. Project names get a small index of their own and a word
+in a project name matches every item in the project.
+
+The index is saved next to the sync cache with the sync token of the state
+it was built from (see SearchCache). The next search syncs from that token,
+so the sync response has every item that changed since and the index only
+re-indexes those (see ``SearchIndex.update``) instead of being rebuilt.
+
+"""
+import bisect
+import heapq
+import json
+import math
+import operator
+import os
+import re
+import time
+
+from francis.cache import DEFAULT_MAX_AGE, cache_key, get_cache_dir, get_max_age
+from francis.index import fold_case, get_cached_index
+from francis.store import iter_item_data
+
+
+# Bump this when the on-disk format changes so old indexes get thrown away
+# rather than misread.
+SEARCH_VERSION = 1
+
+# Number of results to show unless the user asks for a different number
+DEFAULT_LIMIT = 50
+
+# How much a word that only starts with a search term counts compared to
+# one that is the term
+PREFIX_WEIGHT = 0.5
+
+# How much a word in the project name counts compared to one in the content
+PROJECT_WEIGHT = 0.5
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Returns the distinct case-folded words in text in the order they're in"""
+    words = []
+    seen = set()
+    for word in WORD_RE.findall(fold_case(text or '')):
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def is_active_data(data):
+    """Returns whether an item dict is neither completed nor deleted"""
+    return not data.get('checked') and not data.get('is_deleted')
+
+
+def iter_prefixed(words, prefix):
+    """Yields the words in a sorted list that start with prefix"""
+    for i in range(bisect.bisect_left(words, prefix), len(words)):
+        if not words[i].startswith(prefix):
+            break
+        yield words[i]
+
+
+class SearchIndex:
+    """Inverted index of the words in active items and project names
+
+    Attributes:
+
+    * ``postings``: word -> set of ids of the items with that word
+    * ``words``: the words in ``postings``, sorted
+    * ``project_items``: project id -> set of ids of the items in it
+    * ``project_words``: word -> set of ids of the projects with that word
+      in their name
+
+    ``item_words`` and ``item_projects`` say where each item is indexed so
+    it can be taken out again. An index loaded from disk doesn't have them
+    until something changes.
+
+    """
+    def __init__(self, items=(), projects=()):
+        self.postings = {}
+        self.project_items = {}
+        self.item_words = {}
+        self.item_projects = {}
+        self.num_items = 0
+        for data in items:
+            if is_active_data(data):
+                self._add(data)
+        self.words = sorted(self.postings)
+        self.set_projects(projects)
+        # Whether the index has changed since it was saved or loaded
+        self.dirty = True
+        # The sync token of the state the index was saved with
+        self.sync_token = None
+
+    @classmethod
+    def from_api(cls, api):
+        """Builds the index for every item the api has, stored or not"""
+        return cls(iter_item_data(api), api.state['projects'])
+
+    def set_projects(self, projects):
+        """Indexes the names of projects, replacing the ones indexed before
+
+        There aren't many projects, so they're indexed from scratch.
+
+        """
+        self.project_words = {}
+        for proj in projects:
+            data = proj.data
+            if data.get('is_deleted'):
+                continue
+            for word in tokenize(data.get('name')):
+                self.project_words.setdefault(word, set()).add(data['id'])
+        self.project_word_list = sorted(self.project_words)
+
+    def _invert(self):
+        """Works out which words and project each item is indexed under"""
+        if self.item_words is not None:
+            return
+        item_words = {}
+        for word, item_ids in self.postings.items():
+            for item_id in item_ids:
+                item_words.setdefault(item_id, []).append(word)
+        self.item_words = dict((item_id, tuple(words)) for item_id, words in item_words.items())
+        self.item_projects = {}
+        for project_id, item_ids in self.project_items.items():
+            for item_id in item_ids:
+                self.item_projects[item_id] = project_id
+
+    def _add(self, data):
+        """Indexes an item without keeping ``words`` sorted
+
+        :returns: the words that weren't in the index before
+
+        """
+        item_id = data['id']
+        words = tokenize(data.get('content'))
+        new_words = []
+        for word in words:
+            item_ids = self.postings.get(word)
+            if item_ids is None:
+                item_ids = self.postings[word] = set()
+                new_words.append(word)
+            item_ids.add(item_id)
+        project_id = data.get('project_id')
+        self.project_items.setdefault(project_id, set()).add(item_id)
+        if self.item_words is not None:
+            self.item_words[item_id] = tuple(words)
+            self.item_projects[item_id] = project_id
+        self.num_items += 1
+        return new_words
+
+    def _insert(self, data):
+        """Indexes an item dict that isn't in the index if it's active"""
+        if is_active_data(data):
+            for word in self._add(data):
+                bisect.insort(self.words, word)
+            self.dirty = True
+
+    def add(self, data):
+        """Indexes an item dict, replacing the item if it's indexed already
+
+        Items that are completed or deleted are only taken out.
+
+        """
+        self.remove(data['id'])
+        self._insert(data)
+
+    def remove(self, item_id):
+        """Takes an item out of the index if it's in it"""
+        self._invert()
+        words = self.item_words.pop(item_id, None)
+        if words is None:
+            return
+        for word in words:
+            item_ids = self.postings[word]
+            item_ids.discard(item_id)
+            if not item_ids:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+        project_id = self.item_projects.pop(item_id)
+        item_ids = self.project_items[project_id]
+        item_ids.discard(item_id)
+        if not item_ids:
+            del self.project_items[project_id]
+        self.num_items -= 1
+        self.dirty = True
+
+    def _discard(self, item_ids):
+        """Takes items out by looking for them in every posting
+
+        This doesn't need ``item_words``, so it's quicker than working them
+        out for an index loaded from disk when only a few items changed.
+
+        """
+        item_ids = set(item_ids)
+        for word, postings in list(self.postings.items()):
+            if not postings.isdisjoint(item_ids):
+                postings -= item_ids
+                if not postings:
+                    del self.postings[word]
+                    del self.words[bisect.bisect_left(self.words, word)]
+        for project_id, postings in list(self.project_items.items()):
+            removed = len(postings)
+            postings -= item_ids
+            removed -= len(postings)
+            if removed:
+                self.num_items -= removed
+                self.dirty = True
+            if not postings:
+                del self.project_items[project_id]
+
+    def update(self, api, changed):
+        """Re-indexes the items that changed in a sync
+
+        :arg api: the synced TodoistAPI
+        :arg changed: item dicts from the sync response; the sync sends whole
+            items, so the api's state isn't looked at
+
+        """
+        changed = list(changed)
+        if (self.item_words is None and
+                len(changed) * len(self.postings) < self.num_items):
+            self._discard(data['id'] for data in changed)
+            for data in changed:
+                self._insert(data)
+        else:
+            for data in changed:
+                self.add(data)
+        self.set_projects(api.state['projects'])
+
+    def _idf(self, num_matches):
+        # Rare words say more about an item than common ones
+        return math.log(1.0 + float(self.num_items) / num_matches)
+
+    def _score_term(self, term):
+        """Returns item id -> score for the items that match one term
+
+        An item scores for the best match it has: the term itself, a word
+        that starts with it or a word in its project's name.
+
+        """
+        matches = []
+        for word in iter_prefixed(self.words, term):
+            item_ids = self.postings[word]
+            weight = 1.0 if word == term else PREFIX_WEIGHT
+            matches.append((weight * self._idf(len(item_ids)), item_ids))
+
+        for word in iter_prefixed(self.project_word_list, term):
+            weight = PROJECT_WEIGHT * (1.0 if word == term else PREFIX_WEIGHT)
+            for project_id in self.project_words[word]:
+                item_ids = self.project_items.get(project_id)
+                if item_ids:
+                    matches.append((weight * self._idf(len(item_ids)), item_ids))
+
+        # Going from the best match down, each item only gets the first score
+        # it sees. The set operations run in C, which matters for short
+        # prefixes that match most of the account.
+        matches.sort(key=operator.itemgetter(0), reverse=True)
+        scores = {}
+        for score, item_ids in matches:
+            if scores:
+                item_ids = item_ids.difference(scores)
+            scores.update(dict.fromkeys(item_ids, score))
+        return scores
+
+    def search(self, query, limit=None):
+        """Returns the ids of the items that match every word in query
+
+        Each word matches items with that word or a word that starts with it
+        in their content or project name. Items that match rarer words and
+        match them exactly come first.
+
+        :arg query: the text to search for
+        :arg limit: (optional) the most ids to return
+
+        :returns: list of item ids, best match first
+
+        """
+        scores = None
+        for term in tokenize(query):
+            term_scores = self._score_term(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = dict(
+                    (item_id, score + term_scores[item_id])
+                    for item_id, score in scores.items()
+                    if item_id in term_scores
+                )
+            if not scores:
+                return []
+
+        if not scores:
+            return []
+        entries = scores.items()
+        if limit:
+            entries = heapq.nlargest(limit, entries, key=operator.itemgetter(1))
+        # Ids are ints, or temp id strings for items that aren't committed
+        # yet, so they're compared as strings to break ties
+        ranked = sorted(entries, key=lambda entry: (-entry[1], str(entry[0])))
+        return [item_id for item_id, score in ranked]
+
+    def to_json(self):
+        """Returns the index as a JSON-able dict
+
+        Only the postings are saved; the rest is worked out on load.
+
+        """
+        return {
+            'num_items': self.num_items,
+            'postings': dict((word, list(item_ids)) for word, item_ids in self.postings.items()),
+            'projects': [
+                [project_id, list(item_ids)]
+                for project_id, item_ids in self.project_items.items()
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, data, projects=()):
+        """Builds an index from ``to_json`` output
+
+        :arg data: the dict from ``to_json``
+        :arg projects: the projects to index the names of
+
+        """
+        index = cls(projects=projects)
+        index.num_items = data['num_items']
+        index.postings = dict((word, set(item_ids)) for word, item_ids in data['postings'].items())
+        index.words = sorted(index.postings)
+        index.project_items = dict(
+            (project_id, set(item_ids)) for project_id, item_ids in data['projects']
+        )
+        index.item_words = index.item_projects = None
+        index.dirty = False
+        return index
+
+
+def get_search_index(api, search_cache=None):
+    """Returns the SearchIndex for the api's items
+
+    The index is cached for the api and brought up to date by syncs. If it
+    has to be built, the one in search_cache is used if it's for the api's
+    sync token.
+
+    :arg api: a synced TodoistAPI
+    :arg search_cache: (optional) the SearchCache for the account
+
+    """
+    def build():
+        if search_cache is not None:
+            index = search_cache.load(api)
+            if index is not None and index.sync_token == api.sync_token:
+                return index
+        return SearchIndex.from_api(api)
+
+    return get_cached_index(api, api.items, SearchIndex, build)
+
+
+class SearchCache:
+    """Persists a SearchIndex on disk next to the sync cache
+
+    The index is saved with the sync token of the state it was built from.
+    ``before_sync`` points the api's next sync at that token so the sync
+    brings the index up to date, however old the sync cache's token is.
+
+    Only save an index for a state the sync cache was saved with, so its
+    token is never newer than the sync cache's.
+
+    """
+    def __init__(self, cache_dir, auth_token, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.path = os.path.join(cache_dir, 'search-%s.json' % cache_key(auth_token))
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(get_cache_dir(cfg), cfg['auth_token'], get_max_age(cfg))
+
+    def load(self, api):
+        """Loads the saved index
+
+        :arg api: the TodoistAPI with the projects to index
+
+        :returns: the SearchIndex with its ``sync_token`` set or None if
+            there's no saved index or it's corrupt, from a different version
+            or too old
+
+        """
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+        try:
+            if data['version'] != SEARCH_VERSION:
+                return None
+            if self.max_age and time.time() - float(data['saved_at']) > self.max_age:
+                return None
+            index = SearchIndex.from_json(data['index'], api.state['projects'])
+            index.sync_token = data['sync_token']
+        except (KeyError, TypeError, ValueError):
+            return None
+        return index
+
+    def before_sync(self, api):
+        """Sets up the api loaded from the sync cache to sync the saved index
+
+        If the index was saved with an older sync token than the api's, the
+        api syncs from the index's token instead. The response then has
+        every item that changed since the index was saved, which takes care
+        of the index, and applying the changes the api already has again
+        doesn't hurt it.
+
+        :arg api: the api loaded from the sync cache
+
+        :returns: True if the api has to sync to bring the index up to date
+
+        """
+        if api.sync_token == '*':
+            return False
+        index = self.load(api)
+        if index is None:
+            return False
+        needs_sync = index.sync_token != api.sync_token
+        api.sync_token = index.sync_token
+        get_cached_index(api, api.items, SearchIndex, lambda: index)
+        return needs_sync
+
+    def save(self, index, sync_token):
+        """Writes the index and the sync token of its state to disk"""
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+
+        data = {
+            'version': SEARCH_VERSION,
+            'saved_at': time.time(),
+            'sync_token': sync_token,
+            'index': index.to_json(),
+        }
+
+        tmp_path = self.path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp)
+        os.rename(tmp_path, self.path)
+        index.sync_token = sync_token
+        index.dirty = False
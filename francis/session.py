@@ -0,0 +1,134 @@
+"""The HTTP session francis uses to talk to Todoist
+
+This imports requests, so only import it when a command needs the network.
+
+"""
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+# Statuses worth trying again: rate limited or the server having a bad time
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Sync is a POST, but every command carries a uuid and Todoist ignores
+# commands it has already seen, so retrying it is safe. That goes for
+# retrying after a read timeout too, when Todoist may have run the commands
+# and we never heard back. The other POSTs only read.
+RETRY_METHODS = frozenset(['GET', 'POST'])
+
+# Connections to keep open per host
+POOL_SIZE = 4
+
+
+class JitteredRetry(Retry):
+    """Retry with "full jitter" backoff
+
+    The backoff is a random time between 0 and the exponential backoff so a
+    bunch of clients that failed together don't retry together.
+
+    """
+    def get_backoff_time(self):
+        backoff = Retry.get_backoff_time(self)
+        return random.uniform(0, backoff)
+
+
+def build_retry(retries, backoff):
+    kwargs = {
+        'total': retries,
+        'backoff_factor': backoff,
+        'status_forcelist': RETRY_STATUSES,
+        # todoist-python hands error bodies back as if they were responses,
+        # so once the retries run out this has to raise (requests turns it
+        # into a RetryError) or a failed sync or commit looks like it worked
+        'raise_on_status': True,
+        'respect_retry_after_header': True,
+    }
+    try:
+        return JitteredRetry(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return JitteredRetry(method_whitelist=RETRY_METHODS, **kwargs)
+
+
+class FrancisSession(requests.Session):
+    """requests Session with default timeouts, retries and connection pooling
+
+    :arg connect_timeout: seconds to wait for a connection
+    :arg read_timeout: seconds to wait for the server to send something
+    :arg retries: number of times to retry a failed request
+    :arg backoff: backoff factor in seconds between retries
+
+    """
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF):
+        requests.Session.__init__(self)
+        self.timeout = (connect_timeout, read_timeout)
+        # requests decompresses these transparently
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        adapter = HTTPAdapter(
+            pool_connections=POOL_SIZE,
+            pool_maxsize=POOL_SIZE,
+            max_retries=build_retry(retries, backoff),
+        )
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+def _get_number(cfg, key, default, convert=float):
+    try:
+        return convert(cfg.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_session_settings(cfg):
+    """Returns the session settings from the config
+
+    :returns: (connect_timeout, read_timeout, retries, backoff)
+
+    """
+    return (
+        _get_number(cfg, 'connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+        _get_number(cfg, 'read_timeout', DEFAULT_READ_TIMEOUT),
+        _get_number(cfg, 'http_retries', DEFAULT_RETRIES, int),
+        _get_number(cfg, 'http_backoff', DEFAULT_BACKOFF),
+    )
+
+
+# FrancisSessions by their settings
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(cfg):
+    """Returns the process-wide FrancisSession for the config's settings
+
+    Every TodoistAPI francis builds shares a session so connections get
+    reused across syncs, commits, queries and completed pages and, in the
+    daemon, across commands. Profiles with different settings each get
+    their own session. Sessions are never closed while other threads may be
+    using them, since ``--all-profiles`` syncs every profile at once.
+
+    """
+    settings = get_session_settings(cfg)
+    with _sessions_lock:
+        session = _sessions.get(settings)
+        if session is None:
+            session = _sessions[settings] = FrancisSession(*settings)
+    return session
@@ -0,0 +1,405 @@
+"""Compact storage for the items of very large accounts
+
+todoist-python keeps every item as a model object wrapped around a dict,
+which adds up to a lot of memory for accounts with 100k items and means
+every filter looks at every dict. An ItemStore keeps the fields francis
+filters and sorts on in typed arrays and the rest of each item as a short
+JSON string. Items only become model objects when a command displays or
+changes them (see ``francis.storeapi``).
+
+Turn it on with ``ITEM_STORE=compact`` in ``~/.francisrc``.
+
+"""
+import functools
+import json
+import operator
+from array import array
+from itertools import compress, count, repeat
+
+from francis.util import parse_api_datetime, utc_to_local
+
+
+try:
+    array('q')
+    ID_TYPECODE = 'q'
+except ValueError:
+    # Python 2 doesn't have long long arrays
+    ID_TYPECODE = 'l'
+
+# Fields that get their own column; everything else goes in the row
+COLUMN_FIELDS = frozenset([
+    'id', 'priority', 'project_id', 'content', 'date_string', 'due_date', 'checked',
+])
+
+# Due date column value for items that aren't due: no due date, completed
+# or removed. It sorts after every real date.
+NOT_DUE = 2 ** 31 - 1
+
+# Row key listing the default fields an item doesn't have
+MISSING_KEY = '\0missing'
+
+# Compact the columns once this many rows have been removed
+COMPACT_MIN_REMOVED = 1024
+
+# Ids are looked up by scanning the id column until there have been this
+# many lookups. After that, it's worth building a dict.
+SCAN_LOOKUPS = 16
+
+
+_encode_row = json.JSONEncoder(separators=(',', ':'), sort_keys=True).encode
+
+
+def use_item_store(cfg):
+    """Returns whether the config turns on the compact item store"""
+    return (cfg.get('item_store') or '').strip().lower() == 'compact'
+
+
+def get_item_store(api):
+    """Returns the api's ItemStore or None if it doesn't have one"""
+    return getattr(api, 'item_store', None)
+
+
+def iter_item_data(api):
+    """Yields the data dict of every item the api knows about
+
+    This includes items in the api's ItemStore without turning them into
+    model objects.
+
+    """
+    for item in api.items.state[api.items.state_name]:
+        yield item.data
+    store = get_item_store(api)
+    if store is not None:
+        for data in store.iter_data():
+            yield data
+
+
+def get_item_data(api, item_ids):
+    """Returns the data dicts of the items with the given ids
+
+    Items in the api's ItemStore stay there. Ids the api doesn't have are
+    left out.
+
+    :returns: dict of item id -> item dict
+
+    """
+    wanted = set(item_ids)
+    found = {}
+    for item in api.items.state[api.items.state_name]:
+        if item['id'] in wanted:
+            found[item['id']] = item.data
+    store = get_item_store(api)
+    if store is not None:
+        for item_id in wanted.difference(found):
+            data = store.get(item_id)
+            if data is not None:
+                found[item_id] = data
+    return found
+
+
+class StoredItem:
+    """Stand-in for a model object that builds its data when asked
+
+    ``SyncCache.save`` writes ``obj.data`` for each item, so the store hands
+    these out to have its rows written one at a time.
+
+    """
+    __slots__ = ('store', 'pos')
+
+    def __init__(self, store, pos):
+        self.store = store
+        self.pos = pos
+
+    @property
+    def data(self):
+        return self.store.get_data(self.pos)
+
+
+class ItemStore:
+    """Items kept in typed columns instead of model objects
+
+    Each item is a row. Rows are addressed by position, and positions are
+    only good until the store changes, so hold on to ids instead.
+
+    Columns:
+
+    * ``ids``: item ids; removed rows have id 0
+    * ``priorities``: priorities; 0 for none
+    * ``projects``: index into ``project_ids``
+    * ``due``: ordinal of the local date the item is due if it's active and
+      has a due date and NOT_DUE otherwise
+    * ``checked``: 1 for completed items
+
+    The other fields of an item go in its row as JSON, leaving out the ones
+    that are the same as in the first item added. Content, date strings,
+    due dates and rows are interned so repeats share one string.
+
+    The filters work on whole columns with ``map`` and ``compress`` so the
+    loops run in C.
+
+    """
+    def __init__(self, items=()):
+        self.clear()
+        self.extend(items)
+
+    def clear(self):
+        """Removes every item"""
+        self.ids = array(ID_TYPECODE)
+        self.priorities = array('b')
+        self.projects = array('i')
+        self.due = array('i')
+        self.checked = array('b')
+        self.contents = []
+        self.date_strings = []
+        self.due_dates = []
+        self.rows = []
+
+        self.defaults = None
+        # JSON for the defaults that are lists or dicts, so each item gets
+        # its own copy
+        self.mutable_defaults = None
+        self.project_ids = []
+        self.project_positions = {}
+        self.strings = {}
+        self.due_ordinals = {}
+        self.num_removed = 0
+
+        # id -> position; built once there have been enough lookups
+        self.positions = None
+        self.num_lookups = 0
+
+    def __len__(self):
+        return len(self.ids) - self.num_removed
+
+    def __contains__(self, item_id):
+        return self.position(item_id) is not None
+
+    def position(self, item_id):
+        """Returns the row position of item_id or None"""
+        if not item_id:
+            return None
+        if self.positions is None:
+            self.num_lookups += 1
+            if self.num_lookups <= SCAN_LOOKUPS:
+                try:
+                    return self.ids.index(item_id)
+                except (ValueError, TypeError, OverflowError):
+                    return None
+            self.positions = dict(zip(self.ids, count()))
+            self.positions.pop(0, None)
+        return self.positions.get(item_id)
+
+    def _intern(self, text):
+        if text is None:
+            return None
+        return self.strings.setdefault(text, text)
+
+    def _project_position(self, project_id):
+        pos = self.project_positions.get(project_id)
+        if pos is None:
+            pos = self.project_positions[project_id] = len(self.project_ids)
+            self.project_ids.append(project_id)
+        return pos
+
+    def _due_ordinal(self, due_date):
+        if not due_date:
+            return NOT_DUE
+        ordinal = self.due_ordinals.get(due_date)
+        if ordinal is None:
+            try:
+                ordinal = utc_to_local(parse_api_datetime(due_date)).date().toordinal()
+            except ValueError:
+                ordinal = NOT_DUE
+            self.due_ordinals[due_date] = ordinal
+        return ordinal
+
+    def _encode(self, data):
+        if self.defaults is None:
+            self.defaults = dict(
+                (key, val) for key, val in data.items() if key not in COLUMN_FIELDS
+            )
+            self.mutable_defaults = dict(
+                (key, json.dumps(val)) for key, val in self.defaults.items()
+                if isinstance(val, (list, dict))
+            )
+
+        defaults = self.defaults
+        row = {}
+        num_defaults = 0
+        for key, val in data.items():
+            if key in COLUMN_FIELDS:
+                continue
+            if key in defaults:
+                num_defaults += 1
+                default = defaults[key]
+                # 1 == True, but they don't come back out of JSON the same
+                if val == default and type(val) is type(default):
+                    continue
+            row[key] = val
+        if num_defaults < len(defaults):
+            row[MISSING_KEY] = [key for key in defaults if key not in data]
+        return self._intern(_encode_row(row))
+
+    def _values(self, data):
+        checked = 1 if data.get('checked') else 0
+        due_date = self._intern(data.get('due_date'))
+        return (
+            data['id'],
+            data.get('priority') or 0,
+            self._project_position(data.get('project_id')),
+            NOT_DUE if checked else self._due_ordinal(due_date),
+            checked,
+            self._intern(data.get('content')),
+            self._intern(data.get('date_string')),
+            due_date,
+            self._encode(data),
+        )
+
+    def _columns(self):
+        return (
+            self.ids, self.priorities, self.projects, self.due, self.checked,
+            self.contents, self.date_strings, self.due_dates, self.rows,
+        )
+
+    def _append(self, data):
+        if self.positions is not None:
+            self.positions[data['id']] = len(self.ids)
+        for column, value in zip(self._columns(), self._values(data)):
+            column.append(value)
+
+    def put(self, data):
+        """Adds an item or replaces the row of the item with the same id
+
+        :arg data: the item dict from a sync
+
+        """
+        pos = self.position(data['id'])
+        if pos is None:
+            self._append(data)
+        else:
+            for column, value in zip(self._columns(), self._values(data)):
+                column[pos] = value
+
+    def extend(self, items):
+        """Adds items from a sync
+
+        If the store is empty, the ids aren't looked up; a sync never has
+        the same item twice.
+
+        """
+        if len(self):
+            for data in items:
+                self.put(data)
+        else:
+            for data in items:
+                self._append(data)
+
+    def get_data(self, pos):
+        """Returns the item dict for the row at pos"""
+        data = dict(self.defaults)
+        for key, text in self.mutable_defaults.items():
+            data[key] = json.loads(text)
+        row = self.rows[pos]
+        if row != '{}':
+            row = json.loads(row)
+            for key in row.pop(MISSING_KEY, ()):
+                del data[key]
+            data.update(row)
+        data['id'] = self.ids[pos]
+        data['priority'] = self.priorities[pos] or None
+        data['project_id'] = self.project_ids[self.projects[pos]]
+        data['content'] = self.contents[pos]
+        data['date_string'] = self.date_strings[pos]
+        data['due_date'] = self.due_dates[pos]
+        data['checked'] = self.checked[pos]
+        return data
+
+    def get(self, item_id):
+        """Returns the item dict for item_id or None"""
+        pos = self.position(item_id)
+        if pos is None:
+            return None
+        return self.get_data(pos)
+
+    def remove(self, item_id):
+        """Removes the item's row if there is one"""
+        pos = self.position(item_id)
+        if pos is None:
+            return
+        if self.positions is not None:
+            del self.positions[item_id]
+        self.ids[pos] = 0
+        self.due[pos] = NOT_DUE
+        self.contents[pos] = self.date_strings[pos] = self.due_dates[pos] = None
+        self.rows[pos] = None
+        self.num_removed += 1
+        if self.num_removed > max(COMPACT_MIN_REMOVED, len(self.ids) // 2):
+            self.compact()
+
+    def pop(self, item_id):
+        """Removes the item and returns its dict or None if it's not here"""
+        data = self.get(item_id)
+        if data is not None:
+            self.remove(item_id)
+        return data
+
+    def _live_positions(self):
+        return list(compress(count(), self.ids))
+
+    def compact(self):
+        """Drops removed rows from the columns"""
+        keep = self._live_positions()
+        for name in ('ids', 'priorities', 'projects', 'due', 'checked'):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, [column[pos] for pos in keep]))
+        for name in ('contents', 'date_strings', 'due_dates', 'rows'):
+            column = getattr(self, name)
+            setattr(self, name, [column[pos] for pos in keep])
+        if self.positions is not None:
+            self.positions = dict(zip(self.ids, count()))
+        self.num_removed = 0
+
+    def iter_data(self):
+        """Yields the dict of every item in the store"""
+        for pos in self._live_positions():
+            yield self.get_data(pos)
+
+    def stored_items(self):
+        """Returns a StoredItem for every item in the store"""
+        return [StoredItem(self, pos) for pos in self._live_positions()]
+
+    def find_id_suffix(self, suffix):
+        """Returns the positions of the items whose id ends with suffix
+
+        Ids are compared as numbers: an id ends with "567" if it's 567
+        modulo 1000.
+
+        """
+        if not suffix.isdigit():
+            return []
+        modulus = 10 ** len(suffix)
+        wanted = int(suffix)
+        remainders = map(operator.mod, self.ids, repeat(modulus))
+        positions = compress(count(), map(functools.partial(operator.eq, wanted), remainders))
+        # Ids with fewer digits than the suffix can't end with it; that
+        # includes removed rows
+        smallest = modulus // 10
+        return [pos for pos in positions if self.ids[pos] >= smallest]
+
+    def due_on(self, day):
+        """Returns the positions of the active items due on day"""
+        matches = map(functools.partial(operator.eq, day.toordinal()), self.due)
+        return list(compress(count(), matches))
+
+    def due_before(self, day):
+        """Returns the positions of the active items due before day
+
+        The positions are sorted by due date, earliest first.
+
+        """
+        matches = map(functools.partial(operator.gt, day.toordinal()), self.due)
+        return self.sort(compress(count(), matches))
+
+    def sort(self, positions):
+        """Sorts positions by due date; items that aren't due go last"""
+        return sorted(positions, key=self.due.__getitem__)
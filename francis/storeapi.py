@@ -0,0 +1,70 @@
+"""TodoistAPI that keeps its items in an ItemStore
+
+This imports todoist, so only import it when a command needs the api.
+
+"""
+import todoist.api
+from todoist import models
+from todoist.managers.items import ItemsManager
+
+from francis.store import ItemStore
+
+
+class StoreItemsManager(ItemsManager):
+    """ItemsManager that turns stored items into model objects on demand
+
+    Looking an item up by id moves it out of the store and into the api's
+    state, so changing it works just like it does without a store.
+
+    """
+    def get_by_id(self, obj_id, only_local=False):
+        obj = ItemsManager.get_by_id(self, obj_id, only_local=True)
+        if obj is None:
+            data = self.api.item_store.pop(obj_id)
+            if data is not None:
+                obj = models.Item(data, self.api)
+                self.state[self.state_name].append(obj)
+
+        if obj is None and not only_local:
+            return ItemsManager.get_by_id(self, obj_id)
+        return obj
+
+    def all(self, filt=None):
+        # Everything has to be a model object to be filtered
+        store = self.api.item_store
+        items = self.state[self.state_name]
+        for data in store.iter_data():
+            items.append(models.Item(data, self.api))
+        store.clear()
+        return ItemsManager.all(self, filt)
+
+
+class StoreAPI(todoist.api.TodoistAPI):
+    """TodoistAPI that keeps items in an ItemStore until they're needed
+
+    Every item is in either the state or the store, never both. Items from
+    a sync or the cache go in the store unless the state already has them.
+
+    """
+    def __init__(self, *args, **kwargs):
+        todoist.api.TodoistAPI.__init__(self, *args, **kwargs)
+        self.items = StoreItemsManager(self)
+
+    def reset_state(self):
+        todoist.api.TodoistAPI.reset_state(self)
+        self.item_store = ItemStore()
+
+    def _update_state(self, syncdata):
+        if syncdata.get('items'):
+            local = []
+            stored = []
+            for data in syncdata['items']:
+                if ItemsManager.get_by_id(self.items, data['id'], only_local=True):
+                    local.append(data)
+                elif data.get('is_deleted'):
+                    self.item_store.remove(data['id'])
+                else:
+                    stored.append(data)
+            self.item_store.extend(stored)
+            syncdata = dict(syncdata, items=local)
+        todoist.api.TodoistAPI._update_state(self, syncdata)
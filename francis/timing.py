@@ -0,0 +1,179 @@
+import json
+import sys
+import threading
+import time
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.time() - self.start)
+        return False
+
+
+class Profiler:
+    """Collects how long each phase of a command took and the HTTP traffic
+
+    Phases with the same name add up, so a command that syncs twice shows the
+    total time spent syncing. Phases that run at the same time on different
+    threads add up too, so they can add up to more than the total.
+
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.phases = []
+        self.totals = {}
+        self.counts = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def phase(self, name):
+        """Returns a context manager that times a phase"""
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        with self.lock:
+            if name not in self.totals:
+                self.phases.append(name)
+                self.totals[name] = 0.0
+                self.counts[name] = 0
+            self.totals[name] += seconds
+            self.counts[name] += 1
+
+    def count_response(self, resp):
+        body = resp.request.body
+        # Count what went over the wire, which is less than the content if
+        # the response was compressed
+        try:
+            received = int(resp.headers['Content-Length'])
+        except (KeyError, ValueError):
+            received = len(resp.content)
+        with self.lock:
+            self.requests += 1
+            if body:
+                self.bytes_sent += len(body)
+            self.bytes_received += received
+
+    def to_dict(self):
+        return {
+            'total': time.time() - self.start,
+            'phases': [
+                {'name': name, 'seconds': self.totals[name], 'count': self.counts[name]}
+                for name in self.phases
+            ],
+            'requests': self.requests,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+        }
+
+    def format_lines(self):
+        """Yields a human-readable breakdown"""
+        data = self.to_dict()
+        yield 'francis profile:'
+        for phase in data['phases']:
+            yield '  %-10s %8.1fms  (x%d)' % (
+                phase['name'], phase['seconds'] * 1000, phase['count'])
+        yield '  %-10s %8.1fms' % ('total', data['total'] * 1000)
+        yield '  http: %d request(s), %d byte(s) sent, %d byte(s) received' % (
+            data['requests'], data['bytes_sent'], data['bytes_received'])
+
+
+_active = None
+
+
+def start(profiler=None):
+    """Turns on profiling and returns the Profiler"""
+    global _active
+    _active = profiler or Profiler()
+    return _active
+
+
+def stop():
+    """Turns off profiling and returns the Profiler that was active"""
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+def phase(name):
+    """Times a phase if profiling is on
+
+    This is cheap when profiling is off, so it's fine to leave in hot paths.
+
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _active.phase(name)
+
+
+def _response_hook(resp, *args, **kwargs):
+    if _active is not None:
+        _active.count_response(resp)
+
+
+def watch_session(session):
+    """Counts the requests and bytes that go through a requests Session
+
+    The hook counts for whichever Profiler is active, so it's safe to call
+    this on a long-lived session.
+
+    """
+    if _response_hook not in session.hooks['response']:
+        session.hooks['response'].append(_response_hook)
+
+
+def parse_trace_setting(value):
+    """Interprets the FRANCIS_TRACE environment variable
+
+    :returns: None if tracing is off, "text" or "json" to write to stderr or
+        a path to append JSON lines to
+
+    """
+    value = (value or '').strip()
+    if value.lower() in ('', '0', 'no', 'off', 'false'):
+        return None
+    if value.lower() in ('1', 'yes', 'on', 'true', 'text'):
+        return 'text'
+    if value.lower() == 'json':
+        return 'json'
+    return value
+
+
+def report(profiler, destination, stream=None):
+    """Writes the profile to stderr as text or JSON or appends it to a file
+
+    :arg profiler: the Profiler
+    :arg destination: "text", "json" or a path
+    :arg stream: (optional) stream to write text and JSON to instead of
+        stderr
+
+    """
+    if stream is None:
+        stream = sys.stderr
+    if destination == 'text':
+        stream.write('\n'.join(profiler.format_lines()) + '\n')
+    elif destination == 'json':
+        stream.write(json.dumps(profiler.to_dict()) + '\n')
+    else:
+        with open(destination, 'a') as fp:
+            fp.write(json.dumps(profiler.to_dict()) + '\n')
@@ -1,81 +1,533 @@
+import calendar
+import collections
 import datetime
 import os
-
-import pendulum
-import tabulate
+import re
+import time
 
 
 class ConfigFileMissingError(Exception):
     pass
 
 
+# Name of the profile made of the settings that aren't in a [name] section
+DEFAULT_PROFILE = 'default'
+
+
 def parse_rc(data):
+    """Parses the contents of a francisrc file
+
+    Settings after a ``[name]`` line belong to the profile called name and
+    end up in ``contents['profiles'][name]``.
+
+    """
     contents = {}
+    section = contents
     for line in data.splitlines():
         line = line.strip()
         if not line or line.startswith('#'):
             continue
+        if line.startswith('[') and line.endswith(']'):
+            profiles = contents.setdefault('profiles', collections.OrderedDict())
+            section = profiles.setdefault(line[1:-1].strip(), {})
+            continue
         key, val = [mem.strip() for mem in line.split('=', 1)]
-        contents[key.lower()] = val
+        section[key.lower()] = val
     return contents
 
 
+def get_profile(cfg, name=None):
+    """Returns the settings for one profile
+
+    Named profiles get any settings they don't have from the settings
+    outside of the sections.
+
+    :arg cfg: the config from ``get_config``
+    :arg name: (optional) the profile name; defaults to the default profile
+
+    :returns: dict of settings
+
+    :raises ValueError: if there's no profile with that name
+
+    """
+    settings = dict((key, val) for key, val in cfg.items() if key != 'profiles')
+    profiles = cfg.get('profiles') or {}
+    if name is None or (name == DEFAULT_PROFILE and name not in profiles):
+        return settings
+
+    if name not in profiles:
+        raise ValueError('There\'s no profile named "%s" in ~/.francisrc.' % name)
+    settings.update(profiles[name])
+    return settings
+
+
+def get_profiles(cfg):
+    """Returns the settings for every profile that has an auth token
+
+    Profiles that end up with the same auth token are the same account, so
+    only the first one is included.
+
+    :returns: OrderedDict of profile name -> settings
+
+    """
+    names = [DEFAULT_PROFILE] + [
+        name for name in (cfg.get('profiles') or {}) if name != DEFAULT_PROFILE
+    ]
+    profiles = collections.OrderedDict()
+    tokens = set()
+    for name in names:
+        settings = get_profile(cfg, name)
+        token = settings.get('auth_token')
+        if token and token not in tokens:
+            tokens.add(token)
+            profiles[name] = settings
+    return profiles
+
+
+def today():
+    """Returns midnight today in local time as a naive datetime"""
+    return datetime.datetime.combine(datetime.date.today(), datetime.time())
+
+
+def local_to_utc(dt):
+    """Converts a naive local datetime to a naive UTC datetime"""
+    timestamp = time.mktime(dt.timetuple())
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp)
+
+
+def utc_to_local(dt):
+    """Converts a naive UTC datetime to a naive local datetime"""
+    return datetime.datetime.fromtimestamp(calendar.timegm(dt.timetuple()))
+
+
+# Formats the Todoist API uses for timestamps like completed_date
+API_DATETIME_FORMATS = [
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%a %d %b %Y %H:%M:%S +0000',
+]
+
+
+def parse_api_datetime(text):
+    """Parses a UTC timestamp from the Todoist API
+
+    :returns: naive UTC datetime
+
+    :raises ValueError: if the text isn't in a format we know about
+
+    """
+    for fmt in API_DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError('"%s" is not a Todoist timestamp' % text)
+
+
+# Day of week names; 0 is sunday like in the timesheet
+WEEKDAYS = [
+    ('sunday', 0),
+    ('monday', 1),
+    ('tuesday', 2),
+    ('wednesday', 3),
+    ('thursday', 4),
+    ('friday', 5),
+    ('saturday', 6)
+]
+
+
+def _build_weekday_prefixes():
+    # Any prefix of a day name works; if a prefix fits more than one day,
+    # the first one in WEEKDAYS wins like it always has
+    prefixes = {}
+    for day, index in WEEKDAYS:
+        for end in range(1, len(day) + 1):
+            prefixes.setdefault(day[:end], index)
+    return prefixes
+
+
+WEEKDAY_PREFIXES = _build_weekday_prefixes()
+WEEKDAY_NAMES = dict(WEEKDAYS)
+
+MONTH_NAMES = [
+    'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+    'september', 'october', 'november', 'december'
+]
+
+# Month names and abbreviations -> month number
+MONTHS = dict(
+    [(name, index) for index, name in enumerate(MONTH_NAMES, 1)] +
+    [(name[:3], index) for index, name in enumerate(MONTH_NAMES, 1)] +
+    [('sept', 9)]
+)
+
+# Todoist and taskwarrior both say "later" for "some day, not now"
+LATER = datetime.date(9999, 12, 30)
+
+ISO_DATE_RE = re.compile(r'^(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})$')
+MONTH_DAY_RE = re.compile(
+    r'^(?P<month>[a-z]+)\.?\s+(?P<day>\d{1,2})(?:,?\s+(?P<year>\d{4}))?$'
+)
+DAY_MONTH_RE = re.compile(r'^(?P<day>\d{1,2})\s+(?P<month>[a-z]+)(?:,?\s+(?P<year>\d{4}))?$')
+SLASH_DATE_RE = re.compile(r'^(?P<month>\d{1,2})/(?P<day>\d{1,2})(?:/(?P<year>\d{4}))?$')
+ORDINAL_RE = re.compile(r'^(?P<day>\d{1,2})(?:st|nd|rd|th)$')
+
+# "3d", "+2w", "-1mo" and "eom+1d", "friday-2d"
+DURATION_RE = re.compile(r'^(?P<sign>[+-]?)\s*(?P<count>\d+)\s*(?P<unit>[a-z]+)$')
+ANCHORED_RE = re.compile(
+    r'^(?P<anchor>[a-z]+|\d{1,2}(?:st|nd|rd|th))\s*'
+    r'(?P<sign>[+-])\s*(?P<count>\d+)\s*(?P<unit>[a-z]+)$'
+)
+
+# Duration unit -> (days, months); francis works in days, so there are no
+# hours or minutes
+DURATION_UNITS = dict(
+    [(name, (1, 0)) for name in ('d', 'day', 'days')] +
+    [(name, (7, 0)) for name in ('w', 'wk', 'wks', 'week', 'weeks')] +
+    [(name, (0, 1)) for name in ('mo', 'mos', 'mth', 'mths', 'mnths', 'month', 'months')] +
+    [(name, (0, 3)) for name in ('q', 'qtr', 'qtrs', 'qrtrs', 'quarter', 'quarters')] +
+    [(name, (0, 12)) for name in ('y', 'yr', 'yrs', 'year', 'years')]
+)
+
+
+def add_months(day, months):
+    """Adds months to a date, clamping the day to the end of the month"""
+    index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(index, 12)
+    month += 1
+    return day.replace(
+        year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1])
+    )
+
+
+def _end_of_month(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _start_of_week(day):
+    # Weeks start on Sunday
+    return day - datetime.timedelta(days=day.isoweekday() % 7)
+
+
+def _start_of_quarter(day):
+    return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+
+
+def _easter(year):
+    """Returns Easter Sunday for a year (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    sunday_offset = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * sunday_offset) // 433
+    month = (h + sunday_offset - 7 * m + 90) // 25
+    return datetime.date(year, month, (h + sunday_offset - 7 * m + 33 * month + 19) % 32)
+
+
+def _next_easter_based(offset):
+    def _next(day):
+        for year in (day.year, day.year + 1):
+            holiday = _easter(year) + datetime.timedelta(days=offset)
+            if holiday >= day:
+                return holiday
+    return _next
+
+
+def _next_weekday(index):
+    def _next(day):
+        return day + datetime.timedelta(days=(index - day.isoweekday() % 7) % 7)
+    return _next
+
+
+def _next_month(month):
+    def _next(day):
+        first = day.replace(month=month, day=1)
+        if first < day.replace(day=1):
+            first = first.replace(year=day.year + 1)
+        return first
+    return _next
+
+
+def _next_day_of_month(day_of_month):
+    def _next(day):
+        # The next month that has that day, starting with this one
+        first = day.replace(day=1)
+        for i in range(13):
+            month = add_months(first, i)
+            if day_of_month <= calendar.monthrange(month.year, month.month)[1]:
+                candidate = month.replace(day=day_of_month)
+                if candidate >= day:
+                    return candidate
+        raise ValueError('"%d" is not a day of the month' % day_of_month)
+    return _next
+
+
+def _days(count):
+    return lambda day: day + datetime.timedelta(days=count)
+
+
+# Taskwarrior's date names (https://taskwarrior.org/docs/dates.html#names)
+# mapped to functions from the reference day to the date they name. The
+# "so" names are the start of the next period, the "soc" ones the start of
+# the current one and the "eo" ones the end of the current one.
+DATE_NAMES = {
+    'now': _days(0),
+    'today': _days(0),
+    'sod': _days(0),
+    'eod': _days(0),
+    'yesterday': _days(-1),
+    'tomorrow': _days(1),
+    'later': lambda day: LATER,
+    'someday': lambda day: LATER,
+
+    'sow': lambda day: _start_of_week(day) + datetime.timedelta(days=7),
+    'socw': _start_of_week,
+    'eow': lambda day: _start_of_week(day) + datetime.timedelta(days=6),
+    'eocw': lambda day: _start_of_week(day) + datetime.timedelta(days=6),
+    'soww': _next_weekday(1),
+    'eoww': lambda day: _start_of_week(day) + datetime.timedelta(days=5),
+
+    'som': lambda day: add_months(day.replace(day=1), 1),
+    'socm': lambda day: day.replace(day=1),
+    'eom': _end_of_month,
+    'eocm': _end_of_month,
+
+    'soq': lambda day: add_months(_start_of_quarter(day), 3),
+    'socq': _start_of_quarter,
+    'eoq': lambda day: add_months(_start_of_quarter(day), 3) - datetime.timedelta(days=1),
+    'eocq': lambda day: add_months(_start_of_quarter(day), 3) - datetime.timedelta(days=1),
+
+    'soy': lambda day: datetime.date(day.year + 1, 1, 1),
+    'socy': lambda day: datetime.date(day.year, 1, 1),
+    'eoy': lambda day: datetime.date(day.year, 12, 31),
+    'eocy': lambda day: datetime.date(day.year, 12, 31),
+
+    'goodfriday': _next_easter_based(-2),
+    'easter': _next_easter_based(0),
+    'eastermonday': _next_easter_based(1),
+    'ascension': _next_easter_based(39),
+    'pentecost': _next_easter_based(49),
+}
+DATE_NAMES.update((name, _next_month(index)) for name, index in MONTHS.items())
+
+
+def _resolve_name(name, day, strict=False):
+    """Returns the date a name stands for or None if it isn't a name
+
+    With strict, names have to match in full, though weekdays can be
+    abbreviated to three letters.
+
+    """
+    if name.isalpha() and (not strict or name in ('tod', 'tom')):
+        # These have always matched on prefix
+        if name.startswith('tod'):
+            return day
+        if name.startswith('tom'):
+            return day + datetime.timedelta(days=1)
+
+    func = DATE_NAMES.get(name)
+    if func is not None:
+        return func(day)
+
+    if name in WEEKDAY_PREFIXES and (not strict or len(name) == 3 or name in WEEKDAY_NAMES):
+        return _next_weekday(WEEKDAY_PREFIXES[name])(day)
+
+    match = ORDINAL_RE.match(name)
+    if match:
+        return _next_day_of_month(int(match.group('day')))(day)
+    return None
+
+
+def _apply_duration(day, sign, count, unit):
+    """Moves day by a duration or returns None if unit isn't one we know"""
+    if unit not in DURATION_UNITS:
+        return None
+    days, months = DURATION_UNITS[unit]
+    count = -int(count) if sign == '-' else int(count)
+    if months:
+        return add_months(day, months * count)
+    return day + datetime.timedelta(days=days * count)
+
+
+def _build_date(year, month, day):
+    return datetime.datetime(int(year), int(month), int(day))
+
+
+def _parse_explicit(text, relative_to):
+    """Parses explicit dates like "july 22", "22 jul" and "7/22/2016"
+
+    These don't depend on the relative_to date other than for the year.
+
+    """
+    match = ISO_DATE_RE.match(text)
+    if match:
+        return _build_date(match.group('year'), match.group('month'), match.group('day'))
+
+    for regex in (MONTH_DAY_RE, DAY_MONTH_RE, SLASH_DATE_RE):
+        match = regex.match(text)
+        if not match:
+            continue
+        month = match.group('month')
+        if not month.isdigit():
+            if month not in MONTHS:
+                continue
+            month = MONTHS[month]
+        return _build_date(match.group('year') or relative_to.year, month, match.group('day'))
+    return None
+
+
+def _parse_relative(text, day, strict=False):
+    """Parses names and offsets like "eom", "friday", "+3d" and "sow-1d"
+
+    With strict, names have to match in full (see ``_resolve_name``) and
+    offsets need a sign.
+
+    :returns: date or None if the text isn't a name or offset
+
+    """
+    result = _resolve_name(text, day, strict)
+    if result is not None:
+        return result
+
+    match = DURATION_RE.match(text)
+    if match and (match.group('sign') or not strict):
+        return _apply_duration(day, *match.group('sign', 'count', 'unit'))
+
+    match = ANCHORED_RE.match(text)
+    if match:
+        anchor = _resolve_name(match.group('anchor'), day, strict)
+        if anchor is not None:
+            return _apply_duration(anchor, *match.group('sign', 'count', 'unit'))
+
+    if strict:
+        return None
+    # Anything else starting with today or tomorrow has always meant that day
+    return _resolve_name(text[:3], day) if text[:3] in ('tod', 'tom') else None
+
+
+def _parse_date(text, relative_to):
+    lower_text = ' '.join(text.lower().split())
+
+    parsed = _parse_explicit(lower_text, relative_to)
+    if parsed is not None:
+        return parsed
+
+    day = _parse_relative(lower_text, relative_to.date())
+    if day is not None:
+        # Relative dates keep the time of day of relative_to
+        return relative_to + (day - relative_to.date())
+
+    # Last ditch: other explicit date and time formats
+    import pendulum
+    try:
+        parsed = pendulum.parse(text)
+    except ValueError:
+        parsed = None
+
+    # pendulum also parses times and durations which aren't dates
+    if not isinstance(parsed, datetime.datetime):
+        return None
+    return parsed.naive()
+
+
+# parse_date results keyed by (text, relative_to); it gets cleared when it
+# gets this big
+PARSE_CACHE_SIZE = 4096
+
+_parse_cache = {}
+
+
 def parse_date(text, relative_to=None):
-    """Converts a date string into a datetime.date
+    """Converts a date string into a datetime
 
     This is relative to the relative_to date which defaults to today.
 
+    Explicit dates like "2016-07-22", "july 22" and "7/22" and taskwarrior
+    style names and offsets like "today", "friday", "eom", "sow", "eoww",
+    "+3d" and "eom-1w" are handled with lookup tables (see ``DATE_NAMES``
+    and ``DURATION_UNITS``). Anything else gets handed to pendulum, which we
+    only import if we get that far.
+
+    Results are memoized per text and relative_to, so parsing the same due
+    strings over and over is cheap.
+
     :arg text: the text to parse
     :arg relative_to: (optional) the datetime object to parse dates
         relative to
 
-    :returns: Pendulum (subclass of datetime)
+    :returns: naive datetime
 
     :raises ValueError: if the text is not parseable
 
     """
-    # First, if it's a date, try parsing it with pendulum--this doesn't require
-    # a relative-to date.
+    if relative_to is None:
+        relative_to = today()
+
+    key = (text, relative_to)
     try:
-        return pendulum.instance(datetime.datetime.strptime(text, '%Y-%m-%d'))
-    except ValueError:
-        pass
+        parsed = _parse_cache[key]
+    except KeyError:
+        try:
+            parsed = _parse_date(text, relative_to)
+        except (ValueError, OverflowError):
+            parsed = None
+        if len(_parse_cache) >= PARSE_CACHE_SIZE:
+            _parse_cache.clear()
+        _parse_cache[key] = parsed
+
+    if parsed is None:
+        raise ValueError('"%s" is not parseable' % text)
+    return parsed
+
+
+def parse_query_date(text, relative_to=None):
+    """Converts a query for the items due on one day into that date
+
+    Lots of Todoist filters start out like dates: "today | overdue", "tod &
+    p1", "tomorrow 5pm" and "7 days" (the next seven days). So unlike
+    ``parse_date``, this only takes explicit dates, whole date names like
+    "today", "fri" and "eom" and offsets with a sign and without spaces like
+    "+3d" and "eom-1w".
+
+    :arg text: the query
+    :arg relative_to: (optional) the datetime object to parse dates
+        relative to; defaults to today
+
+    :returns: date
+
+    :raises ValueError: if the query isn't one of those, so it has to go to
+        Todoist
 
+    """
     if relative_to is None:
-        relative_to = pendulum.today()
-    else:
-        relative_to = pendulum.instance(relative_to)
-
-    # Match on lowercase messages
-    text = text.lower()
-
-    # Today and tomorrow
-    if text.startswith('tod'):
-        return relative_to
-    if text.startswith('tom'):
-        return relative_to.add(days=1)
-
-    # Day of week; parsed as after today
-    # (day of week is 0-based where 0 is a sunday)
-    today_index = relative_to.day_of_week
-    pairs = [
-        ('sunday', 0),
-        ('monday', 1),
-        ('tuesday', 2),
-        ('wednesday', 3),
-        ('thursday', 4),
-        ('friday', 5),
-        ('saturday', 6)
-    ]
-    for day, offset in pairs:
-        if day.startswith(text):
-            adjustment = (offset - today_index) % 7
-            print today_index, offset, adjustment
-            return relative_to.add(days=adjustment)
+        relative_to = today()
 
-    # FIXME: Other things to support from taskwarrior:
-    # http://taskwarrior.org/docs/dates.html#names
-    raise ValueError('"%s" is not parseable' % text)
+    lower_text = ' '.join(text.lower().split())
+    try:
+        parsed = _parse_explicit(lower_text, relative_to)
+        if parsed is not None:
+            return parsed.date()
+
+        if ' ' not in lower_text:
+            day = _parse_relative(lower_text, relative_to.date(), strict=True)
+            if day is not None:
+                return day
+    except OverflowError:
+        pass
+    raise ValueError('"%s" is not a date query' % text)
+
+
+def format_age(seconds):
+    """Formats a number of seconds as a rough human-readable age"""
+    seconds = int(seconds)
+    for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= size:
+            count = seconds // size
+            return '%d %s%s' % (count, unit, '' if count == 1 else 's')
+    return '%d second%s' % (seconds, '' if seconds == 1 else 's')
 
 
 def get_config(path=None):
@@ -91,72 +543,181 @@ def get_config(path=None):
     return cfg
 
 
-def prettytable(width, rows):
-    if not rows:
-        return ''
+# Strings that look like numbers get right-aligned like numbers do
+NUMBER_RE = re.compile(r'^[-+]?\d+(\.\d*)?$')
+
+# Space between columns and the minimum space after a header
+COLUMN_SEP = '  '
+HEADER_PADDING = 2
+
+# Columns wider than this are the first to get shrunk
+SHRINK_THRESHOLD = 40
+
+
+def _is_number(cell, text):
+    if isinstance(cell, bool):
+        return False
+    if isinstance(cell, (int, float)):
+        return True
+    return bool(NUMBER_RE.match(text))
 
-    # Convert rows to lists
-    rows = [list(row) for row in rows]
 
-    # Go through and make sure rows are all the same size and if not, pad them.
-    row_size = 0
-    for row in rows:
-        row_size = max(row_size, len(row))
-    for row in rows:
-        row.extend([''] * (row_size - len(row)))
+def _shrink(col_size, width):
+    """Returns column sizes that fit in width
 
-    # Initialize col_size with the length of each column in the first row
-    col_size = [len(str(col)) + 2 for col in rows[0]]
-    for row in rows:
-        for i, col in enumerate(row):
-            col_size[i] = max(col_size[i], len(str(col)))
+    Columns bigger than SHRINK_THRESHOLD get cut down to SHRINK_THRESHOLD,
+    leftmost first, until everything fits. If that's not enough, we've done
+    what we can.
+
+    """
+    col_size = list(col_size)
+    excess = sum(col_size) - width
+    for i, size in enumerate(col_size):
+        if excess <= 0:
+            break
+        if size > SHRINK_THRESHOLD:
+            cut = min(size - SHRINK_THRESHOLD, excess)
+            col_size[i] = size - cut
+            excess -= cut
+    return col_size
+
+
+def table_layout(width, rows):
+    """Figures out the text, width and alignment of every column
+
+    This makes a single pass over the rows converting every cell to text
+    exactly once.
+
+    :arg width: the width to fit the table in
+    :arg rows: iterable of rows; the first row is the header
+
+    :returns: (text_rows, col_widths, right_align) where text_rows is a list of
+        lists of cell text with the header first; text_rows is empty if there
+        were no rows
+
+    """
+    text_rows = []
+    data_size = []
+    seen_number = []
+    all_numbers = []
+    for row_index, row in enumerate(rows):
+        text_row = []
+        for i, cell in enumerate(row):
+            if i == len(data_size):
+                data_size.append(0)
+                seen_number.append(False)
+                all_numbers.append(True)
+
+            text = '' if cell is None else ('%s' % cell).replace('\n', ' ').strip()
+            text_row.append(text)
+            if row_index == 0 or not text:
+                continue
+
+            data_size[i] = max(data_size[i], len(text))
+            if all_numbers[i]:
+                if _is_number(cell, text):
+                    seen_number[i] = True
+                else:
+                    all_numbers[i] = False
+
+        text_rows.append(text_row)
+
+    if not text_rows:
+        return [], [], []
+
+    # Make sure rows are all the same size and if not, pad them.
+    num_cols = len(data_size)
+    for text_row in text_rows:
+        if len(text_row) < num_cols:
+            text_row.extend([''] * (num_cols - len(text_row)))
+
+    header_size = [len(text) for text in text_rows[0]]
+    col_size = [
+        max(header + HEADER_PADDING, data)
+        for header, data in zip(header_size, data_size)
+    ]
 
     # Adjust the width we're using. Need to remove 2 spaces for every column.
-    width = width - (len(col_size) * 2)
+    width = width - (num_cols * len(COLUMN_SEP))
 
     if sum(col_size) > width:
         # If the columns size is greater than the terminal width, we need to
         # shorten columns.
-        if width < (len(col_size) * 2):
+        if width < (num_cols * 2):
             # If the terminal width is less than the number of columns * 4,
             # then let's just minimize all the columns and call it a day.
-            col_size = [4] * len(col_size)
-
+            col_size = [4] * num_cols
         else:
-            while sum(col_size) > width:
-                # Find a column > 40 characters and reduce it.
-                bigger_than_40 = [(i, col) for i, col in enumerate(col_size) if col > 40]
-                if bigger_than_40:
-                    i, col = bigger_than_40[0]
-                    col_size[i] = col_size[i] - 1
-                    continue
-
-                # FIXME: All columns are less than 40, so we need to try
-                # something different.
-                break
+            col_size = _shrink(col_size, width)
 
         # FIXME: For long text columns, we don't want to truncate, we want to
         # wrap.
         # Now go through and truncate columns to the new col_size
-        for row in rows:
-            for i, col in enumerate(row):
-                if len(str(col)) > col_size[i]:
-                    row[i] = col[:col_size[i]-1] + '*'
-
-    elif sum(col_size) < width:
+        for text_row in text_rows:
+            for i, text in enumerate(text_row):
+                if len(text) > col_size[i]:
+                    text_row[i] = text[:col_size[i] - 1] + '*'
+
+        for i, size in enumerate(col_size):
+            if data_size[i] > size:
+                # Truncated numbers aren't numbers anymore
+                all_numbers[i] = False
+            header_size[i] = min(header_size[i], size)
+            data_size[i] = min(data_size[i], size)
+
+    elif sum(col_size) < width and 'content' in text_rows[0]:
         # If the columns size is less than the terminal width, we need to
         # lengthen columns.
 
-        # FIXME: This is a fudge factor that "makes it work", but I'm not clear
-        # on why.
-        width = width - 2
-
         # FIXME: We (abuse) knowledge of which is the content column and expand
-        # that.
-        if 'content' in rows[0]:
-            content_index = rows[0].index('content')
-            adj = width - (sum(col_size) - col_size[content_index])
-            for row in rows:
-                row[content_index] = row[content_index] + (' ' * (adj - len(row[content_index])))
-
-    return tabulate.tabulate(rows, headers="firstrow")
+        # that. The 2 is the header padding that gets added back below.
+        content_index = text_rows[0].index('content')
+        adj = (width - HEADER_PADDING) - (sum(col_size) - col_size[content_index])
+        header_size[content_index] = max(header_size[content_index], adj)
+
+    col_widths = [
+        max(header + HEADER_PADDING, data)
+        for header, data in zip(header_size, data_size)
+    ]
+    right_align = [
+        number and seen for number, seen in zip(all_numbers, seen_number)
+    ]
+    return text_rows, col_widths, right_align
+
+
+def format_row(text_row, col_widths, right_align):
+    """Formats one row of cell text into a line"""
+    cells = []
+    for text, col_width, right in zip(text_row, col_widths, right_align):
+        if right:
+            cells.append(text.rjust(col_width))
+        else:
+            cells.append(text.ljust(col_width))
+    return COLUMN_SEP.join(cells).rstrip()
+
+
+def iter_table_lines(width, rows):
+    """Yields the lines of a table with a header and a line of dashes
+
+    :arg width: the width to fit the table in
+    :arg rows: iterable of rows; the first row is the header
+
+    """
+    text_rows, col_widths, right_align = table_layout(width, rows)
+    if not text_rows:
+        return
+
+    yield format_row(text_rows[0], col_widths, right_align)
+    yield COLUMN_SEP.join('-' * col_width for col_width in col_widths)
+    for text_row in text_rows[1:]:
+        yield format_row(text_row, col_widths, right_align)
+
+
+def prettytable(width, rows):
+    """Renders rows as a plain text table that fits in width
+
+    The first row is the header. Numeric columns are right-aligned and
+    everything else is left-aligned.
+
+    """
+    return '\n'.join(iter_table_lines(width, rows))
@@ -0,0 +1,256 @@
+import contextlib
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows doesn't have fcntl, so the queue isn't locked there
+    fcntl = None
+
+from francis.cache import cache_key
+
+
+# Todoist accepts at most 100 commands per sync request.
+MAX_BATCH_SIZE = 100
+
+
+class WriteQueue:
+    """Append-only queue of writes that haven't made it to Todoist yet
+
+    Each entry is one line of JSON holding the sync commands a francis
+    command generated along with the Actions it applied. Entries are only
+    ever appended, so a crash mid-write loses at most the entry being
+    written.
+
+    """
+    def __init__(self, cache_dir, auth_token):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, 'queue-%s.jsonl' % cache_key(auth_token))
+
+    def _makedirs(self):
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Holds an exclusive lock on the queue while it's changed
+
+        The lock is on a separate file because ``replace`` renames a new file
+        over the queue.
+
+        """
+        if fcntl is None:
+            yield
+            return
+
+        self._makedirs()
+        fd = os.open(self.path + '.lock', os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the file releases the lock
+            os.close(fd)
+
+    def append(self, commands, actions=()):
+        """Adds an entry to the queue
+
+        :arg commands: list of Todoist sync command dicts
+        :arg actions: list of Action objects for the commands
+
+        """
+        self._makedirs()
+        entry = {
+            'queued_at': time.time(),
+            'commands': list(commands),
+            'actions': [action.to_dict() for action in actions],
+        }
+        with self.lock():
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            with os.fdopen(fd, 'a') as fp:
+                fp.write(json.dumps(entry) + '\n')
+
+    def read(self):
+        """Returns the list of entries in the queue
+
+        Lines that aren't valid JSON (for example, a partial write from a
+        crash) are skipped.
+
+        """
+        return self.read_with_offset()[0]
+
+    def read_with_offset(self):
+        """Returns the entries in the queue and where they end in the file
+
+        Pass the offset to ``replace`` to replace the entries that were read
+        while keeping anything that was appended after.
+
+        :returns: (entries, offset)
+
+        """
+        try:
+            with open(self.path, 'rb') as fp:
+                data = fp.read()
+        except (IOError, OSError):
+            return [], 0
+
+        # A trailing line without a newline is still being written
+        offset = data.rfind(b'\n') + 1
+        entries = []
+        for line in data[:offset].splitlines():
+            try:
+                entries.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                continue
+        return entries, offset
+
+    def replace(self, entries, offset=None):
+        """Replaces the contents of the queue with entries
+
+        :arg entries: list of entries
+        :arg offset: (optional) offset from ``read_with_offset``; if given,
+            only the entries read up to it are replaced and anything that
+            was appended since is kept after entries
+
+        """
+        with self.lock():
+            rest = b''
+            if offset is not None:
+                try:
+                    with open(self.path, 'rb') as fp:
+                        fp.seek(offset)
+                        rest = fp.read()
+                except (IOError, OSError):
+                    pass
+
+            if not entries and not rest:
+                self._remove()
+                return
+
+            tmp_path = self.path + '.tmp'
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as fp:
+                for entry in entries:
+                    fp.write((json.dumps(entry) + '\n').encode('utf-8'))
+                fp.write(rest)
+            os.rename(tmp_path, self.path)
+
+    def clear(self):
+        """Removes everything from the queue"""
+        with self.lock():
+            self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def find_conflicts(api, entry):
+    """Returns the ids of items that changed since the entry was queued
+
+    An Action records the item's seq_no when it was applied. If the synced
+    item has a different seq_no, someone else changed it in the meantime and
+    replaying the entry could clobber their change.
+
+    """
+    conflicts = []
+    for action in entry['actions']:
+        if action.get('item_seq_no') is None:
+            continue
+
+        item = api.items.get_by_id(action['item_id'], only_local=True)
+        if item is None or item.data.get('seq_no') != action['item_seq_no']:
+            conflicts.append(action['item_id'])
+    return conflicts
+
+
+def build_batches(entries, batch_size=MAX_BATCH_SIZE):
+    """Groups entries into batches of at most batch_size commands
+
+    Entries are never split across batches so commands that refer to a temp
+    id from an earlier command in the same entry go out together.
+
+    """
+    batches = []
+    batch = []
+    batch_commands = 0
+    for entry in entries:
+        num_commands = len(entry['commands'])
+        if batch and batch_commands + num_commands > batch_size:
+            batches.append(batch)
+            batch = []
+            batch_commands = 0
+        batch.append(entry)
+        batch_commands += num_commands
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def flush(api, write_queue, batch_size=MAX_BATCH_SIZE):
+    """Replays queued writes against a freshly synced api
+
+    Conflicts are checked against the synced state before anything is sent,
+    so entries queued one after another against the same item don't trip
+    over each other.
+
+    If a batch fails to send, it and everything after it stay in the queue
+    and the exception is re-raised. Commands carry a uuid, so Todoist ignores
+    any that it already applied if the batch gets sent again.
+
+    Entries that another command appends while the flush is running stay in
+    the queue for the next flush.
+
+    :arg api: a synced TodoistAPI
+    :arg write_queue: the WriteQueue to flush
+    :arg batch_size: maximum number of commands per commit
+
+    :returns: (sent, conflicts, errors) where sent is the list of entries
+        sent, conflicts is a list of (entry, item_ids) for entries that were
+        dropped because the items had changed and errors is a list of
+        (command uuid, error) for commands Todoist rejected
+
+    """
+    entries, offset = write_queue.read_with_offset()
+
+    ready = []
+    conflicts = []
+    for entry in entries:
+        conflict_ids = find_conflicts(api, entry)
+        if conflict_ids:
+            conflicts.append((entry, conflict_ids))
+        else:
+            ready.append(entry)
+
+    sent = []
+    errors = []
+    batches = build_batches(ready, batch_size)
+    for i, batch in enumerate(batches):
+        for entry in batch:
+            api.queue.extend(entry['commands'])
+        try:
+            resp = api.commit(raise_on_error=False)
+        except Exception:
+            del api.queue[:]
+            write_queue.replace(
+                [entry for remaining in batches[i:] for entry in remaining], offset
+            )
+            raise
+        sent.extend(batch)
+
+        # Rejected commands won't get any better by sending them again, so
+        # they get reported rather than requeued.
+        for uuid, status in sorted(((resp or {}).get('sync_status') or {}).items()):
+            if status != 'ok':
+                errors.append((uuid, status))
+
+    write_queue.replace([], offset)
+    return sent, conflicts, errors
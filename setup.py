@@ -23,7 +23,6 @@ def get_file(fn):
 requirements = [
     'click',
     'pendulum',
-    'tabulate',
     'todoist-python',
 ]
 
@@ -0,0 +1,36 @@
+from benchmarks import bench
+from benchmarks.fixtures import build_api, build_state
+
+
+class Test_fixtures:
+    def test_build_state(self):
+        state = build_state(100, num_projects=10)
+        assert len(state['items']) == 100
+        assert len(state['projects']) == 10
+        # Same seed, same data
+        assert build_state(100, num_projects=10) == state
+
+        api = build_api(state)
+        assert len(api.items.all()) == 100
+        assert api.projects.get_by_id(1, only_local=True)['name'] == 'Inbox'
+
+
+class Test_run_benchmarks:
+    def test_smoke(self):
+        # Keeps the benchmarks from rotting; the numbers don't matter here
+        results = bench.run_benchmarks(sizes=[50], repeat=1)
+        assert (
+            [res['name'] for res in results] ==
+            [name for name, setup in bench.BENCHMARKS]
+        )
+        assert all(res['seconds'] >= 0 for res in results)
+
+    def test_compare(self):
+        old = [{'name': 'prettytable', 'size': 10, 'seconds': 0.2}]
+        new = [
+            {'name': 'prettytable', 'size': 10, 'seconds': 0.1},
+            {'name': 'parse_date', 'size': 10, 'seconds': 0.1},
+        ]
+        lines = list(bench.compare(old, new))
+        assert len(lines) == 2
+        assert lines[1].endswith('2.00x')
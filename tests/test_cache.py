@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+import todoist
+
+from francis.cache import (
+    CACHE_VERSION,
+    SyncCache,
+    get_cache_dir,
+)
+
+
+def build_api():
+    api = todoist.api.TodoistAPI('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'items': [
+            {'id': 1001, 'content': 'first item', 'project_id': 1},
+            {'id': 1002, 'content': 'second item', 'project_id': 1},
+        ],
+        'projects': [
+            {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+        ],
+    })
+    return api
+
+
+class Test_get_cache_dir:
+    def test_from_config(self):
+        assert get_cache_dir({'cache_dir': '/tmp/foo'}) == '/tmp/foo'
+
+    def test_default(self, monkeypatch):
+        monkeypatch.setenv('XDG_CACHE_HOME', '/tmp/xdg')
+        assert get_cache_dir({}) == '/tmp/xdg/francis'
+
+
+class TestSyncCache:
+    def test_round_trip(self, tmpdir):
+        cache = SyncCache(str(tmpdir), 'token')
+        cache.save(build_api())
+
+        api = todoist.api.TodoistAPI('token', cache=None)
+        assert cache.load(api) is True
+        assert api.sync_token == 'abc'
+        assert (
+            sorted(item['content'] for item in api.items.all()) ==
+            ['first item', 'second item']
+        )
+        assert api.projects.all()[0]['name'] == 'Inbox'
+
+    def test_load_builds_models_directly(self, tmpdir, monkeypatch):
+        api = build_api()
+        api.state['user'] = {'id': 7, 'full_name': 'Francis'}
+        cache = SyncCache(str(tmpdir), 'token')
+        cache.save(api)
+
+        # Looking objects up one at a time is what made loading quadratic
+        def find_object(self, objtype, obj):
+            raise AssertionError('looked up %s' % objtype)
+        monkeypatch.setattr(todoist.api.TodoistAPI, '_find_object', find_object)
+
+        api = todoist.api.TodoistAPI('token', cache=None)
+        assert cache.load(api) is True
+        item = api.items.get_by_id(1002, only_local=True)
+        assert isinstance(item, todoist.models.Item)
+        assert item.api is api
+        assert api.state['projects'][0]['name'] == 'Inbox'
+        assert api.state['user']['full_name'] == 'Francis'
+
+    def test_missing(self, tmpdir):
+        cache = SyncCache(str(tmpdir), 'token')
+        api = todoist.api.TodoistAPI('token', cache=None)
+        assert cache.load(api) is False
+        assert api.sync_token == '*'
+
+    def test_corrupt(self, tmpdir):
+        cache = SyncCache(str(tmpdir), 'token')
+        with open(cache.path, 'w') as fp:
+            fp.write('{"version": 1, "sync')
+
+        api = todoist.api.TodoistAPI('token', cache=None)
+        assert cache.load(api) is False
+        assert api.sync_token == '*'
+
+    def test_version_mismatch(self, tmpdir):
+        cache = SyncCache(str(tmpdir), 'token')
+        cache.save(build_api())
+        with open(cache.path, 'r') as fp:
+            data = json.load(fp)
+        data['version'] = CACHE_VERSION + 1
+        with open(cache.path, 'w') as fp:
+            json.dump(data, fp)
+
+        assert cache.load(todoist.api.TodoistAPI('token', cache=None)) is False
+
+    def test_too_old(self, tmpdir):
+        cache = SyncCache(str(tmpdir), 'token', max_age=60)
+        cache.save(build_api())
+        with open(cache.path, 'r') as fp:
+            data = json.load(fp)
+        data['synced_at'] = time.time() - 120
+        with open(cache.path, 'w') as fp:
+            json.dump(data, fp)
+
+        assert cache.load(todoist.api.TodoistAPI('token', cache=None)) is False
+
+    def test_keyed_by_token(self, tmpdir):
+        cache_a = SyncCache(str(tmpdir), 'token a')
+        cache_b = SyncCache(str(tmpdir), 'token b')
+        assert cache_a.path != cache_b.path
+        assert 'token' not in os.path.basename(cache_a.path)
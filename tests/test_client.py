@@ -0,0 +1,102 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from francis.client import iter_completed, run_concurrently
+
+
+class FakeCompleted:
+    def __init__(self, num_items, latency=0.0):
+        self.items = [{'task_id': i} for i in range(num_items)]
+        self.latency = latency
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_all(self, limit, offset, **kwargs):
+        with self.lock:
+            self.calls.append((offset, kwargs))
+        time.sleep(self.latency)
+        return {'items': self.items[offset:offset + limit], 'projects': {}}
+
+
+class FakeAPI:
+    def __init__(self, num_items, latency=0.0):
+        self.completed = FakeCompleted(num_items, latency)
+
+
+class Test_run_concurrently:
+    def test_order(self):
+        def make(i):
+            # Later ones finish first
+            def func():
+                time.sleep(0.05 * (3 - i))
+                return i
+            return func
+
+        assert run_concurrently([make(i) for i in range(4)]) == [0, 1, 2, 3]
+
+    def test_empty(self):
+        assert run_concurrently([]) == []
+
+    def test_concurrent(self):
+        start = time.time()
+        run_concurrently([lambda: time.sleep(0.2)] * 4)
+        assert time.time() - start < 0.6
+
+    def test_max_workers(self):
+        running = []
+        most = []
+        lock = threading.Lock()
+
+        def func():
+            with lock:
+                running.append(1)
+                most.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        run_concurrently([func] * 6, max_workers=2)
+        assert max(most) == 2
+
+    def test_exception(self):
+        def fail():
+            raise ValueError('kaboom')
+
+        with pytest.raises(ValueError):
+            run_concurrently([lambda: 1, fail])
+
+
+class Test_iter_completed:
+    def test_one_page(self):
+        api = FakeAPI(5)
+        since = datetime.datetime(2016, 7, 18)
+        items = list(iter_completed(api, since, None, page_size=10))
+        assert len(items) == 5
+        assert api.completed.calls == [(0, {'since': '2016-07-18T00:00'})]
+
+    def test_pages(self):
+        api = FakeAPI(95)
+        items = list(iter_completed(api, None, None, page_size=10))
+        assert [item['task_id'] for item in items] == list(range(95))
+        # Batches of 1, 1, 2, 4 and 4 pages
+        offsets = sorted(offset for offset, kwargs in api.completed.calls)
+        assert offsets == [i * 10 for i in range(12)]
+
+    def test_exact_page(self):
+        api = FakeAPI(10)
+        items = list(iter_completed(api, None, None, page_size=10))
+        assert len(items) == 10
+        assert len(api.completed.calls) == 2
+
+    def test_pages_concurrent(self):
+        api = FakeAPI(80, latency=0.1)
+        start = time.time()
+        items = list(iter_completed(api, None, None, page_size=10, max_concurrency=4))
+        elapsed = time.time() - start
+        assert len(items) == 80
+        # 12 pages in 5 rounds rather than one after another
+        assert len(api.completed.calls) == 12
+        assert elapsed < 1.0
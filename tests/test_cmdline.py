@@ -0,0 +1,549 @@
+import datetime
+import io
+import json
+
+import click
+import pytest
+import requests
+import todoist
+from click.testing import CliRunner
+
+from francis import cmdline
+from francis.cache import SyncCache
+from francis.util import local_to_utc
+
+
+PROJECTS = [
+    {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+    {'id': 2, 'name': 'Work'},
+]
+
+
+def due_on(day):
+    # All-day tasks are due at 23:59:59 local time
+    when = datetime.datetime.combine(day, datetime.time(23, 59, 59))
+    return local_to_utc(when).strftime('%a %d %b %Y %H:%M:%S +0000')
+
+
+def build_items():
+    today = datetime.date.today()
+    return [
+        {'id': 1001, 'content': 'tweak befunge valve', 'project_id': 2, 'priority': 4,
+         'due_date': due_on(today), 'date_string': 'today'},
+        {'id': 1002, 'content': 'file timesheet', 'project_id': 1, 'priority': 1,
+         'due_date': due_on(today + datetime.timedelta(days=1)), 'date_string': 'tomorrow'},
+    ]
+
+
+class FakeServer:
+    """Stands in for the network parts of TodoistAPI and counts calls"""
+    def __init__(self):
+        self.syncs = 0
+        self.queries = []
+        self.completed = []
+        self.completed_calls = []
+
+    def build_api(self):
+        api = todoist.api.TodoistAPI('token', cache=None)
+        api._update_state({
+            'sync_token': 'abc',
+            'items': build_items(),
+            'projects': [dict(proj) for proj in PROJECTS],
+        })
+        api.query = self.query
+        api.completed.get_all = self.get_completed
+        return api
+
+    def add_completed(self, when, content):
+        self.completed.append({
+            'task_id': 2000 + len(self.completed),
+            'content': content,
+            'project_id': 2,
+            'completed_date': local_to_utc(when).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+
+    def get_completed(self, limit, offset=0, since=None, until=None):
+        self.completed_calls.append((since, until, limit, offset))
+        items = [
+            item for item in self.completed
+            if (since or '') <= item['completed_date'][:16] <= (until or '9999')
+        ]
+        return {'items': items[offset:offset + limit], 'projects': {}}
+
+    def query(self, queries):
+        self.queries.append(list(queries))
+        return [
+            {'type': 'date', 'query': query, 'data': build_items()}
+            for query in queries
+        ]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+
+    def get_api(cfg, ctx, **kwargs):
+        server.syncs += 1
+        return server.build_api()
+
+    monkeypatch.setattr(cmdline, 'get_config', lambda: {'auth_token': 'token'})
+    monkeypatch.setattr(cmdline, 'get_api', get_api)
+    monkeypatch.setattr(cmdline, 'build_api', lambda cfg: server.build_api())
+    return server
+
+
+def run(*args):
+    result = CliRunner().invoke(cmdline.cli, list(args), obj={})
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    return result
+
+
+class Test_map_profiles:
+    def test_one_profile(self):
+        ctx = click.Context(cmdline.cli, obj={})
+
+        def func(cfg, ctx):
+            ctx.obj['from_cache'] = True
+            return cfg['auth_token']
+        assert cmdline.map_profiles({'auth_token': 'token'}, ctx, func) == [
+            (None, 'token', True)
+        ]
+
+    def test_from_cache_per_profile(self):
+        cfg = {'auth_token': 'token', 'profiles': {'work': {'auth_token': 'work-token'}}}
+        ctx = click.Context(cmdline.cli, obj={'all_profiles': True})
+
+        def func(cfg, ctx):
+            if cfg['auth_token'] == 'work-token':
+                ctx.obj['from_cache'] = True
+            return cfg['auth_token']
+        assert cmdline.map_profiles(cfg, ctx, func) == [
+            ('default', 'token', False),
+            ('work', 'work-token', True),
+        ]
+        assert 'from_cache' not in ctx.obj
+
+    def test_output_in_threads(self):
+        cfg = {'auth_token': 'token', 'profiles': {'work': {'auth_token': 'work-token'}}}
+        output = io.StringIO()
+        ctx = click.Context(cmdline.cli, obj={'all_profiles': True, 'output': output})
+
+        def func(cfg, ctx):
+            cmdline.echo('synced %s' % cfg['auth_token'])
+        cmdline.map_profiles(cfg, ctx, func)
+        assert sorted(output.getvalue().splitlines()) == ['synced token', 'synced work-token']
+
+
+class Test_get_day_queries:
+    def test_days(self):
+        start = datetime.date(2016, 1, 30)
+        assert cmdline.get_day_queries(start, 1) == ['today']
+        assert (
+            cmdline.get_day_queries(start, 4) ==
+            ['today', 'tomorrow', 'feb 1', 'feb 2']
+        )
+
+    def test_next_year(self):
+        start = datetime.date(2026, 12, 30)
+        assert (
+            cmdline.get_day_queries(start, 5) ==
+            ['today', 'tomorrow', 'jan 1 2027', 'jan 2 2027', 'jan 3 2027']
+        )
+
+
+class Test_list:
+    def test_list(self, server):
+        result = run('list', 'today')
+        # Evaluated locally without a query round trip
+        assert server.syncs == 1
+        assert server.queries == []
+        assert '[today]' in result.output
+        assert 'tweak befunge valve' in result.output
+        assert 'Work' in result.output
+        assert 'file timesheet' not in result.output
+
+    def test_pager(self, server):
+        result = run('--pager', 'list', 'today')
+        assert 'tweak befunge valve' in result.output
+
+    def test_unknown_query_goes_to_server(self, server):
+        result = run('list', 'p1')
+        assert server.queries == [['p1']]
+        assert '[p1]' in result.output
+
+    @pytest.mark.parametrize('query', ['today | overdue', 'tod & p1', 'tomorrow 5pm', '7 days'])
+    def test_filters_go_to_server(self, server, query):
+        run('list', query)
+        assert server.queries == [[query]]
+
+
+class Test_thisweek:
+    def test_one_sync_no_queries(self, server):
+        result = run('thisweek')
+        assert server.syncs == 1
+        assert server.queries == []
+        assert '[today]' in result.output
+        assert 'tweak befunge valve' in result.output
+
+
+class Test_agenda:
+    def test_one_sync_no_queries(self, server):
+        result = run('agenda', '--days=5')
+        assert server.syncs == 1
+        assert server.queries == []
+        assert result.output.count('[') == 5
+        assert result.output.count('tweak befunge valve') == 1
+        assert result.output.count('file timesheet') == 1
+
+
+class Test_timesheet:
+    def test_sync_messages_go_to_output(self, server, monkeypatch):
+        def get_api(cfg, ctx, **kwargs):
+            cmdline.echo('Sent 1 queued change(s) to Todoist.')
+            return server.build_api()
+        monkeypatch.setattr(cmdline, 'get_api', get_api)
+
+        # What the daemon does to send the output to its client
+        output = io.StringIO()
+        CliRunner().invoke(cmdline.cli, ['timesheet'], obj={'output': output})
+        assert 'Sent 1 queued change(s) to Todoist.' in output.getvalue()
+
+    def test_whole_week_untruncated(self, server, monkeypatch):
+        # Wednesday, January 6th, 2016; the week starts Sunday January 3rd
+        monkeypatch.setattr(cmdline, 'today', lambda: datetime.datetime(2016, 1, 6))
+
+        for i in range(250):
+            server.add_completed(datetime.datetime(2016, 1, 4, 9, 0), 'busy %s' % i)
+        server.add_completed(datetime.datetime(2016, 1, 9, 23, 30), 'late saturday')
+        # Last week
+        server.add_completed(datetime.datetime(2016, 1, 2, 12, 0), 'last week')
+
+        result = run('timesheet')
+        # One ranged fetch split into two pages
+        assert len(server.completed_calls) == 2
+        assert '[Sunday (2016-01-03): 0]' in result.output
+        assert '[Monday (2016-01-04): 250]' in result.output
+        assert '[Saturday (2016-01-09): 1]' in result.output
+        assert 'busy 249' in result.output
+        assert 'late saturday' in result.output
+        assert 'last week' not in result.output
+
+
+@pytest.fixture
+def cached_config(monkeypatch, tmpdir):
+    cfg = {'auth_token': 'token', 'cache_dir': str(tmpdir)}
+    monkeypatch.setattr(cmdline, 'get_config', lambda: cfg)
+
+    today = datetime.date.today()
+    api = todoist.api.TodoistAPI('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'projects': [dict(proj) for proj in PROJECTS],
+        'items': [
+            {'id': 1001, 'content': 'due today', 'project_id': 2, 'priority': 4,
+             'due_date': due_on(today), 'date_string': 'today', 'seq_no': 1},
+            {'id': 1002, 'content': 'overdue', 'project_id': 1, 'priority': 1,
+             'due_date': due_on(today - datetime.timedelta(days=3)),
+             'date_string': 'a while ago'},
+            {'id': 1003, 'content': 'done today', 'project_id': 1, 'priority': 1,
+             'due_date': due_on(today), 'date_string': 'today', 'checked': 1},
+        ],
+    })
+    SyncCache.from_config(cfg).save(api)
+
+    # Any attempt to talk to the server is a failure
+    def no_network(*args, **kwargs):
+        raise AssertionError('tried to use the network')
+    monkeypatch.setattr(todoist.api.TodoistAPI, 'sync', no_network)
+    monkeypatch.setattr(todoist.api.TodoistAPI, 'query', no_network)
+    return cfg
+
+
+class Test_offline:
+    def test_list(self, cached_config):
+        result = run('--offline', 'list', 'today', 'overdue')
+        assert '[Offline: data synced' in result.output
+        assert 'due today' in result.output
+        assert 'done today' not in result.output
+        assert '[Over due]' in result.output
+        assert 'overdue' in result.output
+
+    def test_show(self, cached_config):
+        result = run('--offline', 'show', '1001')
+        assert 'content:  due today' in result.output
+
+    def test_max_staleness(self, cached_config):
+        cached_config['max_staleness'] = '3600'
+        result = run('today')
+        assert '[Offline: data synced' in result.output
+        assert 'due today' in result.output
+
+    def test_unreachable(self, cached_config, monkeypatch):
+        def unreachable(*args, **kwargs):
+            raise requests.exceptions.ConnectionError('down')
+        monkeypatch.setattr(todoist.api.TodoistAPI, 'sync', unreachable)
+
+        result = run('today')
+        assert result.exit_code == 0
+        assert 'Couldn\'t reach Todoist.' in result.output
+        assert '[Offline: data synced' in result.output
+        assert 'due today' in result.output
+
+    def test_export_messages_go_to_stderr(self, cached_config, monkeypatch):
+        result = run('--offline', 'export', '--no-completed')
+        assert '[Offline: data synced' in result.stderr
+        assert 'Exported 2 record(s).' in result.stderr
+        assert [json.loads(line)['id'] for line in result.stdout.splitlines()] == [1001, 1002]
+
+        run('--offline', 'done', '1001')
+        FakeSync().install(monkeypatch)
+        result = run('export', '--no-completed')
+        assert 'Sent 1 queued change(s)' in result.stderr
+        assert 'Sent' not in result.stdout
+
+    def test_network_commands_fail(self, cached_config):
+        result = run('--offline', 'timesheet')
+        assert 'can\'t run with --offline' in result.output
+        assert result.exit_code == 1
+
+    def test_no_cache(self, cached_config, tmpdir):
+        cached_config['cache_dir'] = str(tmpdir.join('empty'))
+        result = run('--offline', 'today')
+        assert 'no cached data' in result.output
+        assert result.exit_code == 1
+
+
+class FakeSync:
+    """Replaces TodoistAPI.sync and records the commands sent"""
+    def __init__(self, updates=None):
+        self.commands = []
+        self.updates = updates or {}
+
+    def install(self, monkeypatch):
+        def sync(api, commands=None):
+            return self.sync(api, commands)
+        monkeypatch.setattr(todoist.api.TodoistAPI, 'sync', sync)
+        return self
+
+    def sync(self, api, commands=None):
+        if commands:
+            self.commands.append(list(commands))
+            return {'sync_status': dict((cmd['uuid'], 'ok') for cmd in commands)}
+        api._update_state(self.updates)
+        return dict(self.updates)
+
+
+class Test_write_queue:
+    def test_offline_writes_are_queued_and_flushed(self, cached_config, monkeypatch):
+        result = run('--offline', 'done', '1001')
+        assert 'Marked as done #1001' in result.output
+        assert 'Changes queued' in result.output
+
+        result = run('--offline', 'modify', '1002', 'pri:H')
+        assert 'Changes queued' in result.output
+
+        fake_sync = FakeSync().install(monkeypatch)
+        result = run('flush')
+        assert 'Sent 2 queued change(s)' in result.output
+
+        # Both changes go out in one batch
+        assert len(fake_sync.commands) == 1
+        assert (
+            [cmd['type'] for cmd in fake_sync.commands[0]] ==
+            ['item_complete', 'item_update']
+        )
+
+        result = run('flush')
+        assert 'Nothing to flush' in result.output
+
+    def test_conflicts_are_skipped(self, cached_config, monkeypatch):
+        run('--offline', 'done', '1001')
+
+        # Someone changed the item in the meantime
+        fake_sync = FakeSync({'items': [{'id': 1001, 'seq_no': 99}]}).install(monkeypatch)
+        result = run('flush')
+        assert 'Skipped a queued change to #1001' in result.output
+        assert fake_sync.commands == []
+
+    def test_flushed_by_next_online_command(self, cached_config, monkeypatch):
+        run('--offline', 'add', 'buy', 'milk')
+
+        fake_sync = FakeSync().install(monkeypatch)
+        result = run('show', '1001')
+        assert 'Sent 1 queued change(s)' in result.output
+        assert [cmd['type'] for cmd in fake_sync.commands[0]] == ['item_add']
+
+
+class Test_import:
+    def test_taskwarrior(self, cached_config, monkeypatch, tmpdir):
+        path = tmpdir.join('tasks.json')
+        path.write(
+            '[\n'
+            '{"description": "Due Today", "project": "work", "status": "pending"},\n'
+            '{"description": "buy milk", "priority": "H", "due": "20160722T120000Z"},\n'
+            '{"description": "old", "status": "completed"},\n'
+            '{"description": "buy  MILK", "status": "pending"},\n'
+            '{"description": "fix bike", "project": "nope"}\n'
+            ']\n'
+        )
+
+        fake_sync = FakeSync().install(monkeypatch)
+        result = run('import', str(path))
+        assert 'Imported 1 task(s). Skipped 2 duplicate(s).' in result.output
+        assert 'ERROR: Record 5: "nope" is not a project.' in result.output
+
+        assert len(fake_sync.commands) == 1
+        [cmd] = fake_sync.commands[0]
+        assert cmd['type'] == 'item_add'
+        assert cmd['args']['content'] == 'buy milk'
+        assert cmd['args']['project_id'] == 1
+        assert cmd['args']['priority'] == 4
+        assert cmd['args']['date_string'] == '2016-07-22'
+
+    def test_csv_batches(self, cached_config, monkeypatch, tmpdir):
+        path = tmpdir.join('tasks.csv')
+        path.write(
+            'Content,Project,Due\n' +
+            ''.join('task %d,Work,tomorrow\n' % i for i in range(5))
+        )
+
+        fake_sync = FakeSync().install(monkeypatch)
+        result = run('import', '--batch-size=2', str(path))
+        assert 'Imported 5 task(s)' in result.output
+        assert [len(commands) for commands in fake_sync.commands] == [2, 2, 1]
+        assert fake_sync.commands[0][0]['args']['project_id'] == 2
+
+
+class Test_export:
+    def test_jsonl(self, server, tmpdir):
+        server.add_completed(datetime.datetime(2016, 7, 22, 10, 0), 'wrote report')
+        path = tmpdir.join('out.jsonl')
+
+        result = run('export', '-o', str(path))
+        assert 'Exported 3 record(s).' in result.output
+
+        records = [json.loads(line) for line in path.read().splitlines()]
+        assert [(rec['type'], rec['content']) for rec in records] == [
+            ('item', 'tweak befunge valve'),
+            ('item', 'file timesheet'),
+            ('completed', 'wrote report'),
+        ]
+        assert records[0]['project'] == 'Work'
+        assert records[2]['completed_date'].endswith('Z')
+        # All of history by default
+        assert server.completed_calls[0][:2] == (None, None)
+
+    def test_csv_without_completed(self, server, tmpdir):
+        path = tmpdir.join('out.csv')
+
+        run('export', '--format=csv', '--no-completed', '-o', str(path))
+        lines = path.read().splitlines()
+        assert lines[0] == 'type,id,content,project,priority,due_date,date_string,completed_date'
+        assert len(lines) == 3
+        assert server.completed_calls == []
+
+    @pytest.mark.parametrize('fmt', ['jsonl', 'csv'])
+    def test_import_round_trip(self, server, monkeypatch, tmpdir, fmt):
+        server.add_completed(datetime.datetime(2016, 7, 22, 10, 0), 'wrote report')
+        path = tmpdir.join('out.' + fmt)
+        run('export', '--format=' + fmt, '-o', str(path))
+
+        # Import into an account with the same projects and no items
+        api = todoist.api.TodoistAPI('token', cache=None)
+        api._update_state({'sync_token': 'abc', 'projects': [dict(proj) for proj in PROJECTS]})
+        monkeypatch.setattr(cmdline, 'get_api', lambda cfg, ctx, **kwargs: api)
+        fake_sync = FakeSync().install(monkeypatch)
+
+        result = run('import', str(path))
+        assert 'Imported 2 task(s). Skipped 0 duplicate(s).' in result.output
+        assert 'ERROR' not in result.output
+        assert [
+            (cmd['args']['content'], cmd['args']['project_id'], cmd['args']['priority'],
+             cmd['args']['date_string'])
+            for cmd in fake_sync.commands[0]
+        ] == [
+            ('tweak befunge valve', 2, 4, 'today'),
+            ('file timesheet', 1, 1, 'tomorrow'),
+        ]
+
+    def test_since(self, server, tmpdir):
+        run('export', '--since=2016-07-01', '-o', str(tmpdir.join('out.jsonl')))
+        assert server.completed_calls[0][0].startswith('2016-0')
+
+
+class Test_undo:
+    def test_nothing_to_undo(self, cached_config):
+        result = run('undo')
+        assert 'Nothing to undo.' in result.output
+
+    def test_undo(self, cached_config, monkeypatch):
+        FakeSync().install(monkeypatch)
+        run('done', '1001')
+        run('modify', '1002', 'pri:H', 'proj:work')
+
+        fake_sync = FakeSync().install(monkeypatch)
+        result = run('undo', '2')
+        assert 'Undid project of #1002' in result.output
+        assert 'Undid priority of #1002' in result.output
+        assert 'Undid completed of #1001' in result.output
+
+        # Everything goes back in one commit
+        assert len(fake_sync.commands) == 1
+        commands = fake_sync.commands[0]
+        assert [cmd['type'] for cmd in commands] == ['item_move', 'item_update', 'item_uncomplete']
+        assert commands[0]['args']['project_id'] == 1
+        assert commands[1]['args']['priority'] == 1
+
+        result = run('undo')
+        assert 'Nothing to undo.' in result.output
+
+    def test_changed_items_are_skipped(self, cached_config, monkeypatch):
+        FakeSync().install(monkeypatch)
+        run('done', '1001')
+
+        # Someone changed the item since
+        fake_sync = FakeSync({'items': [{'id': 1001, 'seq_no': 99}]}).install(monkeypatch)
+        result = run('undo')
+        assert 'Skipped #1001 because it changed after "done"' in result.output
+        assert fake_sync.commands == []
+
+
+class Test_deferall:
+    def test_defers_everything_due_today(self, cached_config, monkeypatch):
+        fake_sync = FakeSync({'items': [
+            {'id': 1004, 'content': 'water plants', 'project_id': 1, 'priority': 1,
+             'due_date': due_on(datetime.date.today()), 'date_string': 'every day'},
+        ]}).install(monkeypatch)
+
+        run('deferall')
+        commands = sorted(fake_sync.commands[0], key=lambda cmd: cmd['args']['id'])
+        # "today" doesn't look like "%b %d" but it's still due today
+        assert commands[0]['args'] == {'id': 1001, 'date_string': 'tomorrow'}
+        # Recurring items keep their recurrence
+        assert commands[1]['args']['id'] == 1004
+        assert commands[1]['args']['date_string'] == 'every day'
+        assert 'due_date_utc' in commands[1]['args']
+        assert len(commands) == 2
+
+        result = run('undo')
+        assert 'Undid due of #1001' in result.output
+        assert 'Undid due_date of #1004' in result.output
+
+
+class Test_profile:
+    def test_profile(self, server):
+        result = run('--profile', 'list', 'today')
+        assert 'tweak befunge valve' in result.stdout
+        assert 'francis profile:' in result.stderr
+        for phase in ('imports', 'config', 'query', 'render'):
+            assert phase in result.stderr
+
+    def test_trace_env(self, server, monkeypatch, tmpdir):
+        path = str(tmpdir.join('trace.jsonl'))
+        monkeypatch.setenv('FRANCIS_TRACE', path)
+        result = run('list', 'today')
+        assert 'francis profile:' not in result.output
+
+        data = json.loads(open(path).read())
+        assert 'render' in [phase['name'] for phase in data['phases']]
@@ -0,0 +1,214 @@
+import os
+import socket
+import sys
+import threading
+
+import pytest
+import todoist
+
+from francis import cmdline, daemon
+from francis.cache import SyncCache
+from tests.test_cmdline import PROJECTS, build_items
+
+
+def build_api():
+    api = todoist.api.TodoistAPI('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'items': build_items(),
+        'projects': [dict(proj) for proj in PROJECTS],
+    })
+    return api
+
+
+@pytest.fixture
+def config(monkeypatch, tmpdir):
+    cfg = {'auth_token': 'token', 'cache_dir': str(tmpdir)}
+    monkeypatch.setattr(cmdline, 'get_config', lambda: cfg)
+    monkeypatch.setattr(daemon, 'get_config', lambda: cfg)
+    return cfg
+
+
+@pytest.fixture
+def syncs(monkeypatch):
+    """Keeps the daemon's api off the network and counts its syncs"""
+    calls = []
+
+    def fake_sync(api, commands=None):
+        calls.append(api)
+        return {}
+    monkeypatch.setattr(todoist.api.TodoistAPI, 'sync', fake_sync)
+    return calls
+
+
+@pytest.fixture
+def running_daemon(config, syncs):
+    api = build_api()
+    cache = SyncCache.from_config(config)
+    cache.save(api)
+    server = daemon.Daemon(daemon.get_socket_path(config), api, cache, refresh=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.stop()
+    thread.join()
+
+
+class Test_get_socket_path:
+    def test_default(self, config):
+        path = daemon.get_socket_path(config)
+        assert os.path.dirname(path) == config['cache_dir']
+        assert path.endswith('.sock')
+
+    def test_configured(self, config):
+        config['daemon_socket'] = '/tmp/francis-test.sock'
+        assert daemon.get_socket_path(config) == '/tmp/francis-test.sock'
+
+
+class TestDaemon:
+    def test_runs_commands_with_warm_api(self, running_daemon, monkeypatch):
+        def no_api(*args, **kwargs):
+            raise AssertionError('should use the daemon\'s api')
+        monkeypatch.setattr(todoist.api, 'TodoistAPI', no_api)
+
+        output, exit_code = daemon.send_command(running_daemon.path, ['list', 'today'])
+        assert exit_code == 0
+        assert '[today]' in output
+        assert 'tweak befunge valve' in output
+        assert 'file timesheet' not in output
+
+    def test_errors_are_reported(self, running_daemon):
+        output, exit_code = daemon.send_command(running_daemon.path, ['nonexistent'])
+        assert exit_code == 2
+        assert 'No such command' in output
+
+    def test_client_width(self, running_daemon):
+        widths = []
+        for width in (80, 200):
+            output, exit_code = daemon.send_command(
+                running_daemon.path, ['list', 'today'], width=width
+            )
+            table = [line for line in output.splitlines() if line.startswith('---')]
+            widths.append(len(table[0]))
+        assert widths[0] <= 80 < widths[1] <= 200
+
+    def test_client_trace(self, running_daemon):
+        output, exit_code = daemon.send_command(
+            running_daemon.path, ['list', 'today'], trace='json'
+        )
+        assert '"total"' in output.splitlines()[-1]
+
+    def test_output_is_not_global(self, running_daemon, monkeypatch, capsys):
+        def show_queries(ctx, apis, queries, spacer=False):
+            # Stands in for something else in the daemon writing to stdout
+            sys.stdout.write('not for the client\n')
+            cmdline.echo('for the client')
+        monkeypatch.setattr(cmdline, 'show_queries', show_queries)
+
+        output, exit_code = daemon.send_command(running_daemon.path, ['list', 'today'])
+        assert output == 'for the client\n'
+        assert 'not for the client' in capsys.readouterr().out
+
+    def test_failed_command_is_reset(self, running_daemon, monkeypatch, syncs):
+        def commit(cfg, ctx, api, history=()):
+            raise ValueError('kaboom')
+        monkeypatch.setattr(cmdline, 'commit', commit)
+
+        output, exit_code = daemon.send_command(running_daemon.path, ['modify', '1001', 'pri:L'])
+        assert exit_code == 1
+        assert 'kaboom' in output
+
+        api = running_daemon.api
+        assert api.queue == []
+        # Back to the cached state and synced
+        assert api.items.get_by_id(1001, only_local=True)['priority'] == 4
+        assert syncs[-1] is api
+
+    def test_socket_is_private(self, running_daemon):
+        assert os.stat(running_daemon.path).st_mode & 0o777 == 0o600
+
+    def test_socket_is_bound_private(self, config, monkeypatch):
+        # Nothing can connect between binding the socket and the chmod
+        modes = []
+
+        def chmod(path, mode):
+            modes.append(os.stat(path).st_mode & 0o777)
+        monkeypatch.setattr(os, 'chmod', chmod)
+        server = daemon.Daemon(daemon.get_socket_path(config), build_api(), refresh=0)
+        server.stop()
+        assert len(modes) == 1
+        assert modes[0] & 0o077 == 0
+
+    def test_refuses_second_daemon(self, running_daemon):
+        with pytest.raises(daemon.DaemonError):
+            daemon.Daemon(running_daemon.path, build_api(), refresh=0)
+
+
+class Test_get_profile_arg:
+    def test_values(self):
+        assert daemon.get_profile_arg(['list']) is None
+        assert daemon.get_profile_arg(['--use-profile', 'work', 'list']) == 'work'
+        assert daemon.get_profile_arg(['--use-profile=work', 'list']) == 'work'
+        assert daemon.get_profile_arg(['--use-profile']) is None
+
+
+class Test_runs_locally:
+    @pytest.mark.parametrize('argv', [
+        ['daemon'],
+        ['export', '--format=csv'],
+        ['--use-profile', 'work', 'import', 'tasks.csv'],
+        ['--offline', 'list'],
+        ['--pager', 'agenda'],
+        ['--help'],
+        ['add', '--help'],
+    ])
+    def test_local(self, argv):
+        assert daemon.runs_locally(argv)
+
+    @pytest.mark.parametrize('argv', [
+        [],
+        ['list', 'today'],
+        ['add', 'export', 'taxes'],
+        ['add', 'proj:Work', 'import', 'photos', '--offline'],
+        ['--use-profile', 'export', 'list'],
+        ['add', '--', '--help'],
+    ])
+    def test_daemon(self, argv):
+        assert not daemon.runs_locally(argv)
+
+
+class Test_run_via_daemon:
+    def test_sends_to_daemon(self, running_daemon, capsys):
+        assert daemon.run_via_daemon(['list', 'today']) == 0
+        assert 'tweak befunge valve' in capsys.readouterr().out
+
+    def test_local_only_args(self, running_daemon):
+        assert daemon.run_via_daemon(['--offline', 'list']) is None
+        assert daemon.run_via_daemon(['daemon']) is None
+        assert daemon.run_via_daemon(['--all-profiles', 'list']) is None
+
+    def test_profiles(self, running_daemon, config):
+        config['profiles'] = {'work': {'auth_token': 'work-token'}}
+        # The work account has no daemon running
+        assert daemon.run_via_daemon(['--use-profile', 'work', 'list']) is None
+        assert daemon.run_via_daemon(['--use-profile=nope', 'list']) is None
+        assert daemon.run_via_daemon(['--use-profile=default', 'list']) == 0
+
+    def test_no_daemon(self, config):
+        assert daemon.run_via_daemon(['list', 'today']) is None
+
+    def test_stale_socket(self, config):
+        # A socket file nothing is listening on
+        path = daemon.get_socket_path(config)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.close()
+
+        assert daemon.run_via_daemon(['list', 'today']) is None
+
+        # Starting a daemon cleans it up
+        server = daemon.Daemon(path, build_api(), refresh=0)
+        server.stop()
+        assert not os.path.exists(path)
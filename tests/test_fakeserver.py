@@ -0,0 +1,349 @@
+import datetime
+import json
+import time
+
+import pytest
+import requests
+import todoist
+from click.testing import CliRunner
+
+from benchmarks import loadtest
+from benchmarks.fakeserver import Account, FakeTodoistServer, RateLimiter
+from benchmarks.fixtures import due_on
+from francis import cmdline
+
+
+def build_account():
+    today = datetime.date.today()
+    return Account(
+        projects=[
+            {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+            {'id': 2, 'name': 'Work'},
+        ],
+        items=[
+            {'id': 1001, 'content': 'tweak befunge valve', 'project_id': 2, 'priority': 4,
+             'due_date': due_on(today), 'date_string': 'today', 'checked': 0},
+            {'id': 1002, 'content': 'file timesheet', 'project_id': 1, 'priority': 1,
+             'due_date': due_on(today - datetime.timedelta(days=3)), 'date_string': 'friday',
+             'checked': 0},
+        ],
+    )
+
+
+@pytest.fixture
+def fake_todoist():
+    server = FakeTodoistServer(build_account()).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_api(fake_todoist):
+    """A TodoistAPI that talks to the fake server"""
+    return todoist.api.TodoistAPI('token', api_endpoint=fake_todoist.endpoint, cache=None)
+
+
+@pytest.fixture
+def fake_cli(fake_todoist, monkeypatch, tmpdir):
+    """Points francis commands at the fake server"""
+    cfg = {
+        'auth_token': 'token',
+        'api_endpoint': fake_todoist.endpoint,
+        'cache_dir': str(tmpdir),
+    }
+    monkeypatch.setattr(cmdline, 'get_config', lambda: dict(cfg))
+    return fake_todoist
+
+
+def run(*args):
+    result = CliRunner().invoke(cmdline.cli, list(args), obj={})
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    return result
+
+
+class TestAccount:
+    def test_full_sync(self):
+        resp = build_account().sync('*')
+        assert resp['full_sync'] is True
+        assert [item['id'] for item in resp['items']] == [1001, 1002]
+        assert [proj['name'] for proj in resp['projects']] == ['Inbox', 'Work']
+
+    def test_incremental_sync(self):
+        account = build_account()
+        token = account.sync('*')['sync_token']
+        resp = account.sync(token, [
+            {'type': 'item_update', 'uuid': 'u1', 'args': {'id': 1002, 'priority': 4}},
+        ])
+        assert resp['full_sync'] is False
+        assert resp['sync_status'] == {'u1': 'ok'}
+        assert [(item['id'], item['priority']) for item in resp['items']] == [(1002, 4)]
+        assert resp['projects'] == []
+
+        resp = account.sync(resp['sync_token'])
+        assert resp['items'] == []
+
+    def test_add_maps_temp_ids(self):
+        account = build_account()
+        resp = account.sync('*', [
+            {'type': 'item_add', 'uuid': 'u1', 'temp_id': 't1',
+             'args': {'content': 'new item', 'project_id': 2, 'date_string': 'today'}},
+        ])
+        new_id = resp['temp_id_mapping']['t1']
+        item = account.items[new_id]
+        assert item['content'] == 'new item'
+        assert item['due_date'] == due_on(datetime.date.today())
+
+    def test_due_date_utc(self):
+        account = build_account()
+        account.sync('*', [
+            {'type': 'item_update', 'uuid': 'u1',
+             'args': {'id': 1001, 'due_date_utc': '2016-07-22T21:00',
+                      'date_string': 'every day'}},
+        ])
+        assert account.items[1001]['due_date'] == 'Fri 22 Jul 2016 21:00:00 +0000'
+        assert account.items[1001]['date_string'] == 'every day'
+
+    def test_complete(self):
+        account = build_account()
+        account.sync('*', [{'type': 'item_complete', 'uuid': 'u1', 'args': {'id': 1001}}])
+        assert account.items[1001]['checked'] == 1
+        events = account.get_completed()['items']
+        assert [event['task_id'] for event in events] == [1001]
+
+    def test_commands_run_once(self):
+        account = build_account()
+        command = {'type': 'item_complete', 'uuid': 'u1', 'args': {'id': 1001}}
+        account.sync('*', [command])
+        # A retried request doesn't complete it twice
+        resp = account.sync('*', [command])
+        assert resp['sync_status'] == {'u1': 'ok'}
+        assert len(account.get_completed()['items']) == 1
+
+    def test_errors(self):
+        resp = build_account().sync('*', [
+            {'type': 'item_update', 'uuid': 'u1', 'args': {'id': 5, 'priority': 4}},
+            {'type': 'item_frob', 'uuid': 'u2', 'args': {'id': 1001}},
+        ])
+        assert resp['sync_status']['u1']['error_code'] == 22
+        assert resp['sync_status']['u2']['error_code'] == 20
+
+    def test_query(self):
+        resp = build_account().query(['today', 'overdue', '#work'])
+        assert [section['type'] for section in resp] == ['date', 'overdue', 'date']
+        assert [item['id'] for item in resp[0]['data']] == [1001]
+        assert [item['id'] for item in resp[1]['data']] == [1002]
+        assert resp[2]['data'] == []
+
+    def test_generate(self):
+        account = Account.generate(100, num_projects=10)
+        assert len(account.items) == 100
+        assert len(account.projects) == 10
+        assert len(account.completed) == 10
+
+
+class TestRateLimiter:
+    def test_limit(self):
+        limiter = RateLimiter(2, 10)
+        assert limiter.check(now=100) is None
+        assert limiter.check(now=101) is None
+        assert limiter.check(now=102) == 8
+        # The first request falls out of the window
+        assert limiter.check(now=110) is None
+
+
+class TestFakeTodoistServer:
+    def test_sync(self, fake_todoist, fake_api):
+        fake_api.sync()
+        assert len(fake_api.items.all()) == 2
+
+        item = fake_api.items.get_by_id(1001, only_local=True)
+        item.update(priority=1)
+        fake_api.commit()
+        assert fake_todoist.account.items[1001]['priority'] == 1
+        assert fake_todoist.stats['sync'] == 2
+
+    def test_query_and_completed(self, fake_todoist, fake_api):
+        resp = fake_api.query(['today'])
+        assert [item['id'] for item in resp[0]['data']] == [1001]
+        assert fake_api.completed.get_all(limit=10) == {'items': [], 'projects': {}}
+
+    def test_bad_token(self, fake_todoist):
+        api = todoist.api.TodoistAPI('nope', api_endpoint=fake_todoist.endpoint, cache=None)
+        resp = api.session.post(api.get_api_url() + 'sync', data={'token': 'nope'})
+        assert resp.status_code == 403
+
+    def test_rate_limit(self):
+        server = FakeTodoistServer(build_account(), rate_limit=1, rate_period=60).start()
+        try:
+            url = server.endpoint + '/sync/v8/sync'
+            assert requests.post(url, data={'token': 'token'}).status_code == 200
+            resp = requests.post(url, data={'token': 'token'})
+            assert resp.status_code == 429
+            assert int(resp.headers['Retry-After']) > 0
+            assert json.loads(resp.text)['error_code'] == 35
+            assert server.stats['throttled'] == 1
+        finally:
+            server.stop()
+
+    def test_latency(self):
+        server = FakeTodoistServer(build_account(), latency=0.2).start()
+        try:
+            resp = requests.post(server.endpoint + '/sync/v8/sync', data={'token': 'token'})
+            assert resp.elapsed.total_seconds() >= 0.2
+        finally:
+            server.stop()
+
+
+class TestCommands:
+    def test_today(self, fake_cli):
+        result = run('today')
+        assert 'tweak befunge valve' in result.output
+        assert fake_cli.stats['sync'] == 1
+
+        # The second run uses the cache and only gets the changes
+        run('today')
+        assert fake_cli.stats['sync'] == 2
+
+    def test_retries(self, fake_cli):
+        fake_cli.fail_next = 1
+        result = run('today')
+        assert 'tweak befunge valve' in result.output
+        assert fake_cli.stats['failed'] == 1
+
+    def test_add_and_modify(self, fake_cli):
+        run('add', 'proj:Work', 'pri:H', 'new item')
+        added = [
+            item for item in fake_cli.account.items.values() if item['content'] == 'new item'
+        ]
+        assert len(added) == 1
+        assert added[0]['project_id'] == 2
+        assert added[0]['priority'] == 4
+
+        run('modify', '1002', 'pri:H')
+        assert fake_cli.account.items[1002]['priority'] == 4
+
+    def test_done_and_timesheet(self, fake_cli):
+        run('done', '1001')
+        result = run('timesheet')
+        assert 'tweak befunge valve' in result.output
+
+
+class TestItemStore:
+    @pytest.fixture
+    def store_cli(self, fake_todoist, monkeypatch, tmpdir):
+        cfg = {
+            'auth_token': 'token',
+            'api_endpoint': fake_todoist.endpoint,
+            'cache_dir': str(tmpdir),
+            'item_store': 'compact',
+        }
+        monkeypatch.setattr(cmdline, 'get_config', lambda: dict(cfg))
+        return fake_todoist
+
+    def test_views(self, store_cli):
+        run('today')
+        # The second run loads the cache into the store
+        result = run('list', 'today', 'overdue')
+        assert 'tweak befunge valve' in result.output
+        assert 'file timesheet' in result.output
+
+        result = run('show', '001')
+        assert 'content:  tweak befunge valve' in result.output
+
+    def test_changes(self, store_cli):
+        run('today')
+        run('modify', '1002', 'pri:H')
+        assert store_cli.account.items[1002]['priority'] == 4
+        run('deferall')
+        assert store_cli.account.items[1001]['date_string'] == 'tomorrow'
+        run('done', '1002')
+        assert store_cli.account.items[1002]['checked'] == 1
+
+        result = run('list', 'today', 'overdue')
+        assert 'tweak befunge valve' not in result.output
+        assert 'file timesheet' not in result.output
+
+        result = run('export')
+        records = [json.loads(line) for line in result.output.splitlines() if line.startswith('{')]
+        assert [rec['content'] for rec in records if rec['type'] == 'item'] == [
+            'tweak befunge valve'
+        ]
+
+
+class TestAllProfiles:
+    @pytest.fixture
+    def accounts(self, monkeypatch, tmpdir):
+        # Each account is slow, but they sync at the same time
+        work = build_account()
+        work.token = 'work-token'
+        work.items[1001]['content'] = 'review patch'
+        servers = [
+            FakeTodoistServer(build_account(), latency=0.4).start(),
+            FakeTodoistServer(work, latency=0.4).start(),
+        ]
+        cfg = {
+            'auth_token': 'token',
+            'api_endpoint': servers[0].endpoint,
+            'cache_dir': str(tmpdir),
+            'profiles': {
+                'work': {'auth_token': 'work-token', 'api_endpoint': servers[1].endpoint},
+            },
+        }
+        monkeypatch.setattr(cmdline, 'get_config', lambda: cfg)
+        yield servers
+        for server in servers:
+            server.stop()
+
+    def test_list(self, accounts):
+        start = time.time()
+        result = run('--all-profiles', 'list', 'today')
+        elapsed = time.time() - start
+        lines = result.output.splitlines()
+        assert 'profile' in lines[2]
+        assert [line.split()[0] for line in lines[4:6]] == ['default', 'work']
+        assert 'tweak befunge valve' in result.output
+        assert 'review patch' in result.output
+        assert [server.stats['sync'] for server in accounts] == [1, 1]
+        # About as long as one account, not both
+        assert elapsed < 0.8
+
+    def test_timesheet(self, accounts):
+        accounts[1].account.sync('*', [
+            {'type': 'item_complete', 'uuid': 'u1', 'args': {'id': 1001}},
+        ])
+        result = run('--all-profiles', 'timesheet')
+        assert 'profile' in result.output
+        assert 'work' in result.output
+        assert 'review patch' in result.output
+
+    def test_use_profile(self, accounts):
+        result = run('--use-profile', 'work', 'today')
+        assert 'review patch' in result.output
+        assert 'tweak befunge valve' not in result.output
+
+        result = run('--use-profile', 'play', 'today')
+        assert 'no profile named "play"' in result.output
+        assert result.exit_code == 1
+
+    def test_only_for_views(self, accounts):
+        result = run('--all-profiles', 'add', 'new item')
+        assert 'only works with' in result.output
+        assert result.exit_code == 1
+        assert [server.stats['requests'] for server in accounts] == [0, 0]
+
+
+class Test_run_load:
+    def test_smoke(self, fake_todoist):
+        results = loadtest.run_load(fake_todoist, runs=2, names=['today', 'modify'])
+        assert [res['name'] for res in results] == ['today', 'modify']
+        for res in results:
+            assert res['runs'] == 2
+            assert res['p50'] <= res['p99'] <= res['max']
+            assert res['requests'] >= 2
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        assert loadtest.percentile(values, 50) == 3
+        assert loadtest.percentile(values, 99) == 5
+        assert loadtest.percentile([], 50) is None
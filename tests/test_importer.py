@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from francis.importer import (
+    guess_format,
+    iter_csv_records,
+    iter_json_records,
+    record_to_task,
+)
+
+
+class Test_guess_format:
+    def test_formats(self):
+        assert guess_format('tasks.CSV') == 'csv'
+        assert guess_format('tasks.json') == 'json'
+        assert guess_format('<stdin>') == 'json'
+
+
+class Test_iter_json_records:
+    def test_array(self):
+        fp = io.StringIO(u'[{"a": 1},\n{"a": "x}"}, {"a": [3]}]')
+        assert list(iter_json_records(fp, read_size=4)) == [
+            {'a': 1}, {'a': 'x}'}, {'a': [3]}
+        ]
+
+    def test_lines(self):
+        fp = io.StringIO(u'{"a": 1}\n\n{"a": 2}\n')
+        assert list(iter_json_records(fp, read_size=3)) == [{'a': 1}, {'a': 2}]
+
+    def test_empty(self):
+        assert list(iter_json_records(io.StringIO(u''))) == []
+        assert list(iter_json_records(io.StringIO(u'[]'))) == []
+
+    def test_truncated(self):
+        records = iter_json_records(io.StringIO(u'{"a": 1}\n{"a": '))
+        assert next(records) == {'a': 1}
+        with pytest.raises(ValueError):
+            next(records)
+
+    def test_not_objects(self):
+        with pytest.raises(ValueError):
+            list(iter_json_records(io.StringIO(u'[1, 2]')))
+
+
+class Test_iter_csv_records:
+    def test_header(self):
+        fp = io.StringIO(u'Content,Project\nbuy milk,Work\n,\n"a, b",\n')
+        assert list(iter_csv_records(fp)) == [
+            {'content': 'buy milk', 'project': 'Work'},
+            {'content': 'a, b', 'project': ''},
+        ]
+
+
+class Test_record_to_task:
+    def test_taskwarrior(self):
+        task = record_to_task({
+            'description': ' buy milk ', 'project': 'Home', 'priority': 'M',
+            'status': 'pending',
+        })
+        assert task == {'content': 'buy milk', 'project': 'Home', 'priority': None, 'due': None}
+
+    def test_done(self):
+        assert record_to_task({'description': 'x', 'status': 'completed'}) is None
+        assert record_to_task({'description': 'x', 'status': 'deleted'}) is None
+
+    def test_date_string(self):
+        task = record_to_task({'content': 'x', 'due': 'every monday'})
+        assert task['due'] == 'every monday'
+
+    def test_francis_export(self):
+        task = record_to_task({
+            'type': 'item', 'id': 1001, 'content': 'tweak befunge valve', 'project': 'Work',
+            'priority': 4, 'due_date': '2016-07-22T21:59:59Z', 'date_string': 'today',
+            'completed_date': None,
+        })
+        assert task == {'content': 'tweak befunge valve', 'project': 'Work', 'priority': '4',
+                        'due': 'today'}
+        assert record_to_task({'type': 'completed', 'content': 'x'}) is None
+
+    def test_numbers(self):
+        task = record_to_task({'content': 1234, 'project': 2016, 'priority': 1})
+        assert task['content'] == '1234'
+        assert task['project'] == '2016'
+        assert task['priority'] == '1'
+
+    def test_no_content(self):
+        with pytest.raises(ValueError):
+            record_to_task({'project': 'Home'})
@@ -0,0 +1,116 @@
+import pytest
+import todoist
+
+from francis.index import (
+    ContentIndex,
+    DoesNotExist,
+    IdSuffixIndex,
+    ProjectIndex,
+    TooMany,
+    get_item_index,
+    get_project_index,
+)
+
+
+def build_api(items=(), projects=()):
+    api = todoist.api.TodoistAPI('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'items': list(items),
+        'projects': list(projects),
+    })
+    return api
+
+
+PROJECTS = [
+    {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+    {'id': 2, 'name': 'Work'},
+    {'id': 3, 'name': 'work'},
+]
+
+
+class TestIdSuffixIndex:
+    def test_unique(self):
+        api = build_api([{'id': 1234567}, {'id': 1234999}])
+        index = IdSuffixIndex(api.items.all())
+        assert index.get('567')['id'] == 1234567
+        assert index.get('1234999')['id'] == 1234999
+
+    def test_missing(self):
+        api = build_api([{'id': 1234567}])
+        index = IdSuffixIndex(api.items.all())
+        with pytest.raises(DoesNotExist):
+            index.get('568')
+        with pytest.raises(DoesNotExist):
+            index.get('01234567')
+
+    def test_ambiguous(self):
+        api = build_api([{'id': 1234567}, {'id': 7654567}])
+        index = IdSuffixIndex(api.items.all())
+        with pytest.raises(TooMany):
+            index.get('567')
+        assert index.get('34567')['id'] == 1234567
+
+    def test_temp_id(self):
+        api = build_api([{'id': 1234567}])
+        item = api.items.add('new item', project_id=1)
+        index = IdSuffixIndex(api.items.all())
+        assert index.get(item.temp_id[-8:]) is item
+
+    def test_get_many(self):
+        api = build_api([{'id': 1234567}, {'id': 7654567}, {'id': 1111}])
+        index = IdSuffixIndex(api.items.all())
+        results = index.get_many(['111', '567', '999'])
+        assert results[0]['id'] == 1111
+        assert isinstance(results[1], TooMany)
+        assert isinstance(results[2], DoesNotExist)
+
+
+class Test_get_item_index:
+    def test_cached_per_sync(self):
+        api = build_api([{'id': 1234567}])
+        index = get_item_index(api)
+        assert get_item_index(api) is index
+
+        api._update_state({'sync_token': 'def', 'items': [{'id': 2222}]})
+        new_index = get_item_index(api)
+        assert new_index is not index
+        assert new_index.get('222')['id'] == 2222
+
+
+class TestProjectIndex:
+    def test_get_by_name(self):
+        index = ProjectIndex(build_api(projects=PROJECTS).projects.all())
+        assert index.get_by_name('inbox')['id'] == 1
+        # First project with a name wins
+        assert index.get_by_name('WORK')['id'] == 2
+        with pytest.raises(DoesNotExist):
+            index.get_by_name('Home')
+
+    def test_display_name(self):
+        index = ProjectIndex(build_api(projects=PROJECTS).projects.all())
+        assert index.display_name(1) == ''
+        assert index.display_name(2) == 'Work'
+        assert index.display_name(99) == ''
+
+    def test_temp_id(self):
+        api = build_api(projects=PROJECTS)
+        proj = api.projects.add('Home')
+        index = get_project_index(api)
+        assert index.get_by_id(proj.temp_id) is proj
+        assert index.display_name(proj.temp_id) == 'Home'
+
+
+class TestContentIndex:
+    def test_contains(self):
+        api = build_api([
+            {'id': 1, 'content': 'Buy  milk', 'project_id': 2},
+            {'id': 2, 'content': 'gone', 'project_id': 2, 'is_deleted': 1},
+        ])
+        index = ContentIndex(api.items.all())
+        assert index.contains('buy milk', 2)
+        assert not index.contains('buy milk', 1)
+        assert not index.contains('gone', 2)
+
+        index.add('gone', 2)
+        assert index.contains('Gone ', 2)
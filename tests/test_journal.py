@@ -0,0 +1,36 @@
+from francis.journal import Journal
+
+
+class TestJournal:
+    def test_empty(self, tmpdir):
+        journal = Journal(str(tmpdir), 'token')
+        assert len(journal) == 0
+        assert journal.last(3) == []
+        journal.pop(3)
+
+    def test_last_and_pop(self, tmpdir):
+        journal = Journal(str(tmpdir), 'token')
+        for i in range(5):
+            journal.append('modify', [{'item_id': i, 'field': 'priority'}])
+        assert len(journal) == 5
+
+        entries = journal.last(2)
+        assert [entry['actions'][0]['item_id'] for entry in entries] == [4, 3]
+        assert entries[0]['command'] == 'modify'
+
+        journal.pop(2)
+        assert len(journal) == 3
+        assert journal.last(1)[0]['actions'][0]['item_id'] == 2
+
+        # Appending after a pop picks up where the journal left off
+        journal.append('done', [{'item_id': 9, 'field': 'completed'}])
+        assert [entry['command'] for entry in journal.last(10)] == [
+            'done', 'modify', 'modify', 'modify'
+        ]
+
+    def test_pop_everything(self, tmpdir):
+        journal = Journal(str(tmpdir), 'token')
+        journal.append('done', [])
+        journal.pop(5)
+        assert len(journal) == 0
+        assert tmpdir.listdir() == []
@@ -0,0 +1,32 @@
+import click
+
+from francis import output
+
+
+class Test_write_lines:
+    def test_chunks(self, monkeypatch):
+        writes = []
+        monkeypatch.setattr(click, 'echo', lambda message: writes.append(message))
+
+        output.write_lines(('line %d' % i for i in range(11)), chunk_size=5)
+        # The first line goes out right away and then everything else in
+        # chunks
+        assert writes == [
+            'line 0',
+            'line 1\nline 2\nline 3\nline 4\nline 5',
+            'line 6\nline 7\nline 8\nline 9\nline 10',
+        ]
+
+    def test_empty(self, monkeypatch):
+        writes = []
+        monkeypatch.setattr(click, 'echo', lambda message: writes.append(message))
+
+        output.write_lines(iter([]))
+        assert writes == []
+
+    def test_pager(self, monkeypatch):
+        paged = []
+        monkeypatch.setattr(click, 'echo_via_pager', lambda lines: paged.extend(lines))
+
+        output.write_lines(iter(['a', 'b']), pager=True)
+        assert paged == ['a\n', 'b\n']
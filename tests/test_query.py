@@ -0,0 +1,123 @@
+import datetime
+
+import pytest
+import todoist
+
+from francis.index import sync
+from francis.query import (
+    DueDateIndex,
+    get_due_index,
+    is_recurring,
+    run_query,
+)
+from francis.util import local_to_utc
+
+
+def due_on(year, month, day):
+    when = datetime.datetime(year, month, day, 23, 59, 59)
+    return local_to_utc(when).strftime('%a %d %b %Y %H:%M:%S +0000')
+
+
+def build_api():
+    api = todoist.api.TodoistAPI('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'items': [
+            {'id': 1, 'content': 'old', 'due_date': due_on(2015, 12, 30)},
+            {'id': 2, 'content': 'friday', 'due_date': due_on(2016, 1, 1)},
+            {'id': 3, 'content': 'monday', 'due_date': due_on(2016, 1, 4)},
+            {'id': 4, 'content': 'july', 'due_date': due_on(2016, 7, 22)},
+            {'id': 5, 'content': 'no date', 'due_date': None},
+            {'id': 6, 'content': 'done', 'due_date': due_on(2016, 1, 1), 'checked': 1},
+        ],
+    })
+    return api
+
+
+# January 1st, 2016 was a Friday
+FRIDAY = datetime.datetime(2016, 1, 1)
+
+
+def contents(section):
+    return sorted(item['content'] for item in section['data'])
+
+
+class Test_run_query:
+    def test_dates(self):
+        resp = run_query(build_api(), ['today', 'monday', 'july 22'], relative_to=FRIDAY)
+        assert [section['query'] for section in resp] == ['today', 'monday', 'july 22']
+        assert [section['type'] for section in resp] == ['date', 'date', 'date']
+        assert contents(resp[0]) == ['friday']
+        assert contents(resp[1]) == ['monday']
+        assert contents(resp[2]) == ['july']
+
+    @pytest.mark.parametrize('query', ['over due', 'overdue'])
+    def test_overdue(self, query):
+        resp = run_query(build_api(), [query], relative_to=FRIDAY)
+        assert resp[0]['type'] == 'overdue'
+        assert contents(resp[0]) == ['old']
+
+    @pytest.mark.parametrize('query', [
+        'p1', 'today | overdue', 'tod & p1', 'tomorrow 5pm', '7 days', 'next week',
+    ])
+    def test_value_error(self, query):
+        # Todoist filters that start like dates go to Todoist
+        with pytest.raises(ValueError):
+            run_query(build_api(), [query], relative_to=FRIDAY)
+
+
+class TestDueDateIndex:
+    def test_buckets(self):
+        api = build_api()
+        index = DueDateIndex(api.items.all())
+        assert [item['id'] for item in index.get(datetime.date(2016, 1, 1))] == [2]
+        assert index.get(datetime.date(2016, 1, 2)) == []
+        assert [item['id'] for item in index.before(datetime.date(2016, 1, 4))] == [1, 2]
+
+    def test_sync_updates_buckets(self, monkeypatch):
+        api = build_api()
+        index = get_due_index(api)
+
+        changes = {
+            'sync_token': 'def',
+            'items': [
+                {'id': 2, 'content': 'friday', 'due_date': due_on(2016, 1, 4)},
+                {'id': 7, 'content': 'new', 'due_date': due_on(2016, 1, 4)},
+            ],
+        }
+
+        def fake_sync(api, commands=None):
+            api._update_state(changes)
+            return changes
+        monkeypatch.setattr(todoist.api.TodoistAPI, 'sync', fake_sync)
+
+        sync(api)
+        # The same index, updated in place
+        assert get_due_index(api) is index
+        assert index.get(datetime.date(2016, 1, 1)) == []
+        assert sorted(item['id'] for item in index.get(datetime.date(2016, 1, 4))) == [2, 3, 7]
+
+    def test_full_sync_rebuilds(self, monkeypatch):
+        api = build_api()
+        index = get_due_index(api)
+        monkeypatch.setattr(
+            todoist.api.TodoistAPI, 'sync', lambda api, commands=None: {'full_sync': True}
+        )
+        sync(api)
+        assert get_due_index(api) is not index
+
+
+class Test_is_recurring:
+    @pytest.mark.parametrize('date_string, expected', [
+        ('every day', True),
+        ('ev monday', True),
+        ('Every 2 weeks', True),
+        ('tomorrow', False),
+        ('Jul 22', False),
+        (None, False),
+    ])
+    def test_is_recurring(self, date_string, expected):
+        api = build_api()
+        item = api.items.get_by_id(1, only_local=True)
+        item.data['date_string'] = date_string
+        assert is_recurring(item) is expected
@@ -0,0 +1,315 @@
+import datetime
+import json
+
+import pytest
+import todoist
+from click.testing import CliRunner
+
+from benchmarks.fakeserver import Account, FakeTodoistServer
+from benchmarks.fixtures import due_on
+from francis import cmdline
+from francis.index import sync
+from francis.search import SearchCache, SearchIndex, get_search_index, tokenize
+from francis.storeapi import StoreAPI
+
+
+ITEMS = [
+    {'id': 1001, 'content': 'Renew passport', 'project_id': 1},
+    {'id': 1002, 'content': 'Pass the parcel', 'project_id': 1},
+    {'id': 1003, 'content': 'renew domain and passport photos', 'project_id': 2},
+    {'id': 1004, 'content': 'review patch', 'project_id': 2},
+    {'id': 1005, 'content': 'renew library books', 'project_id': 1, 'checked': 1},
+]
+
+PROJECTS = [
+    {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+    {'id': 2, 'name': 'Home Office'},
+]
+
+
+def build_api(api_class=todoist.api.TodoistAPI):
+    api = api_class('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'items': [dict(data) for data in ITEMS],
+        'projects': [dict(data) for data in PROJECTS],
+    })
+    return api
+
+
+class Test_tokenize:
+    def test_words(self):
+        assert tokenize('Renew the passport, renew!') == ['renew', 'the', 'passport']
+
+    def test_empty(self):
+        assert tokenize(None) == []
+        assert tokenize('--') == []
+
+
+class TestSearchIndex:
+    def test_exact(self):
+        index = SearchIndex.from_api(build_api())
+        assert sorted(index.search('passport')) == [1001, 1003]
+
+    def test_skips_completed(self):
+        index = SearchIndex.from_api(build_api())
+        assert index.num_items == 4
+        assert index.search('library') == []
+
+    def test_prefix(self):
+        index = SearchIndex.from_api(build_api())
+        assert sorted(index.search('pass')) == [1001, 1002, 1003]
+        assert sorted(index.search('re')) == [1001, 1003, 1004]
+
+    def test_every_term_matches(self):
+        index = SearchIndex.from_api(build_api())
+        assert index.search('renew photo') == [1003]
+        assert index.search('renew parcel') == []
+        assert index.search('') == []
+
+    def test_ranking(self):
+        index = SearchIndex.from_api(build_api())
+        # Exact matches beat prefix matches
+        assert index.search('pass')[0] == 1002
+        assert index.search('pass', limit=1) == [1002]
+
+    def test_project_name(self):
+        index = SearchIndex.from_api(build_api())
+        assert index.search('office') == [1003, 1004]
+        assert index.search('home patch') == [1004]
+
+    def test_update(self):
+        api = build_api()
+        index = SearchIndex.from_api(api)
+        api.projects.get_by_id(2).data['name'] = 'Garage'
+        index.update(api, [
+            {'id': 1001, 'content': 'renew visa', 'project_id': 1},
+            {'id': 1002, 'content': 'Pass the parcel', 'project_id': 1, 'checked': 1},
+            {'id': 1004, 'is_deleted': 1},
+            {'id': 1006, 'content': 'passport photos', 'project_id': 2},
+        ])
+        assert sorted(index.search('passport')) == [1003, 1006]
+        assert index.search('visa') == [1001]
+        assert index.search('parcel') == []
+        assert index.search('patch') == []
+        assert sorted(index.search('garage')) == [1003, 1006]
+        assert 'parcel' not in index.words
+        assert index.num_items == 3
+
+    @pytest.mark.parametrize('inverted', [True, False])
+    def test_round_trip(self, inverted):
+        api = build_api()
+        index = SearchIndex.from_json(
+            json.loads(json.dumps(SearchIndex.from_api(api).to_json())), api.state['projects']
+        )
+        assert not index.dirty
+        assert sorted(index.search('pass')) == [1001, 1002, 1003]
+        assert index.search('office') == [1003, 1004]
+
+        if inverted:
+            index._invert()
+        index.update(api, [
+            {'id': 1001, 'content': 'renew visa', 'project_id': 2},
+            {'id': 1002, 'is_deleted': 1},
+        ])
+        assert index.dirty
+        assert index.search('pass') == [1003]
+        assert sorted(index.search('office')) == [1001, 1003, 1004]
+        assert 'parcel' not in index.postings
+        assert index.num_items == 3
+
+    def test_sync_updates(self, monkeypatch):
+        api = build_api()
+        index = get_search_index(api)
+        changes = {
+            'sync_token': 'def',
+            'items': [{'id': 1007, 'content': 'renew lease', 'project_id': 1}],
+        }
+
+        def fake_sync(api, commands=None):
+            api._update_state(changes)
+            return changes
+        monkeypatch.setattr(todoist.api.TodoistAPI, 'sync', fake_sync)
+
+        sync(api)
+        # The same index, updated in place
+        assert get_search_index(api) is index
+        assert index.search('lease') == [1007]
+
+    def test_item_store(self):
+        api = build_api(StoreAPI)
+        api.items.get_by_id(1003, only_local=True)
+        index = SearchIndex.from_api(api)
+        assert sorted(index.search('passport')) == [1001, 1003]
+        # Searching doesn't take items out of the store
+        assert [item['id'] for item in api.state['items']] == [1003]
+
+
+class TestSearchCache:
+    def test_round_trip(self, tmpdir):
+        api = build_api()
+        cache = SearchCache(str(tmpdir), 'token')
+        assert cache.load(api) is None
+
+        index = SearchIndex.from_api(api)
+        cache.save(index, 'abc')
+        assert not index.dirty
+
+        loaded = cache.load(api)
+        assert loaded.sync_token == 'abc'
+        assert sorted(loaded.search('passport')) == [1001, 1003]
+
+    def test_corrupt(self, tmpdir):
+        cache = SearchCache(str(tmpdir), 'token')
+        with open(cache.path, 'w') as fp:
+            fp.write('{"version": 1')
+        assert cache.load(build_api()) is None
+
+    def test_too_old(self, tmpdir):
+        api = build_api()
+        cache = SearchCache(str(tmpdir), 'token', max_age=60)
+        cache.save(SearchIndex.from_api(api), 'abc')
+        with open(cache.path) as fp:
+            data = json.load(fp)
+        data['saved_at'] -= 120
+        with open(cache.path, 'w') as fp:
+            json.dump(data, fp)
+        assert cache.load(api) is None
+
+    def test_before_sync(self, tmpdir):
+        api = build_api()
+        cache = SearchCache(str(tmpdir), 'token')
+        cache.save(SearchIndex.from_api(api), 'older')
+        assert cache.before_sync(api) is True
+        # The sync starts from the index's token and the index is current
+        assert api.sync_token == 'older'
+        assert get_search_index(api).sync_token == 'older'
+
+    def test_before_sync_current(self, tmpdir):
+        api = build_api()
+        cache = SearchCache(str(tmpdir), 'token')
+        assert cache.before_sync(api) is False
+        cache.save(SearchIndex.from_api(api), 'abc')
+        assert cache.before_sync(api) is False
+        assert api.sync_token == 'abc'
+
+    def test_get_search_index(self, tmpdir):
+        api = build_api()
+        cache = SearchCache(str(tmpdir), 'token')
+        saved = SearchIndex.from_api(api)
+        saved.postings['saved'] = set([1001])
+        saved.words.append('saved')
+        cache.save(saved, 'abc')
+        assert get_search_index(api, cache).search('saved') == [1001]
+
+        # An index for some other state gets rebuilt
+        other = build_api()
+        other.sync_token = 'def'
+        assert get_search_index(other, cache).search('saved') == []
+
+
+@pytest.fixture
+def fake_cli(monkeypatch, tmpdir):
+    today = datetime.date.today()
+    server = FakeTodoistServer(Account(
+        projects=[
+            {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+            {'id': 2, 'name': 'Work'},
+        ],
+        items=[
+            {'id': 1001, 'content': 'tweak befunge valve', 'project_id': 2, 'priority': 4,
+             'due_date': due_on(today), 'date_string': 'today', 'checked': 0},
+            {'id': 1002, 'content': 'file timesheet', 'project_id': 1, 'priority': 1,
+             'due_date': None, 'date_string': None, 'checked': 0},
+        ],
+    )).start()
+    cfg = {
+        'auth_token': 'token',
+        'api_endpoint': server.endpoint,
+        'cache_dir': str(tmpdir),
+        'http_backoff': '0',
+    }
+    monkeypatch.setattr(cmdline, 'get_config', lambda: dict(cfg))
+    yield server
+    server.stop()
+
+
+def run(*args):
+    result = CliRunner().invoke(cmdline.cli, list(args), obj={})
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    return result
+
+
+class Test_search_cmd:
+    def test_search(self, fake_cli):
+        result = run('search', 'BEF')
+        assert 'tweak befunge valve' in result.output
+        assert 'file timesheet' not in result.output
+
+        result = run('search', 'work')
+        assert 'tweak befunge valve' in result.output
+
+        result = run('search', 'nothing')
+        assert result.output == 'No items match.\n'
+
+    def test_updates_from_sync(self, fake_cli, monkeypatch):
+        run('search', 'befunge')
+        # These move the sync cache past the saved index
+        run('add', 'call', 'the', 'plumber')
+        run('done', '1001')
+
+        def rebuild(api):
+            raise AssertionError('index was rebuilt')
+        monkeypatch.setattr(SearchIndex, 'from_api', rebuild)
+
+        result = run('search', 'plumb')
+        assert 'call the plumber' in result.output
+        result = run('search', 'befunge')
+        assert result.output == 'No items match.\n'
+
+    def test_fresh_cache_ahead_of_index(self, fake_cli, monkeypatch):
+        run('search', 'befunge')
+        run('add', 'call', 'the', 'plumber')
+        run('today')
+
+        # The sync cache is new enough to use without syncing, but the saved
+        # index is behind it, so search syncs from the index's token
+        cfg = dict(cmdline.get_config(), max_staleness='300')
+        monkeypatch.setattr(cmdline, 'get_config', lambda: dict(cfg))
+
+        def rebuild(api):
+            raise AssertionError('index was rebuilt')
+        monkeypatch.setattr(SearchIndex, 'from_api', rebuild)
+
+        result = run('search', 'plumb')
+        assert 'call the plumber' in result.output
+        assert '[Offline' not in result.output
+
+        # Now the index is current, so search works from the cache
+        result = run('search', 'plumb')
+        assert 'call the plumber' in result.output
+        assert '[Offline' in result.output
+
+    def test_unreachable(self, fake_cli):
+        run('search', 'befunge')
+        run('add', 'call', 'the', 'plumber')
+        run('today')
+
+        # The saved index is behind the sync cache and the sync fails, so
+        # search uses the sync cache's items
+        fake_cli.error_rate = 1.0
+        result = run('search', 'plumb')
+        assert '[Offline: data synced' in result.output
+        assert 'call the plumber' in result.output
+
+    def test_ids_that_dont_resolve(self, fake_cli, monkeypatch):
+        # The index has an item the api doesn't
+        monkeypatch.setattr(SearchIndex, 'search', lambda self, query, limit=None: [9999])
+        result = run('search', 'befunge')
+        assert result.output == 'No items match.\n'
+
+    def test_offline(self, fake_cli):
+        run('today')
+        result = run('--offline', 'search', 'timesheet')
+        assert 'file timesheet' in result.output
@@ -0,0 +1,161 @@
+import datetime
+
+import pytest
+import requests
+from click.testing import CliRunner
+
+from benchmarks.fakeserver import Account, FakeTodoistServer
+from benchmarks.fixtures import due_on
+from francis import cmdline, index, session
+
+
+def build_account():
+    items = [
+        {'id': 1000 + i, 'content': 'task number %d' % i, 'project_id': 1, 'priority': 1,
+         'due_date': due_on(datetime.date.today()), 'date_string': 'today'}
+        for i in range(50)
+    ]
+    return Account(projects=[{'id': 1, 'name': 'Inbox'}], items=items)
+
+
+@pytest.fixture
+def fake_todoist():
+    server = FakeTodoistServer(build_account()).start()
+    yield server
+    server.stop()
+
+
+def run(*args):
+    result = CliRunner().invoke(cmdline.cli, list(args), obj={})
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    return result
+
+
+def sync_url(server):
+    return server.endpoint + '/sync/v8/sync'
+
+
+class Test_get_session:
+    def test_shared(self):
+        cfg = {'auth_token': 'token'}
+        assert session.get_session(cfg) is session.get_session(dict(cfg))
+
+    def test_settings_change(self):
+        first = session.get_session({'read_timeout': '10'})
+        second = session.get_session({'read_timeout': '20'})
+        assert first is not second
+        assert second.timeout == (session.DEFAULT_CONNECT_TIMEOUT, 20.0)
+        # Profiles with different settings don't take each other's session
+        # away
+        assert session.get_session({'read_timeout': '10'}) is first
+
+    def test_threads(self):
+        cfgs = [{'read_timeout': str(10 + i % 3)} for i in range(30)]
+        sessions = cmdline.run_concurrently(
+            [lambda cfg=cfg: session.get_session(cfg) for cfg in cfgs], max_workers=10
+        )
+        assert len(set(id(sess) for sess in sessions)) == 3
+        for cfg, sess in zip(cfgs, sessions):
+            assert sess is session.get_session(cfg)
+
+    def test_bad_settings(self):
+        assert session.get_session_settings({'http_retries': 'lots'}) == (
+            session.DEFAULT_CONNECT_TIMEOUT, session.DEFAULT_READ_TIMEOUT,
+            session.DEFAULT_RETRIES, session.DEFAULT_BACKOFF,
+        )
+
+
+class TestJitteredRetry:
+    def test_backoff_is_jittered(self):
+        retry = session.build_retry(5, backoff=1)
+        for i in range(4):
+            retry = retry.increment(method='GET', url='/')
+        base = session.Retry.get_backoff_time(retry)
+        assert base > 0
+        times = [retry.get_backoff_time() for i in range(20)]
+        assert all(0 <= value <= base for value in times)
+        assert len(set(times)) > 1
+
+
+class TestFrancisSession:
+    def test_retries_server_errors(self, fake_todoist):
+        fake_todoist.fail_next = 2
+        sess = session.FrancisSession(retries=3, backoff=0)
+        resp = sess.post(sync_url(fake_todoist), data={'token': 'token'})
+        assert resp.status_code == 200
+        assert fake_todoist.stats['failed'] == 2
+
+    def test_retries_are_bounded(self, fake_todoist):
+        fake_todoist.fail_next = 5
+        sess = session.FrancisSession(retries=1, backoff=0)
+        with pytest.raises(requests.exceptions.RetryError):
+            sess.post(sync_url(fake_todoist), data={'token': 'token'})
+        assert fake_todoist.stats['failed'] == 2
+
+    def test_read_timeout(self):
+        server = FakeTodoistServer(build_account(), latency=0.5).start()
+        try:
+            sess = session.FrancisSession(read_timeout=0.1, retries=0)
+            with pytest.raises(requests.exceptions.ConnectionError):
+                sess.post(sync_url(server), data={'token': 'token'})
+        finally:
+            server.stop()
+
+    def test_compressed(self, fake_todoist):
+        sess = session.FrancisSession()
+        resp = sess.post(sync_url(fake_todoist), data={'token': 'token'})
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert len(resp.json()['items']) == 50
+
+    def test_keep_alive(self, fake_todoist):
+        sess = session.FrancisSession()
+        for i in range(3):
+            sess.post(sync_url(fake_todoist), data={'token': 'token'})
+        # All three requests went over one pooled connection
+        assert fake_todoist.stats['sync'] == 3
+        assert fake_todoist.stats['connections'] == 1
+
+
+class TestServerDown:
+    """Todoist answering every request with a 503"""
+    @pytest.fixture
+    def down_todoist(self):
+        server = FakeTodoistServer(build_account(), error_rate=1.0).start()
+        yield server
+        server.stop()
+
+    def build_api(self, server):
+        cfg = {'auth_token': 'token', 'api_endpoint': server.endpoint, 'http_backoff': '0'}
+        return cmdline.build_api(cfg)
+
+    def test_sync_raises(self, down_todoist):
+        api = self.build_api(down_todoist)
+        with pytest.raises(requests.exceptions.RequestException):
+            index.sync(api)
+        assert api.sync_token == '*'
+
+    def test_commit_raises(self, down_todoist):
+        api = self.build_api(down_todoist)
+        api.items.add('new item', project_id=1)
+        with pytest.raises(requests.exceptions.RequestException):
+            api.commit()
+        # The command is still there to be queued
+        assert len(api.queue) == 1
+
+    def test_write_is_queued(self, fake_todoist, monkeypatch, tmpdir):
+        cfg = {
+            'auth_token': 'token',
+            'api_endpoint': fake_todoist.endpoint,
+            'cache_dir': str(tmpdir),
+            'http_backoff': '0',
+        }
+        monkeypatch.setattr(cmdline, 'get_config', lambda: dict(cfg))
+        run('today')
+
+        fake_todoist.error_rate = 1.0
+        result = run('add', 'new', 'item')
+        assert 'Changes queued' in result.output
+        queued = cmdline.get_write_queue(cfg).read()
+        assert [entry['commands'][0]['args']['content'] for entry in queued] == ['new item']
+        assert len(cmdline.get_journal(cfg)) == 0
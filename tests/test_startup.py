@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+
+# Modules that are slow to import and that francis should only import in the
+# commands that need them.
+HEAVY_MODULES = ['pendulum', 'requests', 'todoist']
+
+# Import budget for the click_run entry point in seconds. This is generous so
+# it doesn't flap on slow machines; set FRANCIS_STARTUP_BUDGET to tighten it.
+STARTUP_BUDGET = float(os.environ.get('FRANCIS_STARTUP_BUDGET', '0.25'))
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, *args):
+    return subprocess.check_output(
+        [sys.executable, '-c', code] + list(args),
+        stderr=subprocess.STDOUT,
+        cwd=REPO_ROOT,
+    ).decode('utf-8')
+
+
+def get_loaded_heavy_modules(output):
+    loaded = output.strip().splitlines()[-1].split(',')
+    return sorted(mod for mod in HEAVY_MODULES if mod in loaded)
+
+
+def test_import_skips_heavy_modules():
+    output = run_python(
+        'import sys\n'
+        'from francis.cmdline import click_run\n'
+        'print(",".join(sys.modules))\n'
+    )
+    assert get_loaded_heavy_modules(output) == []
+
+
+def test_help_skips_heavy_modules():
+    output = run_python(
+        'import sys\n'
+        'from francis.cmdline import click_run\n'
+        'try:\n'
+        '    click_run()\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        'print(",".join(sys.modules))\n',
+        '--help'
+    )
+    assert 'Usage:' in output
+    assert get_loaded_heavy_modules(output) == []
+
+
+def test_import_budget():
+    # Take the best of a few runs to smooth out noise
+    timings = []
+    for i in range(3):
+        output = run_python(
+            'import time\n'
+            'start = time.time()\n'
+            'from francis.cmdline import click_run\n'
+            'print(time.time() - start)\n'
+        )
+        timings.append(float(output.strip().splitlines()[-1]))
+
+    assert min(timings) < STARTUP_BUDGET
@@ -0,0 +1,229 @@
+import datetime
+import json
+
+import pytest
+
+from francis.cache import SyncCache
+from francis.query import get_due_index, run_query
+from francis.store import ItemStore, get_item_store, iter_item_data, use_item_store
+from francis.storeapi import StoreAPI
+from francis.util import local_to_utc
+
+
+def due_on(year, month, day):
+    when = datetime.datetime(year, month, day, 23, 59, 59)
+    return local_to_utc(when).strftime('%a %d %b %Y %H:%M:%S +0000')
+
+
+ITEMS = [
+    {'id': 1001, 'content': 'old', 'project_id': 1, 'priority': 1,
+     'due_date': due_on(2015, 12, 30), 'date_string': 'dec 30', 'seq_no': 5},
+    {'id': 1002, 'content': 'friday', 'project_id': 2, 'priority': 4,
+     'due_date': due_on(2016, 1, 1), 'date_string': 'friday', 'labels': [1, 2]},
+    {'id': 2002, 'content': 'also friday', 'project_id': 2, 'priority': 1,
+     'due_date': due_on(2016, 1, 1), 'date_string': 'every day'},
+    {'id': 1003, 'content': 'no date', 'project_id': 1, 'priority': 1,
+     'due_date': None, 'date_string': None},
+    {'id': 1004, 'content': 'done', 'project_id': 1, 'priority': 1,
+     'due_date': due_on(2016, 1, 1), 'date_string': 'friday', 'checked': 1},
+]
+
+FRIDAY = datetime.date(2016, 1, 1)
+
+
+def build_store():
+    return ItemStore([dict(data) for data in ITEMS])
+
+
+def build_api():
+    api = StoreAPI('token', cache=None)
+    api._update_state({
+        'sync_token': 'abc',
+        'items': [dict(data) for data in ITEMS],
+        'projects': [
+            {'id': 1, 'name': 'Inbox', 'inbox_project': True},
+            {'id': 2, 'name': 'Work'},
+        ],
+    })
+    return api
+
+
+class Test_use_item_store:
+    def test_setting(self):
+        assert use_item_store({'item_store': 'Compact'})
+        assert not use_item_store({'item_store': 'models'})
+        assert not use_item_store({})
+
+
+class TestItemStore:
+    def test_round_trip(self):
+        store = build_store()
+        assert len(store) == 5
+        data = store.get(1002)
+        assert data['content'] == 'friday'
+        assert data['project_id'] == 2
+        assert data['priority'] == 4
+        assert data['labels'] == [1, 2]
+        assert data['checked'] == 0
+        assert store.get(1001)['seq_no'] == 5
+        assert 'seq_no' not in store.get(1003)
+        assert store.get(5) is None
+
+    def test_rows_leave_out_defaults(self):
+        store = build_store()
+        # The first item's fields are the defaults
+        assert store.rows[store.position(1001)] == '{}'
+        assert json.loads(store.rows[store.position(1002)]) == {
+            'labels': [1, 2], '\0missing': ['seq_no'],
+        }
+        # Rows that are the same share a string
+        assert store.rows[store.position(2002)] is store.rows[store.position(1003)]
+
+    def test_position(self):
+        store = build_store()
+        for item_id in [1001, 1002, 2002, 1003, 1004] * 4:
+            assert store.ids[store.position(item_id)] == item_id
+        # Enough lookups to build the dict
+        assert store.positions is not None
+        assert store.position(5) is None
+        store.remove(1002)
+        assert store.position(1002) is None
+
+    def test_interned(self):
+        store = build_store()
+        pos = [store.position(1002), store.position(2002)]
+        assert store.due_dates[pos[0]] is store.due_dates[pos[1]]
+
+    def test_put_replaces(self):
+        store = build_store()
+        store.put({'id': 1002, 'content': 'moved', 'project_id': 1, 'priority': 1,
+                   'due_date': due_on(2016, 1, 4), 'date_string': 'monday'})
+        assert len(store) == 5
+        assert store.get(1002)['content'] == 'moved'
+        assert store.due_on(FRIDAY) == [store.position(2002)]
+
+    def test_remove_and_pop(self):
+        store = build_store()
+        store.remove(1001)
+        assert 1001 not in store
+        assert store.get(1001) is None
+        assert store.pop(1002)['content'] == 'friday'
+        assert len(store) == 3
+        assert store.find_id_suffix('1') == []
+
+    def test_compact(self):
+        store = build_store()
+        store.remove(1001)
+        store.remove(1003)
+        store.compact()
+        assert len(store.rows) == 3
+        assert [data['id'] for data in store.iter_data()] == [1002, 2002, 1004]
+        assert store.get(2002)['content'] == 'also friday'
+
+    @pytest.mark.parametrize('suffix, expected', [
+        ('002', [1002, 2002]),
+        ('2002', [2002]),
+        ('1', [1001]),
+        ('02002', []),
+        ('abc', []),
+    ])
+    def test_find_id_suffix(self, suffix, expected):
+        store = build_store()
+        assert [store.ids[pos] for pos in store.find_id_suffix(suffix)] == expected
+
+    def test_due(self):
+        store = build_store()
+        # Completed items aren't due
+        assert [store.ids[pos] for pos in store.due_on(FRIDAY)] == [1002, 2002]
+        assert [store.ids[pos] for pos in store.due_before(FRIDAY)] == [1001]
+        positions = store.due_before(datetime.date(2016, 1, 2))
+        assert [store.ids[pos] for pos in positions] == [1001, 1002, 2002]
+
+
+class TestStoreAPI:
+    def test_load(self):
+        api = build_api()
+        assert api.state['items'] == []
+        assert len(get_item_store(api)) == 5
+
+    def test_get_by_id(self):
+        api = build_api()
+        item = api.items.get_by_id(1002, only_local=True)
+        assert item['content'] == 'friday'
+        assert api.state['items'] == [item]
+        assert 1002 not in api.item_store
+        # It's the same object the second time
+        assert api.items.get_by_id(1002, only_local=True) is item
+        assert api.items.get_by_id(5, only_local=True) is None
+
+    def test_sync_updates(self):
+        api = build_api()
+        item = api.items.get_by_id(1002, only_local=True)
+        api._update_state({'items': [
+            {'id': 1002, 'content': 'changed'},
+            {'id': 1001, 'content': 'stored change', 'project_id': 1},
+            {'id': 1003, 'is_deleted': 1},
+            {'id': 1005, 'content': 'new', 'project_id': 1},
+        ]})
+        assert item['content'] == 'changed'
+        assert 1002 not in api.item_store
+        assert api.item_store.get(1001)['content'] == 'stored change'
+        assert 1003 not in api.item_store
+        assert api.item_store.get(1005)['content'] == 'new'
+
+    def test_reset_state(self):
+        api = build_api()
+        api.reset_state()
+        assert len(api.item_store) == 0
+
+    def test_all(self):
+        api = build_api()
+        assert len(api.items.all()) == 5
+        assert len(api.item_store) == 0
+
+    def test_iter_item_data(self):
+        api = build_api()
+        api.items.get_by_id(1003, only_local=True)
+        assert sorted(data['id'] for data in iter_item_data(api)) == [
+            1001, 1002, 1003, 1004, 2002
+        ]
+
+
+class Test_run_query:
+    def test_stays_in_store(self):
+        api = build_api()
+        api.items.get_by_id(2002, only_local=True)
+        relative_to = datetime.datetime(2016, 1, 1)
+        resp = run_query(api, ['today', 'overdue'], relative_to=relative_to)
+        assert sorted(data['id'] for data in resp[0]['data']) == [1002, 2002]
+        assert [data['id'] for data in resp[1]['data']] == [1001]
+        assert [item['id'] for item in api.state['items']] == [2002]
+
+    def test_get_materializes(self):
+        api = build_api()
+        items = get_due_index(api).get(FRIDAY)
+        assert sorted(item['id'] for item in items) == [1002, 2002]
+        item = items[0]
+        item.update(priority=1)
+        assert api.queue[0]['args']['priority'] == 1
+
+
+class TestSyncCache:
+    def test_round_trip(self, tmpdir):
+        api = build_api()
+        api.items.get_by_id(1002, only_local=True).data['content'] = 'changed'
+        cache = SyncCache(str(tmpdir), 'token')
+        cache.save(api)
+
+        with open(cache.path) as fp:
+            data = json.load(fp)
+        assert sorted(item['id'] for item in data['state']['items']) == [
+            1001, 1002, 1003, 1004, 2002
+        ]
+
+        new_api = StoreAPI('token', cache=None)
+        assert cache.load(new_api)
+        assert new_api.state['items'] == []
+        assert len(new_api.item_store) == 5
+        assert new_api.item_store.get(1002)['content'] == 'changed'
+        assert new_api.item_store.get(1002)['labels'] == [1, 2]
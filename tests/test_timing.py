@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from francis import timing
+
+
+class FakeRequest:
+    body = b'token=abc'
+
+
+class FakeResponse:
+    request = FakeRequest()
+    content = b'{"items": []}'
+    headers = {}
+
+
+class FakeSession:
+    def __init__(self):
+        self.hooks = {'response': []}
+
+    def get(self):
+        for hook in self.hooks['response']:
+            hook(FakeResponse())
+
+
+class TestProfiler:
+    def teardown_method(self):
+        timing.stop()
+
+    def test_phases_add_up(self):
+        profiler = timing.start()
+        with timing.phase('sync'):
+            pass
+        with timing.phase('render'):
+            pass
+        with timing.phase('sync'):
+            pass
+
+        data = profiler.to_dict()
+        assert [phase['name'] for phase in data['phases']] == ['sync', 'render']
+        assert data['phases'][0]['count'] == 2
+
+    def test_off(self):
+        # Nothing to time against, but phases still work
+        with timing.phase('sync'):
+            pass
+        assert timing.stop() is None
+
+    def test_http_counts(self):
+        session = FakeSession()
+        timing.watch_session(session)
+        timing.watch_session(session)
+        assert len(session.hooks['response']) == 1
+
+        # Not profiling, so nothing gets counted
+        session.get()
+
+        profiler = timing.start()
+        session.get()
+        session.get()
+        assert profiler.requests == 2
+        assert profiler.bytes_sent == 18
+        assert profiler.bytes_received == 26
+
+    def test_compressed_response(self):
+        resp = FakeResponse()
+        resp.headers = {'Content-Length': '10', 'Content-Encoding': 'gzip'}
+        profiler = timing.start()
+        profiler.count_response(resp)
+        # What went over the wire, not the decompressed content
+        assert profiler.bytes_received == 10
+
+
+class Test_parse_trace_setting:
+    @pytest.mark.parametrize('value, expected', [
+        (None, None),
+        ('', None),
+        ('0', None),
+        ('1', 'text'),
+        ('JSON', 'json'),
+        ('/tmp/trace.jsonl', '/tmp/trace.jsonl'),
+    ])
+    def test_values(self, value, expected):
+        assert timing.parse_trace_setting(value) == expected
+
+
+class Test_report:
+    def test_file(self, tmpdir):
+        profiler = timing.Profiler()
+        profiler.add('sync', 0.5)
+        path = str(tmpdir.join('trace.jsonl'))
+        timing.report(profiler, path)
+        timing.report(profiler, path)
+
+        lines = open(path).read().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[0])['phases'] == [{'name': 'sync', 'seconds': 0.5, 'count': 1}]
+
+    def test_text(self, capsys):
+        profiler = timing.Profiler()
+        profiler.add('render', 0.25)
+        timing.report(profiler, 'text')
+        err = capsys.readouterr().err
+        assert 'render' in err
+        assert '250.0ms' in err
+        assert 'http: 0 request(s)' in err
@@ -1,9 +1,16 @@
 import datetime
+import time
 
 import pytest
 
+from francis import util
 from francis.util import (
+    add_months,
+    get_profile,
+    get_profiles,
+    parse_api_datetime,
     parse_date,
+    parse_query_date,
     parse_rc,
     prettytable,
 )
@@ -27,6 +34,57 @@ class Test_parse_rc:
         assert parse_rc('# foo=bar') == {}
         assert parse_rc('  # foo=bar') == {}
 
+    def test_profiles(self):
+        cfg = parse_rc(
+            'AUTH_TOKEN=abc\n'
+            '[work]\n'
+            'AUTH_TOKEN=def\n'
+            'CACHE_DIR=/tmp/work\n'
+            '[ home ]\n'
+            'MAX_STALENESS=60\n'
+        )
+        assert cfg['auth_token'] == 'abc'
+        assert list(cfg['profiles']) == ['work', 'home']
+        assert cfg['profiles']['work'] == {'auth_token': 'def', 'cache_dir': '/tmp/work'}
+
+
+class Test_get_profile:
+    cfg = {
+        'auth_token': 'abc',
+        'max_staleness': '30',
+        'profiles': {'work': {'auth_token': 'def'}},
+    }
+
+    def test_default(self):
+        assert get_profile(self.cfg) == {'auth_token': 'abc', 'max_staleness': '30'}
+        assert get_profile(self.cfg, 'default') == get_profile(self.cfg)
+
+    def test_named_profiles_inherit(self):
+        assert get_profile(self.cfg, 'work') == {'auth_token': 'def', 'max_staleness': '30'}
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            get_profile(self.cfg, 'play')
+
+
+class Test_get_profiles:
+    def test_profiles(self):
+        cfg = parse_rc(
+            'AUTH_TOKEN=abc\n'
+            '[work]\n'
+            'AUTH_TOKEN=def\n'
+            '[slow]\n'
+            '# Same account as the default with other settings\n'
+            'READ_TIMEOUT=60\n'
+        )
+        profiles = get_profiles(cfg)
+        assert list(profiles) == ['default', 'work']
+        assert profiles['work']['auth_token'] == 'def'
+
+    def test_no_default(self):
+        cfg = parse_rc('[work]\nAUTH_TOKEN=def\n')
+        assert list(get_profiles(cfg)) == ['work']
+
 
 class Test_prettytable:
     def test_empty(self):
@@ -70,7 +128,56 @@ class Test_prettytable:
             '---  ---------------------------------------------'
         )
 
-    # FIXME: test multiple > 40 columns
+    def test_multiple_wide_columns(self):
+        # The leftmost wide column gets shrunk to 40 before the next one
+        table = prettytable(100, [
+            ('a' * 50, 'b' * 50),
+        ])
+        header, dashes = table.splitlines()
+        assert header == ('a' * 43) + '*' + '    ' + ('b' * 50)
+        assert dashes == ('-' * 46) + '  ' + ('-' * 52)
+
+    def test_right_aligns_numbers(self):
+        assert (
+            prettytable(100, [('id', 'text'), (1, 'a'), (100, 'b')]) ==
+            (
+                '  id  text\n'
+                '----  ------\n'
+                '   1  a\n'
+                ' 100  b'
+            )
+        )
+
+    def test_pads_short_rows(self):
+        assert (
+            prettytable(100, [('a', 'b', 'c'), ('x',)]) ==
+            (
+                'a    b    c\n'
+                '---  ---  ---\n'
+                'x'
+            )
+        )
+
+    def test_expands_content(self):
+        table = prettytable(40, [('id', 'content', 'proj'), (1, 'a', 'Work')])
+        header, dashes, row = table.splitlines()
+        assert len(dashes) == 38
+        assert row.startswith('   1  a')
+        assert row.endswith('Work')
+
+    def test_large_table_speed(self):
+        rows = [('id', 'pri', 'content', 'proj', 'due date')]
+        for i in range(10000):
+            rows.append((i, 'H', 'task number %d ' % i * 5, 'Work', 'Jan 1'))
+
+        start = time.time()
+        table = prettytable(120, rows)
+        elapsed = time.time() - start
+
+        assert len(table.splitlines()) == 10002
+        # This renders in tens of milliseconds; the budget leaves lots of
+        # room for slow machines.
+        assert elapsed < 1.0
 
 
 class Test_parse_date:
@@ -106,6 +213,161 @@ class Test_parse_date:
         start = datetime.datetime(2016, 1, 1, 0, 0, 0)
         assert parse_date(text, relative_to=start).strftime('%Y-%m-%d') == expected
 
+    @pytest.mark.parametrize('text,expected', [
+        ('july 22', '2016-07-22'),
+        ('Jul 22', '2016-07-22'),
+        ('22 july', '2016-07-22'),
+        ('7/22', '2016-07-22'),
+        ('7/22/2017', '2017-07-22'),
+        ('July 22, 2017', '2017-07-22'),
+    ])
+    def test_explicit_dates(self, text, expected):
+        start = datetime.datetime(2016, 1, 1, 0, 0, 0)
+        assert parse_date(text, relative_to=start).strftime('%Y-%m-%d') == expected
+
+    def test_other_formats(self):
+        assert parse_date('2016-05-05T10:30') == datetime.datetime(2016, 5, 5, 10, 30)
+        assert parse_date('20160505') == datetime.datetime(2016, 5, 5)
+
     def test_value_error(self):
         with pytest.raises(ValueError):
             parse_date('2016-06-40')
+        with pytest.raises(ValueError):
+            parse_date('P1D')
+        with pytest.raises(ValueError):
+            parse_date('feb 30')
+        with pytest.raises(ValueError):
+            parse_date('+3 fortnights')
+
+    @pytest.mark.parametrize('text,expected', [
+        ('yesterday', '2015-12-31'),
+        ('later', '9999-12-30'),
+        ('som', '2016-02-01'),
+        ('socm', '2016-01-01'),
+        ('eom', '2016-01-31'),
+        ('sow', '2016-01-03'),
+        ('socw', '2015-12-27'),
+        ('eow', '2016-01-02'),
+        ('soww', '2016-01-04'),
+        ('eoww', '2016-01-01'),
+        ('soq', '2016-04-01'),
+        ('eoq', '2016-03-31'),
+        ('soy', '2017-01-01'),
+        ('eoy', '2016-12-31'),
+        ('january', '2016-01-01'),
+        ('mar', '2016-03-01'),
+        ('1st', '2016-01-01'),
+        ('22nd', '2016-01-22'),
+        ('easter', '2016-03-27'),
+        ('goodfriday', '2016-03-25'),
+    ])
+    def test_taskwarrior_names(self, text, expected):
+        # January 1st, 2016 was a Friday
+        start = datetime.datetime(2016, 1, 1, 0, 0, 0)
+        assert parse_date(text, relative_to=start).strftime('%Y-%m-%d') == expected
+
+    @pytest.mark.parametrize('text,expected', [
+        ('+3d', '2016-01-04'),
+        ('3d', '2016-01-04'),
+        ('3 days', '2016-01-04'),
+        ('-2w', '2015-12-18'),
+        ('+1mo', '2016-02-01'),
+        ('1q', '2016-04-01'),
+        ('+1y', '2017-01-01'),
+        ('eom+1d', '2016-02-01'),
+        ('eom - 1mo', '2015-12-31'),
+        ('friday-1w', '2015-12-25'),
+        ('Today+2D', '2016-01-03'),
+    ])
+    def test_offsets(self, text, expected):
+        start = datetime.datetime(2016, 1, 1, 0, 0, 0)
+        assert parse_date(text, relative_to=start).strftime('%Y-%m-%d') == expected
+
+    def test_keeps_time_of_day(self):
+        start = datetime.datetime(2016, 1, 1, 10, 30)
+        assert parse_date('+1d', relative_to=start) == datetime.datetime(2016, 1, 2, 10, 30)
+
+    def test_day_of_month_skips_short_months(self):
+        start = datetime.datetime(2016, 2, 1)
+        assert parse_date('30th', relative_to=start).strftime('%Y-%m-%d') == '2016-03-30'
+
+    def test_memoized(self, monkeypatch):
+        calls = []
+        real_parse = util._parse_date
+
+        def counting_parse(text, relative_to):
+            calls.append(text)
+            return real_parse(text, relative_to)
+
+        monkeypatch.setattr(util, '_parse_cache', {})
+        monkeypatch.setattr(util, '_parse_date', counting_parse)
+        start = datetime.datetime(2016, 1, 1)
+        for i in range(3):
+            assert parse_date('eom', relative_to=start) == datetime.datetime(2016, 1, 31)
+            with pytest.raises(ValueError):
+                parse_date('every day', relative_to=start)
+        assert calls == ['eom', 'every day']
+
+        # A different reference day is a different result
+        assert parse_date('eom', relative_to=datetime.datetime(2016, 2, 1)).day == 29
+
+
+class Test_parse_query_date:
+    @pytest.mark.parametrize('text,expected', [
+        ('today', '2016-01-01'),
+        ('Tod', '2016-01-01'),
+        ('tom', '2016-01-02'),
+        ('mon', '2016-01-04'),
+        ('monday', '2016-01-04'),
+        ('eom', '2016-01-31'),
+        ('+3d', '2016-01-04'),
+        ('eom-1w', '2016-01-24'),
+        ('2016-07-22', '2016-07-22'),
+        ('july 22', '2016-07-22'),
+        ('jan 1 2017', '2017-01-01'),
+        ('2nd', '2016-01-02'),
+    ])
+    def test_dates(self, text, expected):
+        start = datetime.datetime(2016, 1, 1, 10, 30)
+        assert parse_query_date(text, relative_to=start).strftime('%Y-%m-%d') == expected
+
+    @pytest.mark.parametrize('text', [
+        'today | overdue',
+        'tod & p1',
+        'tomorrow 5pm',
+        'todo',
+        'mo',
+        # Todoist means the next 7 days
+        '7 days',
+        '3d',
+        '+3 days',
+        'every monday',
+        '2016-01-01T10:30',
+        'feb 30',
+        '+99999999y',
+    ])
+    def test_not_a_date_query(self, text):
+        start = datetime.datetime(2016, 1, 1, 10, 30)
+        with pytest.raises(ValueError):
+            parse_query_date(text, relative_to=start)
+
+
+class Test_add_months:
+    def test_clamps(self):
+        assert add_months(datetime.date(2016, 1, 31), 1) == datetime.date(2016, 2, 29)
+        assert add_months(datetime.date(2016, 3, 31), -13) == datetime.date(2015, 2, 28)
+        assert add_months(datetime.date(2016, 11, 15), 2) == datetime.date(2017, 1, 15)
+
+
+class Test_parse_api_datetime:
+    @pytest.mark.parametrize('text', [
+        '2016-01-05T18:09:24Z',
+        '2016-01-05T18:09:24.000000Z',
+        'Tue 05 Jan 2016 18:09:24 +0000',
+    ])
+    def test_formats(self, text):
+        assert parse_api_datetime(text) == datetime.datetime(2016, 1, 5, 18, 9, 24)
+
+    def test_value_error(self):
+        with pytest.raises(ValueError):
+            parse_api_datetime('yesterday')
@@ -0,0 +1,119 @@
+import pytest
+
+from francis.writequeue import (
+    WriteQueue,
+    build_batches,
+    flush,
+)
+
+
+def entry(num_commands):
+    return {
+        'commands': [{'type': 'item_update', 'uuid': str(i)} for i in range(num_commands)],
+        'actions': [],
+    }
+
+
+class TestWriteQueue:
+    def test_append_and_read(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        assert write_queue.read() == []
+
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+        write_queue.append([{'type': 'item_complete', 'uuid': 'b'}])
+        entries = write_queue.read()
+        assert [entry['commands'][0]['uuid'] for entry in entries] == ['a', 'b']
+
+        write_queue.clear()
+        assert write_queue.read() == []
+
+    def test_skips_partial_writes(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+        with open(write_queue.path, 'a') as fp:
+            fp.write('{"commands": [{"ty')
+
+        assert len(write_queue.read()) == 1
+
+    def test_replace(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+        write_queue.replace([entry(2)])
+        assert len(write_queue.read()[0]['commands']) == 2
+
+    def test_replace_keeps_appended(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+        entries, offset = write_queue.read_with_offset()
+        assert len(entries) == 1
+
+        write_queue.append([{'type': 'item_add', 'uuid': 'b'}])
+        write_queue.replace([entry(2)], offset)
+        entries = write_queue.read()
+        assert len(entries[0]['commands']) == 2
+        assert entries[1]['commands'] == [{'type': 'item_add', 'uuid': 'b'}]
+
+        write_queue.replace([], write_queue.read_with_offset()[1])
+        assert write_queue.read() == []
+
+
+class FakeAPI:
+    """Stands in for a TodoistAPI; on_commit runs during each commit"""
+    def __init__(self, on_commit=None):
+        self.queue = []
+        self.committed = []
+        self.on_commit = on_commit
+
+    def commit(self, raise_on_error=True):
+        if self.on_commit is not None:
+            self.on_commit()
+        self.committed.append([cmd['uuid'] for cmd in self.queue])
+        del self.queue[:]
+        return {}
+
+
+class Test_flush:
+    def test_flush(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+        write_queue.append([{'type': 'item_add', 'uuid': 'b'}])
+
+        api = FakeAPI()
+        sent, conflicts, errors = flush(api, write_queue)
+        assert len(sent) == 2
+        assert api.committed == [['a', 'b']]
+        assert write_queue.read() == []
+
+    def test_keeps_entries_appended_during_flush(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+
+        # Another francis command queues a change while this one sends
+        def append():
+            write_queue.append([{'type': 'item_add', 'uuid': 'b'}])
+        api = FakeAPI(on_commit=append)
+        flush(api, write_queue)
+        assert api.committed == [['a']]
+        assert [entry['commands'][0]['uuid'] for entry in write_queue.read()] == ['b']
+
+    def test_failed_batch_is_kept(self, tmpdir):
+        write_queue = WriteQueue(str(tmpdir), 'token')
+        write_queue.append([{'type': 'item_add', 'uuid': 'a'}])
+
+        def fail():
+            write_queue.append([{'type': 'item_add', 'uuid': 'b'}])
+            raise IOError('down')
+        with pytest.raises(IOError):
+            flush(FakeAPI(on_commit=fail), write_queue)
+        assert [entry['commands'][0]['uuid'] for entry in write_queue.read()] == ['a', 'b']
+
+
+class Test_build_batches:
+    def test_batches(self):
+        entries = [entry(40), entry(40), entry(40), entry(5)]
+        batches = build_batches(entries, batch_size=100)
+        assert [len(batch) for batch in batches] == [2, 2]
+
+    def test_big_entry_isnt_split(self):
+        batches = build_batches([entry(150), entry(1)], batch_size=100)
+        assert [len(batch) for batch in batches] == [1, 1]